@@ -114,6 +114,28 @@ FILTER_OPERATORS = {
     "CONTAINS": "包含",
 }
 
+# ============== 文件格式 ==============
+# CSV/TSV/Parquet 没有Sheet，以文件名作为唯一的Sheet名称
+SUPPORTED_EXCEL_FORMATS = [".xlsx", ".xls", ".xlsm", ".csv", ".tsv", ".parquet"]
+FILE_FILTER = ("数据文件 (*.xlsx *.xls *.xlsm *.csv *.tsv *.parquet);;"
+               "Excel文件 (*.xlsx *.xls *.xlsm);;CSV/TSV文件 (*.csv *.tsv);;Parquet文件 (*.parquet)")
+
+# ============== 数据加载 ==============
+# Excel读取后端: "auto"/"fast" = 流式xlsx读取器（失败自动回退openpyxl）
+#               "openpyxl" = 始终使用 pandas + openpyxl
+# .xls 文件始终使用 xlrd
+EXCEL_READER = "auto"
+SHEET_CACHE_ENABLED = True      # 启用Sheet列式缓存（需要pyarrow）
+SHEET_CACHE_MAX_MB = 1024       # 缓存总大小上限，超出按LRU淘汰
+WORKBOOK_HANDLE_CACHE_SIZE = 4  # 保留在内存中的已打开xlsx工作簿数量（切换Sheet不再读磁盘）
+PARALLEL_LOAD_ENABLED = True    # 同时加载手工表和系统表时在子进程中并行解析
+ARROW_STRING_DTYPE = False      # 文本列使用 string[pyarrow] 类型（需要pyarrow），大表省内存、提速
+STREAM_CHUNK_ROWS = 100000      # 分块流式聚合时每块的行数
+HEADER_ROW = 0                  # 导入时的表头行索引（0开始）；"auto" = 自动检测（扫描前10行，结果随Sheet缓存）
+TABLE_STORE_ENABLED = True      # 子进程加载的表以内存映射的 Arrow 文件传回（会话临时目录，需要pyarrow）
+SOURCE_FILE_COLUMN = "来源文件"   # 多文件合并加载时追加的来源列（文件名）
+SOURCE_SHEET_COLUMN = "来源Sheet" # 多文件合并加载时追加的来源列（Sheet名称）
+
 # ============== 存储路径 ==============
 CONFIG_FILE = "reconciler_config.json"
 TEMPLATES_FILE = "reconciler_templates.json"
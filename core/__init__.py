@@ -1,3 +1,11 @@
 """核心模块"""
+from .clean_plan import CleanRuleError, compile_clean_rules
 from .compare_engine import CompareEngine
 from .export_engine import ExportEngine
+from .filter_plan import FilterPlan
+from .formula import FormulaError, compile_formula
+from .join import outer_join
+from .key_codec import KeyCodec
+from .measures import Measure, measures_from_config
+from .pipeline import ReconcilePipeline, ReconcileResult
+from .pivot import pivot_sum
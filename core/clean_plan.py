@@ -0,0 +1,186 @@
+"""
+清洗计划 - 清洗规则只编译一次，每列只转换一次文本
+
+清洗规则编译为 CleanPlan：正则在编译时检查（无效的正则抛出 CleanRuleError），
+同一列上的连续规则合并为一组，执行时每列只转换一次文本、最后转回一次原类型。
+连续的"删除匹配"正则中，逐字符删除的正则（字符集、单个字符，如 [\\u4e00-\\u9fa5]+、
+[^\\d]+、\\-）合并为一个正则，一次替换完成；带锚点或多字符的正则（如 ^\\s+|\\s+$、[a-z]+$）
+仍按顺序单独执行，结果与逐个正则执行相同。
+正则只在列的不同取值上执行，再按行编号展开到各行（见 filter_plan.text_codes）。
+
+编译结果按规则内容缓存，预览刷新时不重复编译。
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .filter_plan import text_codes
+
+CLEAN_MODES = ("删除匹配", "保留匹配", "替换为")
+
+# 只匹配单个字符的正则节点
+_SINGLE_CHAR_OPS = (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.IN, sre_parse.ANY)
+
+
+class CleanRuleError(ValueError):
+    """清洗规则无法编译"""
+
+
+class CleanStep(NamedTuple):
+    """一次正则处理"""
+    mode: str
+    pattern: re.Pattern
+    replace: str
+    regexes: Tuple[str, ...]  # 合并前的正则（用于出错提示）
+
+
+class CleanPlan:
+    """
+    已编译的清洗计划
+
+    Example:
+        plan = compile_clean_rules(config["clean_rules"])
+        df = plan.apply(df)
+    """
+
+    def __init__(self, columns: List[Tuple[str, List[CleanStep]]]):
+        self.columns = columns  # [(列名, [CleanStep, ...]), ...]，按规则顺序
+
+    @classmethod
+    def of(cls, rules: Union[None, "CleanPlan", Sequence[Dict]]) -> "CleanPlan":
+        """已编译的计划原样返回，规则列表则编译（使用缓存）"""
+        return rules if isinstance(rules, CleanPlan) else compile_clean_rules(rules)
+
+    def __len__(self) -> int:
+        return sum(len(steps) for _, steps in self.columns)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        执行清洗（表中没有的列跳过），返回新的 DataFrame（输入表不修改，未清洗的列与输入表共用数据）
+
+        每列先按取值分解，正则只处理不同取值，结果按行编号展开。
+        字符串类型列按 Python re 语义执行正则（Arrow 的正则引擎语法不同），完成后转回原类型。
+        """
+        if not self.columns:
+            return df
+        df = df.copy(deep=False)
+        for column, steps in self.columns:
+            if column not in df.columns:
+                continue
+            string_dtype = df[column].dtype if isinstance(df[column].dtype, pd.StringDtype) else None
+            codes, texts = text_codes(df[column])
+            values = pd.Series(texts, dtype=object)
+            for step in steps:
+                try:
+                    result = _apply_step(values, step)
+                    # 每个取值对应一个结果，才能按行编号展开
+                    if getattr(result, "ndim", 0) != 1 or len(result) != len(values):
+                        raise ValueError("清洗结果不是单列")
+                    values = result
+                except Exception as e:
+                    print(f"清洗列 {column} 时出错 (regex={' | '.join(step.regexes)}): {e}")
+            try:
+                values = pd.Series(np.asarray(values, dtype=object)[codes], index=df.index, dtype=object)
+                df[column] = values.astype(string_dtype) if string_dtype is not None else values
+            except Exception as e:
+                print(f"清洗列 {column} 时出错: {e}")
+        return df
+
+
+def _apply_step(values: pd.Series, step: CleanStep) -> pd.Series:
+    if step.mode == "删除匹配":
+        # 删除匹配的内容，保留其他内容
+        return values.str.replace(step.pattern, "", regex=True).str.strip()
+    if step.mode == "保留匹配":
+        # 只保留匹配的内容（取编译时加在外层的分组，即整个匹配；正则自带的分组不影响结果）
+        return values.str.extract(step.pattern, expand=True).iloc[:, 0].fillna("")
+    # 将匹配的内容替换为指定值
+    return values.str.replace(step.pattern, step.replace, regex=True)
+
+
+def compile_clean_rules(rules: Optional[Sequence[Dict]]) -> CleanPlan:
+    """
+    编译清洗规则
+
+    Args:
+        rules: 清洗规则列表，每项包含:
+            - column: 要清洗的列名
+            - mode: "删除匹配" (默认) / "保留匹配" / "替换为"
+            - regexes: 正则表达式列表（新格式，支持多规则）
+            - regex: 单个正则表达式（旧格式，兼容）
+            - replace: 替换值（仅"替换为"模式使用）
+
+    Returns:
+        CleanPlan（相同的规则返回同一个缓存的计划）
+
+    Raises:
+        CleanRuleError: 正则表达式无效
+    """
+    frozen = []
+    for rule in rules or []:
+        # 支持新格式（多正则）和旧格式（单正则）
+        regexes = rule.get("regexes", [])
+        if not regexes and rule.get("regex"):
+            regexes = [rule.get("regex")]
+        frozen.append((
+            rule.get("column", ""), rule.get("mode", "删除匹配"),
+            tuple(regexes), rule.get("replace", ""),
+        ))
+    return _compile(tuple(frozen))
+
+
+@lru_cache(maxsize=64)
+def _compile(rules: Tuple[Tuple[str, str, Tuple[str, ...], str], ...]) -> CleanPlan:
+    columns: List[Tuple[str, List[CleanStep]]] = []
+    for column, mode, regexes, replace_val in rules:
+        regexes = [regex for regex in regexes if regex]
+        if not column or not regexes or mode not in CLEAN_MODES:
+            continue
+        if not columns or columns[-1][0] != column:
+            columns.append((column, []))
+        steps = columns[-1][1]
+        for regex in regexes:
+            source = f"({regex})" if mode == "保留匹配" else regex
+            try:
+                pattern = re.compile(source)
+            except re.error as e:
+                raise CleanRuleError(f"列 {column} 的清洗正则无效: {regex} ({e})") from None
+            step = CleanStep(mode, pattern, replace_val, (regex,))
+            if steps and _can_fuse(steps[-1]) and _can_fuse(step):
+                steps[-1] = _fuse(steps[-1], step)
+            else:
+                steps.append(step)
+    return CleanPlan(columns)
+
+
+def _can_fuse(step: CleanStep) -> bool:
+    """删除匹配且每次只匹配一个字符（可带 + * 重复）的正则：逐字符删除，与其他删除的顺序无关"""
+    if step.mode != "删除匹配" or step.pattern.flags != re.UNICODE:
+        return False
+    for regex in step.regexes:
+        nodes = list(sre_parse.parse(regex))
+        if len(nodes) != 1:
+            return False
+        op, arg = nodes[0]
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            low, high, sub = arg
+            if low > 1 or high != sre_parse.MAXREPEAT or len(sub) != 1:
+                return False
+            op = sub[0][0]
+        if op not in _SINGLE_CHAR_OPS:
+            return False
+    return True
+
+
+def _fuse(first: CleanStep, second: CleanStep) -> CleanStep:
+    regexes = first.regexes + second.regexes
+    pattern = re.compile("|".join(f"(?:{regex})" for regex in regexes))
+    return CleanStep("删除匹配", pattern, "", regexes)
@@ -1,10 +1,17 @@
 """
 比对引擎 - 核心数据比对逻辑
 """
+import numpy as np
 import pandas as pd
-import re
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, Iterable, List, Tuple, Optional, Any, Union
 from config import COMPARE_STATUS
+from .clean_plan import CleanPlan
+from .filter_plan import NUMERIC_OPERATORS, Filters, FilterPlan, as_text, text_codes
+from .formula import CompiledFormula, compile_formula
+from .join import outer_join
+from .key_codec import KeyCodec
+from .measures import Measure, label_measures
+from .pivot import pivot_sum
 
 
 class CompareEngine:
@@ -27,61 +34,28 @@ class CompareEngine:
         return CompareEngine.OPERATOR_MAP.get(operator, operator)
 
     @staticmethod
-    def clean_column(df: pd.DataFrame, clean_rules: List[Dict]) -> pd.DataFrame:
+    def _as_text(series: pd.Series) -> pd.Series:
+        """列转为文本，用于主键、筛选和透视（见 filter_plan.as_text）"""
+        return as_text(series)
+
+    @staticmethod
+    def clean_column(df: pd.DataFrame, clean_rules: Union[List[Dict], CleanPlan]) -> pd.DataFrame:
         """
         清洗列数据
         
         Args:
             df: DataFrame
-            clean_rules: 清洗规则列表，每项包含:
-                - column: 要清洗的列名
-                - mode: "删除匹配" (默认)
-                - regexes: 正则表达式列表（新格式，支持多规则）
-                - regex: 单个正则表达式（旧格式，兼容）
-                - replace: 替换值（仅"替换为"模式使用）
+            clean_rules: 清洗规则列表（格式见 clean_plan.compile_clean_rules）或已编译的 CleanPlan
                 
         Returns:
             清洗后的 DataFrame
+            
+        Raises:
+            CleanRuleError: 正则表达式无效
         """
         if not clean_rules:
             return df
-            
-        df = df.copy()
-        
-        for rule in clean_rules:
-            column = rule.get("column", "")
-            mode = rule.get("mode", "删除匹配")
-            
-            # 支持新格式（多正则）和旧格式（单正则）
-            regexes = rule.get("regexes", [])
-            if not regexes and rule.get("regex"):
-                regexes = [rule.get("regex")]
-            
-            replace_val = rule.get("replace", "")
-            
-            if not column or column not in df.columns or not regexes:
-                continue
-            
-            # 按顺序应用每个正则表达式
-            for regex in regexes:
-                if not regex:
-                    continue
-                try:
-                    if mode == "删除匹配":
-                        # 删除匹配的内容，保留其他内容
-                        df[column] = df[column].astype(str).str.replace(regex, "", regex=True).str.strip()
-                    elif mode == "保留匹配":
-                        # 只保留匹配的内容
-                        df[column] = df[column].astype(str).str.extract(f"({regex})", expand=False).fillna("")
-                    elif mode == "替换为":
-                        # 将匹配的内容替换为指定值
-                        df[column] = df[column].astype(str).str.replace(regex, replace_val, regex=True)
-                except Exception as e:
-                    print(f"清洗列 {column} 时出错 (regex={regex}): {e}")
-                
-        return df
-                
-        return df
+        return CleanPlan.of(clean_rules).apply(df)
 
     @staticmethod
     def aggregate_manual_with_pivot(
@@ -89,7 +63,8 @@ class CompareEngine:
         key_col: str,
         value_col: str,
         pivot_config: Dict,
-        filters: Optional[List[Tuple[str, str, str]]] = None
+        filters: Filters = None,
+        extra_cols: Optional[List[str]] = None
     ) -> Tuple[pd.DataFrame, List[str], List[str]]:
         """
         手工表透视聚合（区分出库/入库）
@@ -102,11 +77,12 @@ class CompareEngine:
                 - pivot_column: 透视列名
                 - out_values: 出库值列表（如["发货", "退货"]）
                 - in_values: 入库值列表（如["退仓"]）
-            filters: 筛选条件列表
+            filters: 筛选条件（FilterPlan 或 [(column, operator, value), ...]）
+            extra_cols: 其他数值列（附加指标），按主键求 Σ出库 - Σ入库
             
         Returns:
             (聚合后的 DataFrame, 出库列名列表, 入库列名列表)
-            DataFrame 包含: key_col, 各透视列, 手工数量(=出库-入库)
+            DataFrame 包含: key_col, 各透视列, extra_cols, 手工数量(=出库-入库)
         """
         if not pivot_config:
             return df, [], []
@@ -117,62 +93,41 @@ class CompareEngine:
         
         if not pivot_column or pivot_column not in df.columns:
             return df, [], []
-            
-        df = df.copy()
-        
-        # 应用筛选条件
-        if filters:
-            for col, op, val in filters:
-                if col not in df.columns:
-                    continue
-                col_data = df[col].astype(str)
-                if op == "EQUALS":
-                    df = df[col_data == val]
-                elif op == "NOT_EQUALS":
-                    df = df[col_data != val]
-                elif op == "CONTAINS":
-                    if isinstance(val, str):
-                        values = [v.strip() for v in val.replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-                    else:
-                        values = [str(val)]
-                    if values:
-                        mask = col_data.str.contains(values[0], na=False, regex=False)
-                        for v in values[1:]:
-                            mask = mask | col_data.str.contains(v, na=False, regex=False)
-                        df = df[mask]
-                elif op == "IN_LIST":
-                    if isinstance(val, str):
-                        values = [v.strip() for v in val.replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-                    else:
-                        values = [str(val)]
-                    df = df[col_data.isin(values)]
+        
+        if value_col not in df.columns:
+            return FilterPlan.of(filters).apply(df), [], []
+        
+        # 应用筛选条件（有出入库值时只取透视用到的列）
+        all_pivot_values = out_values + in_values
+        extra_cols = [c for c in dict.fromkeys(extra_cols or [])
+                      if c in df.columns and c not in (key_col, pivot_column, value_col, "手工数量")
+                      and c not in all_pivot_values]
+        columns = [key_col, pivot_column, value_col, *extra_cols] if all_pivot_values else list(df.columns)
+        df = CompareEngine._filter_columns(df, filters, columns)
         
         # 转换数值列
-        if value_col in df.columns:
-            df[value_col] = pd.to_numeric(df[value_col], errors='coerce').fillna(0)
-        else:
-            return df, [], []
+        for col in [value_col, *extra_cols]:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
         
         # 获取所有透视值（出库+入库）
-        all_pivot_values = out_values + in_values
         if not all_pivot_values:
             # 没有指定出入库，按普通透视处理
             return df, [], []
         
         # 筛选只包含指定透视值的行
-        df = df[df[pivot_column].astype(str).isin(all_pivot_values)]
+        df = df[CompareEngine._as_text(df[pivot_column]).isin(all_pivot_values)]
         
         if df.empty:
             return df, out_values, in_values
         
+        # 附加数值列按出入库取正负号（出库为正、入库为负），求和即 Σ出库 - Σ入库
+        if extra_cols:
+            pivot_text = CompareEngine._as_text(df[pivot_column])
+            sign = pivot_text.isin(out_values).to_numpy(dtype=np.int64) - pivot_text.isin(in_values).to_numpy(dtype=np.int64)
+            df = df.assign(**{col: df[col] * sign for col in extra_cols})
+        
         # 透视操作
-        pivot_df = df.pivot_table(
-            index=key_col,
-            columns=pivot_column,
-            values=value_col,
-            aggfunc='sum',
-            fill_value=0
-        ).reset_index()
+        pivot_df = pivot_sum(df, key_col, pivot_column, value_col, extra_cols)
         
         # 确保所有指定的透视列都存在
         for pv in all_pivot_values:
@@ -187,7 +142,8 @@ class CompareEngine:
         return pivot_df, out_values, in_values
 
     @staticmethod
-    def make_key(df: pd.DataFrame, key_cols: List[str], keyname: str = "__KEY__") -> pd.DataFrame:
+    def make_key(df: pd.DataFrame, key_cols: List[str], keyname: str = "__KEY__",
+                 key_codec: Optional[KeyCodec] = None) -> pd.DataFrame:
         """
         生成复合主键
         
@@ -195,31 +151,66 @@ class CompareEngine:
             df: DataFrame
             key_cols: 主键列名列表
             keyname: 生成的 Key 列名
+            key_codec: 主键编码器（两个表共用），指定时 Key 列为 int64 编号，
+                文本由 key_codec.decode 还原；None 时为 " | " 连接的文本
             
         Returns:
-            添加了主键列的 DataFrame
+            添加了主键列的 DataFrame（输入表不修改；其他列与输入表共用数据）
         """
-        df = df.copy()
-        key_parts = []
-        for col in key_cols:
-            if col in df.columns:
-                key_parts.append(df[col].astype(str).str.strip().fillna(""))
-            else:
-                key_parts.append(pd.Series([""] * len(df)))
+        df = df.copy(deep=False)
+        string_dtypes = [df[col].dtype for col in key_cols
+                         if col in df.columns and isinstance(df[col].dtype, pd.StringDtype)]
+        if key_codec is None and string_dtypes:
+            # 字符串类型列由 Arrow 逐行计算，不创建Python对象（比先分解更快），主键列保持 Arrow 存储
+            key_parts = []
+            for col in key_cols:
+                if col in df.columns:
+                    key_parts.append(CompareEngine._as_text(df[col]).str.strip().fillna("").astype(string_dtypes[0]))
+                else:
+                    key_parts.append(pd.Series([""] * len(df), index=df.index, dtype=string_dtypes[0]))
+            df[keyname] = key_parts[0]
+            for part in key_parts[1:]:
+                df[keyname] = df[keyname] + " | " + part
+            return df
+        
+        parts = [CompareEngine._key_part_codes(df[col] if col in df.columns else None, len(df))
+                 for col in key_cols]
+        if key_codec is not None:
+            df[keyname] = key_codec.encode(parts)
+            return df
         
-        df[keyname] = key_parts[0]
-        for part in key_parts[1:]:
-            df[keyname] = df[keyname] + " | " + part
+        # 各列只处理了不同取值；逐列组合行编号，只为不同的组合拼接文本，再按行编号展开
+        codes, texts = parts[0]
+        for part_codes, part_texts in parts[1:]:
+            pairs = codes.astype(np.int64) * len(part_texts) + part_codes
+            codes, unique_pairs = pd.factorize(pairs)
+            left = texts[unique_pairs // len(part_texts)]
+            right = part_texts[unique_pairs % len(part_texts)]
+            texts = np.empty(len(unique_pairs), dtype=object)
+            texts[:] = [a + " | " + b for a, b in zip(left, right)]
+        df[keyname] = pd.Series(texts[codes], index=df.index, dtype=object)
         
         return df
 
+    @staticmethod
+    def _key_part_codes(series: Optional[pd.Series], length: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        主键列分解为 (行编号, 文本)，文本同 make_key 的文本主键
+        
+        只对不同取值转文本（见 filter_plan.text_codes）。
+        """
+        if series is None:
+            return np.zeros(length, dtype=np.int64), np.array([""], dtype=object)
+        codes, texts = text_codes(series)
+        return codes, np.asarray(pd.Series(texts, dtype=object).str.strip().fillna(""), dtype=object)
+
     @staticmethod
     def aggregate_data(
         df: pd.DataFrame,
         key_col: str,
         value_cols: List[str],
         pivot_col: Optional[str] = None,
-        filters: Optional[List[Tuple[str, str, str]]] = None
+        filters: Filters = None
     ) -> Tuple[pd.DataFrame, List[str]]:
         """
         聚合数据，支持透视
@@ -227,72 +218,14 @@ class CompareEngine:
         Args:
             df: DataFrame
             key_col: 主键列名
-            value_cols: 数值列名列表
+            value_cols: 数值列名列表；透视时第一列参与透视，其余列按主键求和（附加指标，不计入系统总计）
             pivot_col: 透视列名 (可选)
-            filters: 筛选条件列表 [(column, operator, value), ...]
+            filters: 筛选条件（FilterPlan 或 [(column, operator, value), ...]）
             
         Returns:
             (聚合后的 DataFrame, 透视值列表)
         """
-        df = df.copy()
-        
-        # 应用筛选条件
-        if filters:
-            for col, op, val in filters:
-                if col not in df.columns:
-                    continue
-                col_data = df[col].astype(str)
-                if op == "EQUALS":
-                    df = df[col_data == val]
-                elif op == "NOT_EQUALS":
-                    df = df[col_data != val]
-                elif op == "CONTAINS":
-                    # 支持多值筛选（逗号或分号分隔，满足任一即可）
-                    if isinstance(val, str):
-                        values = [v.strip() for v in val.replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-                    else:
-                        values = [str(val)]
-                    if values:
-                        mask = col_data.str.contains(values[0], na=False, regex=False)
-                        for v in values[1:]:
-                            mask = mask | col_data.str.contains(v, na=False, regex=False)
-                        df = df[mask]
-                elif op == "NOT_CONTAINS":
-                    # 支持多值筛选（不包含任何一个值）
-                    if isinstance(val, str):
-                        values = [v.strip() for v in val.replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-                    else:
-                        values = [str(val)]
-                    if values:
-                        mask = ~col_data.str.contains(values[0], na=False, regex=False)
-                        for v in values[1:]:
-                            mask = mask & ~col_data.str.contains(v, na=False, regex=False)
-                        df = df[mask]
-                elif op == "IN_LIST":
-                    # 支持多值筛选（逗号或分号分隔）
-                    if isinstance(val, str):
-                        # 统一处理中英文逗号和分号
-                        values = [v.strip() for v in val.replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-                    else:
-                        values = [str(val)]
-                    df = df[col_data.isin(values)]
-                elif op == "NOT_IN_LIST":
-                    # 不包含于：不在列表中的记录
-                    if isinstance(val, str):
-                        values = [v.strip() for v in val.replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-                    else:
-                        values = [str(val)]
-                    df = df[~col_data.isin(values)]
-                elif op == "GREATER":
-                    try:
-                        df = df[pd.to_numeric(df[col], errors='coerce') > float(val)]
-                    except:
-                        pass
-                elif op == "LESS":
-                    try:
-                        df = df[pd.to_numeric(df[col], errors='coerce') < float(val)]
-                    except:
-                        pass
+        df = CompareEngine._filter_columns(df, filters, [key_col, *value_cols, pivot_col])
         
         # 转换数值列
         for col in value_cols:
@@ -303,26 +236,28 @@ class CompareEngine:
         
         if pivot_col and pivot_col in df.columns:
             # 获取透视值
-            pivot_values = df[pivot_col].dropna().astype(str).unique().tolist()
+            pivot_values = CompareEngine._as_text(df[pivot_col].dropna()).unique().tolist()
             pivot_values = sorted([v for v in pivot_values if v.strip()])
             
             # 透视操作
             if value_cols:
                 val_col = value_cols[0]
-                pivot_df = df.pivot_table(
-                    index=key_col,
-                    columns=pivot_col,
-                    values=val_col,
-                    aggfunc='sum',
-                    fill_value=0
-                ).reset_index()
+                extra_cols = []
+                for col in dict.fromkeys(value_cols[1:]):
+                    if col == val_col or col not in df.columns:
+                        continue
+                    if col in pivot_values or col in (key_col, "系统总计"):
+                        print(f"[WARN] 数值列 {col} 与透视值或结果列同名，已忽略")
+                        continue
+                    extra_cols.append(col)
+                pivot_df = pivot_sum(df, key_col, pivot_col, val_col, extra_cols)
                 
                 # 重命名透视列（移除MultiIndex）
                 if isinstance(pivot_df.columns, pd.MultiIndex):
                     pivot_df.columns = [f"{c1}_{c2}" if c2 else c1 for c1, c2 in pivot_df.columns]
                 
-                # 透视列就是除了key_col的其他列
-                status_cols = [c for c in pivot_df.columns if c != key_col]
+                # 透视列就是除了key_col和附加数值列的其他列
+                status_cols = [c for c in pivot_df.columns if c != key_col and c not in extra_cols]
                 
                 # 计算总计
                 numeric_cols = [c for c in status_cols if pd.api.types.is_numeric_dtype(pivot_df[c])]
@@ -344,6 +279,169 @@ class CompareEngine:
         result = df[[key_col]].drop_duplicates()
         return result, pivot_values
 
+    @staticmethod
+    def _apply_filters(df: pd.DataFrame, filters: Filters) -> pd.DataFrame:
+        """应用筛选条件（FilterPlan 或 [(column, operator, value), ...]）"""
+        return FilterPlan.of(filters).apply(df)
+
+    @staticmethod
+    def _filter_columns(df: pd.DataFrame, filters: Filters, columns: List[str]) -> pd.DataFrame:
+        """
+        筛选后只取指定的列（表中没有的列跳过）
+        
+        返回新的 DataFrame，可直接替换其中的列；输入表不复制、不修改
+        （copy-on-write 下未修改的列与输入表共用数据）。
+        """
+        columns = [c for c in dict.fromkeys(columns) if c and c in df.columns]
+        plan = FilterPlan.of(filters)
+        mask = plan.mask(df) if plan else None
+        if mask is None or mask.all():
+            return df[columns].copy(deep=False)
+        return df.loc[mask, columns].copy(deep=False)
+
+    @staticmethod
+    def aggregate_stream(
+        chunks: Iterable[pd.DataFrame],
+        key_cols: List[str],
+        value_cols: List[str],
+        pivot_col: Optional[str] = None,
+        filters: Filters = None,
+        key_col: str = "__KEY__",
+        key_codec: Optional[KeyCodec] = None
+    ) -> Tuple[pd.DataFrame, List[str]]:
+        """
+        分块聚合，结果同 make_key + aggregate_data
+        
+        逐块读取 chunks（如 iter_excel_chunks 的输出），每块按主键列、筛选列、
+        透视列的取值分组求和后即丢弃，只保留各组的部分和，内存与分组数成正比，
+        与行数无关。
+        
+        主键、筛选和透视的文本取决于整列类型（如整数列有空值时为 "1.0"）。
+        大于/小于筛选和首块即为文本的列上的筛选在块内执行；其他筛选读完
+        全部块后在部分和上执行，这些筛选列的取值也参与分组。
+        
+        Args:
+            chunks: DataFrame 块
+            key_cols: 主键列名列表
+            value_cols: 数值列名列表
+            pivot_col: 透视列名 (可选)
+            filters: 筛选条件（FilterPlan 或 [(column, operator, value), ...]）
+            key_col: 生成的 Key 列名
+            key_codec: 主键编码器（同 make_key）
+            
+        Returns:
+            (聚合后的 DataFrame, 透视值列表)
+        """
+        plan = FilterPlan.of(filters)
+        group_cols = None
+        sum_cols: List[str] = []
+        early_filters = late_filters = FilterPlan()
+        text_cols: List[str] = []
+        # 数值列的整列类型：任一块为对象列则整列为对象列；否则出现空值/小数即为浮点列
+        object_cols = set()
+        float_cols = set()
+        acc = None
+        
+        for chunk in chunks:
+            if group_cols is None:
+                # 首块即为文本的列，整列必为对象列，文本可逐块确定
+                text_cols = [c for c in chunk.columns
+                             if chunk[c].dtype == object or isinstance(chunk[c].dtype, pd.StringDtype)]
+                early_filters = plan.select(
+                    lambda c: c.operator in NUMERIC_OPERATORS or c.column in text_cols
+                    or c.column not in chunk.columns
+                )
+                late_filters = plan.select(lambda c: c not in early_filters.conditions)
+                wanted = list(key_cols) + late_filters.columns + [pivot_col]
+                group_cols = list(dict.fromkeys(c for c in wanted if c and c in chunk.columns))
+                sum_cols = [c for c in dict.fromkeys(value_cols) if c in chunk.columns]
+            
+            numbers = {}
+            for col in sum_cols:
+                if not pd.api.types.is_numeric_dtype(chunk[col]):
+                    object_cols.add(col)
+                numbers[col] = pd.to_numeric(chunk[col], errors='coerce')
+                if numbers[col].isna().any() or (numbers[col] % 1 != 0).any():
+                    float_cols.add(col)
+            
+            if early_filters:
+                chunk = chunk.copy(deep=False)
+                for col in early_filters.columns:
+                    if col in text_cols and chunk[col].dtype != object \
+                            and not isinstance(chunk[col].dtype, pd.StringDtype):
+                        chunk[col] = CompareEngine._restore_objects(chunk[col])
+                chunk = CompareEngine._apply_filters(chunk, early_filters)
+            
+            frame = pd.DataFrame({col: chunk[col] for col in group_cols}, index=chunk.index)
+            frame["__ROWS__"] = 1
+            for col in sum_cols:
+                values = numbers[col].loc[chunk.index]
+                frame[col] = values.fillna(0)
+                # 对象列转换后的类型取决于筛选后剩余的行
+                frame[f"__FLOAT__{col}"] = values.isna() | (values % 1 != 0)
+            
+            part = CompareEngine._sum_groups(frame, group_cols, sum_cols)
+            acc = part if acc is None else CompareEngine._sum_groups(
+                pd.concat([acc, part], ignore_index=True), group_cols, sum_cols
+            )
+        
+        if acc is None:
+            acc = pd.DataFrame(columns=list(dict.fromkeys([*key_cols, *value_cols, "__ROWS__"])))
+            group_cols, sum_cols = [], []
+        
+        for col in group_cols:
+            acc[col] = CompareEngine._restore_dtype(acc[col])
+        keyed = CompareEngine.make_key(acc, key_cols, key_col, key_codec)
+        keyed = CompareEngine._apply_filters(keyed, late_filters)
+        keyed = keyed[keyed["__ROWS__"] > 0].copy()
+        
+        for col in sum_cols:
+            flags = keyed.pop(f"__FLOAT__{col}")
+            is_float = bool(flags.any()) if col in object_cols else col in float_cols
+            keyed[col] = keyed[col].astype(float if is_float else "int64")
+        keyed = keyed.drop(columns="__ROWS__")
+        
+        return CompareEngine.aggregate_data(keyed, key_col, value_cols, pivot_col)
+
+    @staticmethod
+    def _sum_groups(frame: pd.DataFrame, group_cols: List[str], sum_cols: List[str]) -> pd.DataFrame:
+        """按 group_cols 的原始取值（含空值）分组，数值列求和、浮点标记取或"""
+        agg = {"__ROWS__": "sum"}
+        for col in sum_cols:
+            agg[col] = "sum"
+            agg[f"__FLOAT__{col}"] = "max"
+        if not group_cols:
+            return frame.agg(agg).to_frame().T
+        return frame.groupby(group_cols, dropna=False, sort=False).agg(agg).reset_index()
+
+    @staticmethod
+    def _restore_values(series: pd.Series, missing) -> list:
+        """
+        还原分块推断前的单元格值
+        
+        Excel 中整数值的单元格读取时均为 int，分块推断时因块内空值变成浮点的
+        整数还原为 int，缺失值统一为 missing。
+        """
+        return [
+            int(v) if isinstance(v, float) and v.is_integer()
+            else (missing if pd.isna(v) else v)
+            for v in series.to_numpy(dtype=object)
+        ]
+
+    @staticmethod
+    def _restore_objects(series: pd.Series) -> pd.Series:
+        """按对象列还原（缺失值为 pd.NA，同 clean_dataframe）"""
+        return pd.Series(CompareEngine._restore_values(series, pd.NA), index=series.index, dtype=object)
+
+    @staticmethod
+    def _restore_dtype(series: pd.Series) -> pd.Series:
+        """按全部取值重新推断分组列类型，与整表加载时的列类型一致"""
+        values = CompareEngine._restore_values(series, np.nan)
+        result = pd.Series(values, index=series.index, dtype=object).infer_objects()
+        if result.dtype == object:
+            result = result.where(result.notna(), pd.NA)
+        return result
+
     @staticmethod
     def merge_and_compare(
         manual_df: pd.DataFrame,
@@ -352,7 +450,9 @@ class CompareEngine:
         manual_val_col: str,
         system_val_col: str,
         diff_formula: Optional[str] = None,
-        pivot_values: Optional[List[str]] = None
+        pivot_values: Optional[List[str]] = None,
+        key_codec: Optional[KeyCodec] = None,
+        measures: Optional[List[Measure]] = None
     ) -> pd.DataFrame:
         """
         合并并比对两个表
@@ -365,121 +465,132 @@ class CompareEngine:
             system_val_col: 系统表数值列名
             diff_formula: 差值计算公式 (可选)
             pivot_values: 透视值列表 (用于公式变量)
+            key_codec: 生成主键时使用的编码器；指定时按整数编号合并，
+                结果的主键列还原为文本，行按主键文本排序（同文本主键的合并结果）
+            measures: 附加指标（见 measures_from_config），每个指标添加 手工X、系统X、X差值、X状态 列，
+                并添加综合状态列
             
         Returns:
             比对结果 DataFrame
-        """
-        # 准备干净的数据副本，避免列名冲突
-        manual_clean = manual_df.copy()
-        system_clean = system_df.copy()
-        
-        # 重命名为标准列名
-        if manual_val_col in manual_clean.columns:
-            manual_clean = manual_clean.rename(columns={manual_val_col: "手工数量"})
-        
-        if system_val_col in system_clean.columns and system_val_col != "系统总计":
-            system_clean = system_clean.rename(columns={system_val_col: "系统总计"})
         
-        # 只保留需要的列进行merge
-        manual_cols = [key_col, "手工数量"]
-        system_cols = [key_col] + [c for c in system_clean.columns if c != key_col]
+        Raises:
+            FormulaError: 差值公式无法解析（在合并之前检查）
+        """
+        # 公式先编译，错误在合并之前报告
+        formula = None
+        if diff_formula and diff_formula.strip():
+            formula = compile_formula(diff_formula, ["手工数量", "系统总计"] + list(pivot_values or []))
         
-        manual_merge = manual_clean[manual_cols] if all(c in manual_clean.columns for c in manual_cols) else manual_clean
-        system_merge = system_clean[system_cols] if len(system_cols) > 1 else system_clean
+        result = CompareEngine.merge_aggregates(
+            manual_df, system_df, key_col, manual_val_col, system_val_col, key_codec, measures
+        )
         
-        # 合并数据（不会有列名冲突）
-        result = manual_merge.merge(system_merge, on=key_col, how='outer')
+        # 计算差值
+        result["差值"] = CompareEngine._calc_diff(result, formula)
         
-        # 确保必要列存在
-        if "手工数量" not in result.columns:
-            result["手工数量"] = 0
-        if "系统总计" not in result.columns:
-            result["系统总计"] = 0
+        # 标记状态
+        result["比对状态"] = CompareEngine._label_status(result["手工数量"], result["系统总计"], result["差值"])
         
-        # 转换为数值类型
-        result["手工数量"] = pd.to_numeric(result["手工数量"], errors='coerce').fillna(0)
-        result["系统总计"] = pd.to_numeric(result["系统总计"], errors='coerce').fillna(0)
+        return label_measures(result, measures or [], CompareEngine._label_status)
+
+    @staticmethod
+    def merge_aggregates(
+        manual_df: pd.DataFrame,
+        system_df: pd.DataFrame,
+        key_col: str,
+        manual_val_col: str,
+        system_val_col: str,
+        key_codec: Optional[KeyCodec] = None,
+        measures: Optional[List[Measure]] = None
+    ) -> pd.DataFrame:
+        """
+        按主键合并两个聚合结果（merge_and_compare 的合并步骤）
         
-        # 计算差值
-        result["差值"] = CompareEngine._calc_diff(result, diff_formula, pivot_values)
+        数值列重命名为 手工数量 / 系统总计（附加指标为 手工X / 系统X）并转为数值，缺失按 0 计算；
+        参数同 merge_and_compare。
         
-        # 标记状态
-        result["比对状态"] = result.apply(CompareEngine._label_row, axis=1)
+        Returns:
+            合并后的 DataFrame（不含差值和比对状态）
+        """
+        # 结果列名：数值列重命名为标准列名，避免列名冲突（不复制输入表）
+        manual_names = {c: c for c in manual_df.columns if c != key_col}
+        if manual_val_col in manual_names:
+            manual_names[manual_val_col] = "手工数量"
+        system_names = {c: c for c in system_df.columns if c != key_col}
+        if system_val_col in system_names:
+            system_names[system_val_col] = "系统总计"
+        measure_cols = []
+        for measure in measures or []:
+            if measure.manual in manual_names:
+                manual_names[measure.manual] = measure.manual_column
+            if measure.system in system_names:
+                system_names[measure.system] = measure.system_column
+            measure_cols += [measure.manual_column, measure.system_column]
+        
+        # 手工表只取数值列（没有时取全部列）
+        manual_value = {c: n for c, n in manual_names.items() if n == "手工数量" or n in measure_cols}
+        if "手工数量" in manual_value.values() and key_col in manual_df.columns:
+            manual_names = manual_value
+        
+        # 按主键编号对齐合并（不会有列名冲突）
+        result = outer_join(manual_df, system_df, key_col, manual_names, system_names, key_codec)
+        
+        # 确保必要列存在，并转换为数值类型
+        for col in ["手工数量", "系统总计", *measure_cols]:
+            if col not in result.columns:
+                result[col] = 0
+            result[col] = pd.to_numeric(result[col], errors='coerce').fillna(0)
         
         return result
 
     @staticmethod
-    def _calc_diff(df: pd.DataFrame, formula: Optional[str], pivot_values: Optional[List[str]]) -> pd.Series:
+    def _calc_diff(df: pd.DataFrame, formula: Optional[CompiledFormula]) -> pd.Series:
         """
         根据公式计算差值
         
         Args:
             df: DataFrame
-            formula: 差值公式，如 "手工数量 - (系统总计 - 已关闭)"
-            pivot_values: 可用的透视变量列表
+            formula: 已编译的差值公式（见 compile_formula），None 为默认公式
             
         Returns:
             差值 Series
         """
-        if not formula or formula.strip() == "":
+        if formula is None:
             # 默认公式
             return df["手工数量"] - df["系统总计"]
-        
-        def eval_formula(row):
-            try:
-                expr = formula
-                
-                # 替换变量
-                variables = {
-                    "手工数量": row.get("手工数量", 0) or 0,
-                    "系统总计": row.get("系统总计", 0) or 0,
-                }
-                
-                # 添加透视列变量
-                if pivot_values:
-                    for pv in pivot_values:
-                        variables[pv] = row.get(pv, 0) or 0
-                
-                # 按变量名长度降序排序替换，避免部分匹配
-                for var_name in sorted(variables.keys(), key=len, reverse=True):
-                    expr = expr.replace(var_name, str(float(variables[var_name])))
-                
-                # 安全计算
-                if re.match(r'^[\d\s+\-*/().]+$', expr):
-                    return eval(expr)
-                return row["手工数量"] - row["系统总计"]
-            except Exception:
-                return row["手工数量"] - row["系统总计"]
-        
-        return df.apply(eval_formula, axis=1)
+        return formula.evaluate(df)
+
+    # 比对状态的分类顺序（状态列为 int8 编码的 Categorical）
+    STATUS_ORDER = ["match", "diff", "manual_only", "system_only"]
 
     @staticmethod
-    def _label_row(row) -> str:
-        """标记单行的比对状态"""
-        manual = row.get("手工数量", 0) or 0
-        system = row.get("系统总计", 0) or 0
-        diff = row.get("差值", 0) or 0
-        
-        manual_nan = pd.isna(row.get("手工数量"))
-        system_nan = pd.isna(row.get("系统总计"))
-        
-        # 系统有但手工无
-        if system > 0 and (manual_nan or manual == 0):
-            return COMPARE_STATUS["system_only"]
-        
-        # 手工有但系统无
-        if manual > 0 and (system_nan or system == 0):
-            return COMPARE_STATUS["manual_only"]
-        
-        # 都为0或都不存在
-        if manual == 0 and system == 0:
-            return COMPARE_STATUS["match"]
+    def _label_status(manual: pd.Series, system: pd.Series, diff: pd.Series) -> pd.Series:
+        """
+        按列标记比对状态
         
-        # 数值比较
-        if abs(diff) < 0.001:
-            return COMPARE_STATUS["match"]
+        规则依次为：系统有而手工为空或0 → 手工缺失；手工有而系统为空或0 → 系统缺失；
+        两边都为0、或差值绝对值小于0.001 → 一致；其余为差异。
         
-        return COMPARE_STATUS["diff"]
+        Returns:
+            Categorical Series，值为 COMPARE_STATUS 中的标签
+        """
+        m = pd.to_numeric(manual, errors="coerce").to_numpy(dtype=np.float64)
+        s = pd.to_numeric(system, errors="coerce").to_numpy(dtype=np.float64)
+        d = pd.to_numeric(diff, errors="coerce").to_numpy(dtype=np.float64)
+        
+        with np.errstate(invalid="ignore"):
+            system_only = (s > 0) & (np.isnan(m) | (m == 0))
+            manual_only = (m > 0) & (np.isnan(s) | (s == 0))
+            match = ((m == 0) & (s == 0)) | (np.abs(d) < 0.001)
+        
+        # 按规则优先级从低到高赋值，后面的覆盖前面的
+        order = CompareEngine.STATUS_ORDER
+        codes = np.full(len(m), order.index("diff"), dtype=np.int8)
+        codes[match] = order.index("match")
+        codes[manual_only] = order.index("manual_only")
+        codes[system_only] = order.index("system_only")
+        categories = [COMPARE_STATUS[name] for name in order]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=manual.index)
 
     @staticmethod
     def get_preview_matches(
@@ -9,6 +9,7 @@ from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
 from config import EXCEL_COLORS, COMPARE_STATUS
+from .measures import OVERALL_STATUS, Measure, measure_names, status_column
 
 
 class ExportEngine:
@@ -56,7 +57,7 @@ class ExportEngine:
         ExportEngine._auto_width(ws_all)
         
         # --- Sheet 2: 仅差异 ---
-        diff_df = export_df[export_df["比对状态"] != COMPARE_STATUS["match"]].copy()
+        diff_df = export_df[export_df[status_column(export_df)] != COMPARE_STATUS["match"]].copy()
         if not diff_df.empty:
             ws_diff = wb.create_sheet(title="📌 差异数据")
             ExportEngine._write_dataframe(ws_diff, diff_df)
@@ -83,6 +84,7 @@ class ExportEngine:
         4. 手工数量
         5. 差值
         6. 比对状态
+        7. 附加指标（每个指标依次为 系统X、手工X、X差值、X状态）和综合状态
         
         注意：此顺序需与 qt_result_preview.py 中的 _get_export_columns 保持一致
         """
@@ -113,6 +115,12 @@ class ExportEngine:
         if "比对状态" in df.columns:
             cols.append("比对状态")
         
+        # 7. 附加指标和综合状态
+        for name in measure_names(df):
+            cols.extend(c for c in Measure(name, "", "").columns if c in df.columns)
+        if OVERALL_STATUS in df.columns:
+            cols.append(OVERALL_STATUS)
+        
         # 排除带后缀的中间列
         exclude_suffixes = ('_manual', '_system', '_x', '_y', '_left', '_right')
         final_cols = [c for c in cols if not any(c.endswith(suffix) for suffix in exclude_suffixes)]
@@ -144,11 +152,12 @@ class ExportEngine:
 
     @staticmethod
     def _apply_colors(ws, df: pd.DataFrame):
-        """应用行颜色"""
-        if "比对状态" not in df.columns:
+        """应用行颜色（有附加指标时按综合状态）"""
+        status_col = status_column(df)
+        if status_col not in df.columns:
             return
         
-        status_idx = list(df.columns).index("比对状态")
+        status_idx = list(df.columns).index(status_col)
         diff_idx = list(df.columns).index("差值") if "差值" in df.columns else None
         
         for row_idx in range(2, len(df) + 2):
@@ -219,6 +228,9 @@ class ExportEngine:
         if isinstance(value_columns, dict):
             value_columns = f"手工: {value_columns.get('manual', '')}, 系统: {value_columns.get('system', '')}"
         
+        # 统计按整行状态（有附加指标时为综合状态）
+        status_col = status_column(result_df)
+        
         data = [
             ["📊 对账结果导出"],
             [],
@@ -226,10 +238,10 @@ class ExportEngine:
             [],
             ["【统计结果】", ""],
             ["总记录数", len(result_df)],
-            ["✓ 完全匹配", len(result_df[result_df["比对状态"] == COMPARE_STATUS["match"]]) if "比对状态" in result_df.columns else 0],
-            ["↕ 数量差异", len(result_df[result_df["比对状态"] == COMPARE_STATUS["diff"]]) if "比对状态" in result_df.columns else 0],
-            ["✗ 系统缺失", len(result_df[result_df["比对状态"] == COMPARE_STATUS["manual_only"]]) if "比对状态" in result_df.columns else 0],
-            ["✗ 手工缺失", len(result_df[result_df["比对状态"] == COMPARE_STATUS["system_only"]]) if "比对状态" in result_df.columns else 0],
+            ["✓ 完全匹配", len(result_df[result_df[status_col] == COMPARE_STATUS["match"]]) if status_col in result_df.columns else 0],
+            ["↕ 数量差异", len(result_df[result_df[status_col] == COMPARE_STATUS["diff"]]) if status_col in result_df.columns else 0],
+            ["✗ 系统缺失", len(result_df[result_df[status_col] == COMPARE_STATUS["manual_only"]]) if status_col in result_df.columns else 0],
+            ["✗ 手工缺失", len(result_df[result_df[status_col] == COMPARE_STATUS["system_only"]]) if status_col in result_df.columns else 0],
             [],
             ["【配置信息】", ""],
             ["主键字段", key_columns],
@@ -248,6 +260,10 @@ class ExportEngine:
             data.append([])
             data.append(["【透视值】", ", ".join(pivot_values)])
         
+        if measure_names(result_df):
+            data.append([])
+            data.append(["【附加指标】", ", ".join(measure_names(result_df))])
+        
         for row_idx, row_data in enumerate(data, 1):
             for col_idx, value in enumerate(row_data, 1):
                 ws.cell(row=row_idx, column=col_idx, value=value)
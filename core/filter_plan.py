@@ -0,0 +1,205 @@
+"""
+筛选计划 - 筛选条件只编译一次，合并为一个布尔掩码
+
+筛选条件 [(column, operator, value), ...] 编译为 FilterPlan：多值参数在编译时拆分，
+包含/不包含的多个值合并为一个正则，一次扫描完成；大于/小于的阈值编译时转为数值。
+计算时每列只转换一次文本（或数值），所有条件的结果按"且"合并为一个掩码，表只切片一次。
+同一个计划可交给 aggregate_data、aggregate_manual_with_pivot、aggregate_stream 重复使用。
+"""
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+# 按数值比较的操作符
+NUMERIC_OPERATORS = ("GREATER", "LESS")
+
+# 对象数组中每个值的类型
+_value_types = np.frompyfunc(type, 1, 1)
+
+
+def as_text(series: pd.Series) -> pd.Series:
+    """
+    列转为文本，用于主键、筛选和透视
+
+    对象列使用 astype(str)；字符串类型列（如 string[pyarrow]）保持原类型，
+    缺失值填为 "<NA>"（与 astype(str) 对 pd.NA 的结果一致），不创建Python对象。
+    """
+    if isinstance(series.dtype, pd.StringDtype):
+        return series.fillna("<NA>")
+    return series.astype(str)
+
+
+def text_codes(series: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    列按取值分解为 (行编号, 文本)，texts[codes] 与 as_text(series) 相同
+
+    先按原始取值分解，只对不同取值转文本；缺失值（None/NaN/pd.NA 文本不同）逐行转换。
+    """
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=series.dtype)
+    if series.dtype == object and infer_dtype(series, skipna=True) not in ("string", "empty"):
+        # 相等的数字文本可能不同（3 与 3.0、1 与 True），按 (值, 类型) 分解
+        type_codes, types = pd.factorize(_value_types(series.to_numpy()))
+        valid = codes >= 0
+        pairs = codes[valid].astype(np.int64) * len(types) + type_codes[valid]
+        pair_codes, _ = pd.factorize(pairs)
+        _, first_rows = np.unique(pair_codes, return_index=True)
+        uniques = series[valid].iloc[first_rows]
+        codes = codes.copy()
+        codes[valid] = pair_codes
+    texts = np.asarray(as_text(uniques), dtype=object)
+    missing = codes < 0
+    if missing.any():
+        null_codes, null_uniques = pd.factorize(np.asarray(as_text(series[missing]), dtype=object))
+        codes = codes.copy()
+        codes[missing] = len(texts) + null_codes
+        texts = np.concatenate([texts, np.asarray(null_uniques, dtype=object)])
+    return codes, texts
+
+
+def split_values(value) -> List[str]:
+    """多值参数拆分为列表（中英文逗号、分号分隔，去除首尾空白和空项）"""
+    if not isinstance(value, str):
+        return [str(value)]
+    normalized = value.replace('；', ';').replace('，', ',').replace(';', ',')
+    return [v.strip() for v in normalized.split(',') if v.strip()]
+
+
+class FilterCondition(NamedTuple):
+    """已编译的筛选条件"""
+    column: str
+    operator: str
+    value: object
+    arg: object  # 编译后的参数：值列表、正则或数值阈值
+
+
+class FilterPlan:
+    """
+    已编译的筛选计划
+
+    Example:
+        plan = FilterPlan([("状态", "NOT_IN_LIST", "取消,关闭"), ("数量", "GREATER", "0")])
+        mask = plan.mask(df)     # 所有条件同时满足的行
+        df = plan.apply(df)
+    """
+
+    def __init__(self, filters: Optional[Iterable[Tuple[str, str, object]]] = None):
+        self.conditions: List[FilterCondition] = []
+        for column, operator, value in filters or []:
+            condition = _compile_condition(column, operator, value)
+            if condition is not None:
+                self.conditions.append(condition)
+
+    @classmethod
+    def of(cls, filters: Union[None, "FilterPlan", Iterable[Tuple[str, str, object]]]) -> "FilterPlan":
+        """已编译的计划原样返回，筛选条件列表则编译"""
+        return filters if isinstance(filters, FilterPlan) else cls(filters)
+
+    @classmethod
+    def from_config(cls, items: Optional[Iterable[Dict]]) -> "FilterPlan":
+        """由模板配置编译（manual_filters / system_filters: [{"column", "operator", "value"}, ...]）"""
+        return cls((item["column"], item["operator"], item["value"]) for item in items or [])
+
+    @classmethod
+    def _from_conditions(cls, conditions: List[FilterCondition]) -> "FilterPlan":
+        plan = cls()
+        plan.conditions = conditions
+        return plan
+
+    def __len__(self) -> int:
+        return len(self.conditions)
+
+    @property
+    def columns(self) -> List[str]:
+        """用到的列名"""
+        return list(dict.fromkeys(c.column for c in self.conditions))
+
+    def select(self, predicate: Callable[[FilterCondition], bool]) -> "FilterPlan":
+        """满足 predicate 的条件组成的子计划"""
+        return FilterPlan._from_conditions([c for c in self.conditions if predicate(c)])
+
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        计算所有条件同时满足的行
+
+        表中没有的列上的条件忽略。文本条件按 as_text 的结果比较：每列只分解一次，
+        条件在去重后的文本上计算，再按行编号展开到各行。
+        """
+        mask = np.ones(len(df), dtype=bool)
+        texts: Dict[str, Tuple[np.ndarray, pd.Series]] = {}
+        numbers: Dict[str, pd.Series] = {}
+        for condition in self.conditions:
+            column, operator, arg = condition.column, condition.operator, condition.arg
+            if column not in df.columns:
+                continue
+            if operator in NUMERIC_OPERATORS:
+                if column not in numbers:
+                    numbers[column] = pd.to_numeric(df[column], errors='coerce')
+                values = numbers[column]
+                mask &= _to_bool(values > arg if operator == "GREATER" else values < arg)
+            else:
+                if column not in texts:
+                    codes, uniques = text_codes(df[column])
+                    texts[column] = (codes, pd.Series(uniques, dtype=object))
+                codes, text = texts[column]
+                if operator == "EQUALS":
+                    result = text == arg
+                elif operator == "NOT_EQUALS":
+                    result = text != arg
+                elif operator in ("CONTAINS", "NOT_CONTAINS"):
+                    pattern, regex = arg
+                    result = text.str.contains(pattern, na=False, regex=regex)
+                    if operator == "NOT_CONTAINS":
+                        result = ~result
+                else:
+                    result = text.isin(arg)
+                    if operator == "NOT_IN_LIST":
+                        result = ~result
+                mask &= _to_bool(result)[codes]
+            if not mask.any():
+                break
+        return mask
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """只保留满足所有条件的行（没有条件时原样返回）"""
+        if not self.conditions:
+            return df
+        mask = self.mask(df)
+        return df if mask.all() else df[mask]
+
+
+def _compile_condition(column: str, operator: str, value) -> Optional[FilterCondition]:
+    if operator in ("EQUALS", "NOT_EQUALS"):
+        return FilterCondition(column, operator, value, value)
+    if operator in ("IN_LIST", "NOT_IN_LIST"):
+        return FilterCondition(column, operator, value, split_values(value))
+    if operator in ("CONTAINS", "NOT_CONTAINS"):
+        values = split_values(value)
+        if not values:
+            return None
+        if len(values) == 1:
+            return FilterCondition(column, operator, value, (values[0], False))
+        # 多个值合并为一个正则（满足任一即可），只扫描一次
+        pattern = "|".join(re.escape(v) for v in dict.fromkeys(values))
+        return FilterCondition(column, operator, value, (pattern, True))
+    if operator in NUMERIC_OPERATORS:
+        try:
+            threshold = float(value)
+        except (TypeError, ValueError):
+            print(f"[WARN] 筛选条件 {column} {operator} {value!r} 的值不是数字，已忽略")
+            return None
+        return FilterCondition(column, operator, value, threshold)
+    print(f"[WARN] 不支持的筛选操作符 {operator!r}，已忽略")
+    return None
+
+
+def _to_bool(result: pd.Series) -> np.ndarray:
+    """比较结果转为 numpy 布尔数组（可空布尔的缺失值为 False）"""
+    return result.to_numpy(dtype=bool, na_value=False)
+
+
+# 筛选参数：已编译的计划或筛选条件列表 [(column, operator, value), ...]
+Filters = Union[None, FilterPlan, List[Tuple[str, str, object]]]
@@ -0,0 +1,131 @@
+"""
+差值公式 - 公式只解析一次，按列向量计算
+
+公式中的变量（手工数量、系统总计、透视列名）先替换为占位名再由 ast 解析，
+只允许数字、变量、+ - * / // ** 和括号，其他语法在编译时报错。
+其他名称按列名处理（如筛选后数据中已没有的透视值），表中没有该列时按 0 计算。
+计算时每个变量取整列数值，由 NumPy 一次算出所有行。
+"""
+import ast
+import re
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+# 简写变量
+FORMULA_ALIASES = {"M": "手工数量", "S": "系统总计"}
+
+_BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+    ast.FloorDiv: np.floor_divide,
+    ast.Pow: np.power,
+}
+_UNARY_OPS = {
+    ast.UAdd: np.positive,
+    ast.USub: np.negative,
+}
+
+
+class FormulaError(ValueError):
+    """差值公式无法解析"""
+
+
+class CompiledFormula:
+    """已编译的差值公式"""
+
+    def __init__(self, formula: str, tree: ast.expr, columns: Dict[str, object]):
+        self.formula = formula
+        self._tree = tree
+        self._columns = columns  # 占位名 -> 列名
+
+    @property
+    def variables(self) -> List:
+        """公式用到的列名"""
+        return list(dict.fromkeys(self._columns.values()))
+
+    def evaluate(self, df: pd.DataFrame) -> pd.Series:
+        """
+        按列计算公式
+
+        变量列转为数值，缺失值和无法转换的值按 0 计算；表中没有的列按 0 计算。
+        除数为 0 时结果为 inf / nan。
+        """
+        values = {}
+        for name, col in self._columns.items():
+            if col in df.columns:
+                values[name] = pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+            else:
+                values[name] = np.zeros(len(df))
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            result = _evaluate(self._tree, values)
+        return pd.Series(np.broadcast_to(result, len(df)).astype(np.float64), index=df.index)
+
+
+def compile_formula(formula: str, variables: Iterable) -> CompiledFormula:
+    """
+    编译差值公式
+
+    Args:
+        formula: 公式，如 "手工数量 - (系统总计 - 已关闭)" 或 "M - (S - 已关闭)"
+        variables: 可用的列名（手工数量、系统总计、透视值）；含运算符等字符的列名须在此列出，
+            公式中其他的名称也按列名处理
+
+    Returns:
+        CompiledFormula
+
+    Raises:
+        FormulaError: 语法错误或不支持的运算
+    """
+    names = {str(var): var for var in variables}
+    columns: Dict[str, object] = {}
+    placeholders: Dict[str, str] = {}
+
+    def substitute(match: re.Match) -> str:
+        text = match.group(0)
+        if text not in placeholders:
+            placeholders[text] = f"_v{len(placeholders)}"
+            columns[placeholders[text]] = names[text]
+        # 前后加空格，避免与相邻的数字或名称连在一起
+        return f" {placeholders[text]} "
+
+    expr = formula
+    if names:
+        # 按长度降序匹配，避免短名称匹配到长名称的一部分
+        pattern = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        expr = re.sub(pattern, substitute, formula)
+
+    try:
+        tree = ast.parse(expr.strip(), mode="eval").body
+    except SyntaxError:
+        raise FormulaError(f"差值公式语法错误: {formula}") from None
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id not in columns:
+            # 简写变量之外的名称按列名处理（计算时表中没有的列按 0 计算）
+            columns[node.id] = FORMULA_ALIASES.get(node.id, node.id)
+        elif isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise FormulaError(f"差值公式中只能使用数字常量: {formula}")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _BINARY_OPS:
+                raise FormulaError(f"差值公式中有不支持的运算: {formula}")
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in _UNARY_OPS:
+                raise FormulaError(f"差值公式中有不支持的运算: {formula}")
+        elif not isinstance(node, (ast.Name, ast.operator, ast.unaryop, ast.expr_context)):
+            raise FormulaError(f"差值公式中有不支持的语法: {formula}")
+    return CompiledFormula(formula, tree, columns)
+
+
+def _evaluate(node: ast.expr, values: Dict[str, np.ndarray]):
+    if isinstance(node, ast.Name):
+        return values[node.id]
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY_OPS[type(node.op)](_evaluate(node.operand, values))
+    return _BINARY_OPS[type(node.op)](_evaluate(node.left, values), _evaluate(node.right, values))
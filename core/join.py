@@ -0,0 +1,136 @@
+"""
+主键对齐 - 两个聚合结果按主键编号外连接，替代 DataFrame.merge(how="outer")
+
+两个表的主键先换成共享字典中按主键排序的名次（有 KeyCodec 时直接由整数主键编号换算，
+不对字符串做哈希）。名次即结果的行号：每个表的行按名次散布到预先分配的输出数组中，
+没有该主键的位置为缺失值（即"手工缺失"/"系统缺失"的判断依据），不经过 merge 的
+哈希连接、排序和中间 DataFrame。
+
+结果与 left[列].rename(...).merge(right[列].rename(...), on=key_col, how="outer") 相同；
+主键重复、为空、无法排序或两个表有同名的非主键列时使用 merge。
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+from pandas.api.types import infer_dtype, is_numeric_dtype
+
+from .key_codec import KeyCodec, text_order
+
+
+def outer_join(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    key_col: str,
+    left_columns: Dict[str, str],
+    right_columns: Dict[str, str],
+    key_codec: Optional[KeyCodec] = None
+) -> pd.DataFrame:
+    """
+    按主键外连接
+
+    Args:
+        left: 左表（手工表聚合结果）
+        right: 右表（系统表聚合结果）
+        key_col: 主键列名
+        left_columns: 左表取用的列 {原列名: 结果列名}（不含主键列）
+        right_columns: 右表取用的列 {原列名: 结果列名}（不含主键列）
+        key_codec: 生成主键时使用的编码器；指定时主键列为主键编号，结果的主键列还原为文本
+
+    Returns:
+        DataFrame，列依次为 key_col、左表列、右表列，行按主键排序
+    """
+    aligned = None
+    if _can_align(left, right, key_col, left_columns, right_columns):
+        aligned = _align(left[key_col], right[key_col], key_codec)
+    if aligned is None:
+        return _merge(left, right, key_col, left_columns, right_columns, key_codec)
+
+    keys, left_rows, right_rows = aligned
+    data = {key_col: keys}
+    for frame, columns, rows in ((left, left_columns, left_rows), (right, right_columns, right_rows)):
+        complete = rows.size == 0 or rows.min() >= 0
+        for source, name in columns.items():
+            data[name] = _scatter(frame[source], rows, complete)
+    return pd.DataFrame(data)
+
+
+def _can_align(left, right, key_col, left_columns, right_columns) -> bool:
+    """列名唯一、结果列不冲突时才能直接对齐（否则 merge 会加后缀或报错）"""
+    for frame, columns in ((left, left_columns), (right, right_columns)):
+        if not frame.columns.is_unique or key_col not in frame.columns:
+            return False
+        if any(source not in frame.columns for source in columns):
+            return False
+    names = [key_col, *left_columns.values(), *right_columns.values()]
+    return len(set(names)) == len(names)
+
+
+def _align(left_keys: pd.Series, right_keys: pd.Series, key_codec: Optional[KeyCodec]):
+    """
+    两个表的主键对齐到结果行
+
+    Returns:
+        (结果主键, 左表行号, 右表行号)；行号数组长度为结果行数，没有该主键为 -1。
+        主键重复、为空或无法排序时返回 None
+    """
+    if key_codec is not None:
+        (left_ranks, right_ranks), keys = key_codec.rank_by_text(left_keys, right_keys)
+    else:
+        ranked = _shared_ranks(left_keys, right_keys)
+        if ranked is None:
+            return None
+        left_ranks, right_ranks, keys = ranked
+
+    # 名次覆盖 0..n-1（字典只含两个表出现过的主键），名次即结果行号
+    n = len(keys)
+    rows = []
+    for ranks in (left_ranks, right_ranks):
+        if np.bincount(ranks, minlength=n).max(initial=0) > 1:
+            return None
+        positions = np.full(n, -1, dtype=np.intp)
+        positions[ranks] = np.arange(len(ranks))
+        rows.append(positions)
+    return keys, rows[0], rows[1]
+
+
+def _shared_ranks(left_keys: pd.Series, right_keys: pd.Series) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """两个主键列在共享字典中的名次（字典按主键排序；文本由 Arrow 排序）"""
+    if left_keys.dtype != right_keys.dtype:
+        return None
+    codes, uniques = pd.factorize(np.concatenate([left_keys.to_numpy(), right_keys.to_numpy()]))
+    if (codes < 0).any():
+        return None
+    if left_keys.dtype == object and infer_dtype(uniques, skipna=False) == "string":
+        order = text_order(pd.Series(uniques, dtype=object))
+    elif is_numeric_dtype(left_keys.dtype) and left_keys.dtype != bool:
+        order = np.argsort(uniques, kind="stable")
+    else:
+        return None
+    ranks = np.empty(len(order), dtype=np.intp)
+    ranks[order] = np.arange(len(order))
+    codes = ranks[codes]
+    return codes[:len(left_keys)], codes[len(left_keys):], uniques[order]
+
+
+def _scatter(series: pd.Series, rows: np.ndarray, complete: bool):
+    """按结果行号取值；有缺失的行时填充缺失值（整数列转为浮点，同 merge）"""
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    if complete:
+        return values.take(rows)
+    return take(values, rows, allow_fill=True)
+
+
+def _merge(left, right, key_col, left_columns, right_columns, key_codec) -> pd.DataFrame:
+    left = left[[key_col, *left_columns]].rename(columns=left_columns)
+    right = right[[key_col, *right_columns]].rename(columns=right_columns)
+    key_texts = None
+    if key_codec is not None:
+        (left_ranks, right_ranks), key_texts = key_codec.rank_by_text(left[key_col], right[key_col])
+        left = left.assign(**{key_col: left_ranks})
+        right = right.assign(**{key_col: right_ranks})
+    result = left.merge(right, on=key_col, how="outer")
+    if key_texts is not None:
+        result[key_col] = key_texts[result[key_col].to_numpy()]
+    return result
@@ -0,0 +1,173 @@
+"""
+主键编码 - 复合主键按共享字典编码为整数
+
+手工表和系统表共用一个 KeyCodec：每个主键列的文本在该列位置的共享字典中
+取得编号，各列编号再逐列两两组合、编号，最终每行得到一个 int64 主键编号。
+相同文本的主键在两个表中编号相同，分组、透视、合并都在整数上进行，
+" | " 连接的主键文本只在输出时由 decode 生成。主键编号的低 4 位为主键列数，
+列数不同的主键编号不会相同。
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+KEY_SEPARATOR = " | "
+
+# 组合两个编号时低位编号占用的位数（单个字典不超过 2^31 个取值）
+_PART_BITS = 31
+_PART_MASK = (1 << _PART_BITS) - 1
+# 主键编号中记录列数的位数
+_WIDTH_BITS = 4
+MAX_KEY_COLUMNS = (1 << _WIDTH_BITS) - 1
+
+
+class _Vocabulary:
+    """只增不减的字典：取值 -> 连续编号（哈希表只在编码时临时建立）"""
+
+    def __init__(self, dtype):
+        self.values = np.array([], dtype=dtype)
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        """取值的编号，新取值追加到字典末尾"""
+        codes = pd.Index(self.values).get_indexer(values)
+        missing = codes < 0
+        if missing.any():
+            new_codes, new = pd.factorize(values[missing])
+            codes[missing] = len(self.values) + new_codes
+            self.values = np.concatenate([self.values, np.asarray(new, dtype=self.values.dtype)])
+        return codes.astype(np.int64)
+
+
+class KeyCodec:
+    """
+    复合主键编码器（两个表共用一个实例）
+
+    Example:
+        codec = KeyCodec()
+        manual = CompareEngine.make_key(manual_df, ["订单号", "物料"], key_codec=codec)
+        system = CompareEngine.make_key(system_df, ["单号", "物料编码"], key_codec=codec)
+        ...
+        texts = codec.decode(result["__KEY__"])    # "SO001 | A01"
+    """
+
+    def __init__(self):
+        self._parts: List[_Vocabulary] = []   # 每个主键列位置的文本字典
+        self._pairs: List[_Vocabulary] = []   # 第 i+1 列与前 i+1 列组合的字典
+        # 最近一次 rank_by_text 排过序的主键：(有序的主键编号, 各编号的文本名次, 按名次排列的文本)
+        self._ranked: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def encode(self, parts: Sequence[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+        """
+        编码主键
+
+        Args:
+            parts: 每个主键列的 (行编号, 文本)，行编号为该行文本在 文本 数组中的位置
+
+        Returns:
+            int64 主键编号数组
+        """
+        if len(parts) > MAX_KEY_COLUMNS:
+            raise ValueError(f"主键列不能超过 {MAX_KEY_COLUMNS} 个")
+        combined = None
+        for i, (codes, texts) in enumerate(parts):
+            while len(self._parts) <= i:
+                self._parts.append(_Vocabulary(object))
+            lookup = self._parts[i].encode(np.asarray(texts, dtype=object))
+            part = lookup[codes]
+            if combined is None:
+                combined = part
+                continue
+            while len(self._pairs) < i:
+                self._pairs.append(_Vocabulary(np.int64))
+            combined = self._pairs[i - 1].encode((combined << _PART_BITS) | part)
+        if combined is None:
+            return np.zeros(0, dtype=np.int64)
+        return (combined << _WIDTH_BITS) | len(parts)
+
+    def decode(self, codes) -> pd.Series:
+        """
+        主键编号还原为 " | " 连接的主键文本
+
+        Args:
+            codes: 主键编号（Series 时保留其索引）
+
+        Returns:
+            对象类型的主键文本 Series
+        """
+        index = codes.index if isinstance(codes, pd.Series) else None
+        codes = np.asarray(codes, dtype=np.int64)
+        widths = codes & MAX_KEY_COLUMNS
+        prefixes = codes >> _WIDTH_BITS
+
+        result = np.empty(len(codes), dtype=object)
+        for width in np.unique(widths):
+            rows = np.flatnonzero(widths == width)
+            prefix = prefixes[rows]
+            texts = []
+            for i in range(int(width) - 1, 0, -1):
+                pair = self._pairs[i - 1].values[prefix]
+                texts.append(self._parts[i].values[pair & _PART_MASK])
+                prefix = pair >> _PART_BITS
+            texts.append(self._parts[0].values[prefix])
+            texts.reverse()
+            if len(texts) == 1:
+                result[rows] = texts[0]
+            else:
+                # 逐行 join 只创建最终的字符串，不产生中间拼接结果
+                joined = np.empty(len(rows), dtype=object)
+                joined[:] = [KEY_SEPARATOR.join(parts) for parts in zip(*texts)]
+                result[rows] = joined
+        return pd.Series(result, index=index, dtype=object)
+
+    def rank_by_text(self, *code_arrays) -> Tuple[List[np.ndarray], np.ndarray]:
+        """
+        按主键文本排序的名次重新编号
+
+        字典只增不减，编号对应的文本不变：主键都在上次排过序的主键中时（如只改了筛选条件），
+        直接按上次的文本名次排序，不再解码、比较文本。
+
+        Args:
+            *code_arrays: 主键编号数组（如手工表和系统表的主键列）
+
+        Returns:
+            ([各数组对应的名次], 按名次排列的主键文本)
+        """
+        arrays = [np.asarray(codes, dtype=np.int64) for codes in code_arrays]
+        positions, codes = pd.factorize(np.concatenate(arrays + [np.zeros(0, dtype=np.int64)]))
+        known = self._known_text_ranks(codes)
+        if known is not None:
+            order = np.argsort(known, kind="stable")
+            texts = self._ranked[2][known[order]]
+        else:
+            decoded = self.decode(codes)
+            order = text_order(decoded)
+            texts = decoded.to_numpy()[order]
+            text_ranks = np.empty(len(order), dtype=np.int64)
+            text_ranks[order] = np.arange(len(order))
+            sorter = np.argsort(codes)
+            self._ranked = (np.asarray(codes)[sorter], text_ranks[sorter], texts)
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order))
+        ranked = ranks[positions]
+        return np.split(ranked, np.cumsum([len(arr) for arr in arrays[:-1]])), texts
+
+    def _known_text_ranks(self, codes: np.ndarray) -> Optional[np.ndarray]:
+        """各主键编号在上次排序中的文本名次；有未排过序的编号时返回 None"""
+        if self._ranked is None or not len(self._ranked[0]):
+            return None
+        known_codes, known_ranks, _ = self._ranked
+        at = np.minimum(np.searchsorted(known_codes, codes), len(known_codes) - 1)
+        if not (known_codes[at] == codes).all():
+            return None
+        return known_ranks[at]
+
+
+def text_order(texts: pd.Series) -> np.ndarray:
+    """文本排序后的行位置（稳定排序；有 pyarrow 时由 Arrow 排序，不逐个比较Python字符串）"""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return np.argsort(texts.to_numpy(dtype=object), kind="stable")
+    return pc.sort_indices(pa.array(texts.to_numpy(dtype=object), type=pa.string())).to_numpy()
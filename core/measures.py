@@ -0,0 +1,114 @@
+"""
+附加比对指标 - 一次对账同时比对多个数值列（如 数量 和 金额）
+
+主指标仍为 value_mapping（结果列 手工数量 / 系统总计 / 差值 / 比对状态）；模板中的
+extra_measures 为附加指标 [{"name": "金额", "manual": "金额", "system": "含税金额"}, ...]。
+附加指标与主指标在同一次聚合中按主键求和（系统表透视时按参与透视的行求和，手工表出入库透视时为
+Σ出库 - Σ入库），合并后每个指标有各自的差值和状态列；综合状态取各指标状态中最严重的一个
+（一致 < 差异 < 缺失），各指标缺失的一边不同时为差异。
+"""
+from typing import Dict, Iterable, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from config import COMPARE_STATUS
+
+# 综合状态列名（有附加指标时添加）
+OVERALL_STATUS = "综合状态"
+
+
+class Measure(NamedTuple):
+    """附加比对指标：手工表和系统表各一个数值列"""
+    name: str
+    manual: str   # 手工表数值列
+    system: str   # 系统表数值列
+
+    @property
+    def manual_column(self) -> str:
+        return f"手工{self.name}"
+
+    @property
+    def system_column(self) -> str:
+        return f"系统{self.name}"
+
+    @property
+    def diff_column(self) -> str:
+        return f"{self.name}差值"
+
+    @property
+    def status_column(self) -> str:
+        return f"{self.name}状态"
+
+    @property
+    def columns(self) -> List[str]:
+        """结果中的列（按导出顺序）"""
+        return [self.system_column, self.manual_column, self.diff_column, self.status_column]
+
+
+def measures_from_config(config: Dict) -> List[Measure]:
+    """
+    读取模板中的附加指标
+
+    名称或列为空、名称重复、与主指标或前面的指标使用同一列的指标忽略（打印警告）。
+    """
+    value_mapping = config.get("value_mapping", {})
+    used_manual = {value_mapping.get("manual", "")}
+    used_system = {value_mapping.get("system", "")}
+    names = set()
+    measures = []
+    for item in config.get("extra_measures", []) or []:
+        measure = Measure(str(item.get("name", "")).strip(), item.get("manual", ""), item.get("system", ""))
+        if not measure.name or not measure.manual or not measure.system:
+            print(f"[WARN] 附加指标配置不完整，已忽略: {item!r}")
+            continue
+        if measure.name in names or measure.manual in used_manual or measure.system in used_system:
+            print(f"[WARN] 附加指标 {measure.name} 与其他指标重名或使用同一列，已忽略")
+            continue
+        names.add(measure.name)
+        used_manual.add(measure.manual)
+        used_system.add(measure.system)
+        measures.append(measure)
+    return measures
+
+
+def measure_names(df: pd.DataFrame) -> List[str]:
+    """比对结果中的附加指标名称（merge_and_compare 记录在 df.attrs["measures"]）"""
+    return list(df.attrs.get("measures", []))
+
+
+def status_column(df: pd.DataFrame) -> str:
+    """判断整行状态的列：有附加指标时为综合状态，否则为比对状态"""
+    return OVERALL_STATUS if OVERALL_STATUS in df.columns else "比对状态"
+
+
+def label_measures(result: pd.DataFrame, measures: Iterable[Measure], label_status) -> pd.DataFrame:
+    """
+    为附加指标添加差值、状态列和综合状态列（原地添加到 result）
+
+    Args:
+        result: 已有主指标差值和比对状态的合并结果
+        measures: 附加指标
+        label_status: 状态标记函数（CompareEngine._label_status）
+    """
+    measures = list(measures)
+    if not measures:
+        return result
+    statuses = [result["比对状态"]]
+    for measure in measures:
+        diff = result[measure.manual_column] - result[measure.system_column]
+        result[measure.diff_column] = diff
+        result[measure.status_column] = label_status(result[measure.manual_column], result[measure.system_column], diff)
+        statuses.append(result[measure.status_column])
+    # 状态编码按 CompareEngine.STATUS_ORDER（一致、差异、两种缺失）排列，取最大即最严重；
+    # 各指标缺失的一边不同时（如数量系统缺失、金额手工缺失），两边都有数据，为差异
+    categories = statuses[0].cat.categories
+    code = {name: categories.get_loc(COMPARE_STATUS[name]) for name in ("diff", "manual_only", "system_only")}
+    stacked = np.vstack([s.cat.codes.to_numpy() for s in statuses])
+    codes = stacked.max(axis=0)
+    conflict = (stacked == code["manual_only"]).any(axis=0) & (stacked == code["system_only"]).any(axis=0)
+    codes[conflict] = code["diff"]
+    result[OVERALL_STATUS] = pd.Categorical.from_codes(codes, categories=categories)
+    result.attrs["measures"] = [m.name for m in measures]
+    return result
+
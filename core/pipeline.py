@@ -0,0 +1,229 @@
+"""
+对账流水线 - 分阶段执行对账，各阶段结果按输入和配置缓存
+
+阶段依次为 清洗 → 主键 → 筛选 → 聚合 → 合并 → 差值 → 状态。每个阶段的指纹由上游阶段的
+指纹和本阶段用到的配置组成，指纹不变时直接使用上次的结果：只改差值公式时只重算差值和状态，
+只改筛选条件时从筛选阶段开始重算。每个阶段只保留最近一次的结果。
+
+输入表按对象识别（重新加载后为新对象）；已传入的表和返回的结果不要原地修改。
+"""
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .clean_plan import compile_clean_rules
+from .compare_engine import CompareEngine
+from .filter_plan import FilterPlan
+from .formula import compile_formula
+from .key_codec import KeyCodec
+from .measures import Measure, label_measures, measures_from_config
+
+KEY_COL = "__KEY__"
+
+# 流水线阶段（按执行顺序）
+STAGES = ("clean", "key", "filter", "aggregate", "merge", "diff", "label")
+
+# 差值公式：列名公式，或由透视值生成列名公式的函数（如把列字母换成列名）
+DiffFormula = Union[None, str, Callable[[List[str]], str]]
+
+
+class ReconcileResult(NamedTuple):
+    """对账结果"""
+    result: pd.DataFrame                    # 比对结果（同 merge_and_compare）
+    manual_agg: pd.DataFrame                # 手工表聚合结果
+    system_agg: pd.DataFrame                # 系统表聚合结果
+    pivot_values: List[str]                 # 系统表透视值
+    manual_pivot_info: Optional[Dict]       # 手工表出入库透视 {"out_cols", "in_cols"}，未配置为 None
+
+
+class ReconcilePipeline:
+    """
+    分阶段缓存的对账流水线
+
+    Example:
+        pipeline = ReconcilePipeline()
+        out = pipeline.run(manual_df, system_df, config, diff_formula="M - S")
+        out = pipeline.run(manual_df, system_df, config, diff_formula="M - S + 已关闭")
+        pipeline.recomputed    # ["diff", "label"]
+    """
+
+    def __init__(self, use_key_codec: bool = True):
+        """
+        Args:
+            use_key_codec: 主键按整数编号聚合与合并（结果相同）；False 时聚合结果的主键为文本
+        """
+        self.use_key_codec = use_key_codec
+        self.recomputed: List[str] = []  # 最近一次 run 重新计算的阶段
+        self._memo: Dict[str, Tuple[str, Any]] = {}
+        self._tables: Dict[str, pd.DataFrame] = {}
+        self._table_tokens: Dict[str, int] = {}
+        self._next_token = 0
+
+    def clear(self):
+        """清空缓存（释放对输入表和中间结果的引用）"""
+        self._memo.clear()
+        self._tables.clear()
+        self._table_tokens.clear()
+
+    def run(self, manual_df: pd.DataFrame, system_df: pd.DataFrame, config: Dict,
+            diff_formula: DiffFormula = None) -> ReconcileResult:
+        """
+        执行对账，只重算输入或配置有变化的阶段及其下游
+
+        Args:
+            manual_df: 手工表
+            system_df: 系统表
+            config: 模板配置（clean_rules、key_mappings、manual_filters、system_filters、
+                value_mapping、extra_measures、pivot_column、manual_pivot）
+            diff_formula: 差值公式（同 merge_and_compare），或由透视值生成公式的函数
+
+        Returns:
+            ReconcileResult
+
+        Raises:
+            CleanRuleError: 清洗正则无效
+            FormulaError: 差值公式无法解析
+        """
+        self.recomputed = []
+        manual_token = self._table_token("manual", manual_df)
+        system_token = self._table_token("system", system_df)
+
+        clean_rules = config.get("clean_rules", [])
+        fp, cleaned = self._stage("clean", (manual_token, clean_rules),
+                                  lambda: CompareEngine.clean_column(manual_df, compile_clean_rules(clean_rules)))
+
+        key_mappings = config.get("key_mappings", [])
+        fp, (manual_keyed, system_keyed, key_codec) = self._stage(
+            "key", (fp, system_token, key_mappings),
+            lambda: self._make_keys(cleaned, system_df, key_mappings))
+
+        manual_filters = config.get("manual_filters", [])
+        system_filters = config.get("system_filters", [])
+        fp, masks = self._stage(
+            "filter", (fp, manual_filters, system_filters),
+            lambda: (_filter_mask(manual_keyed, manual_filters), _filter_mask(system_keyed, system_filters)))
+
+        value_mapping = config.get("value_mapping", {})
+        pivot_config = config.get("pivot_column", {})
+        manual_pivot = config.get("manual_pivot", {}) or {}
+        measures = measures_from_config(config)
+        fp, (manual_agg, system_agg, pivot_values, manual_pivot_info) = self._stage(
+            "aggregate", (fp, value_mapping, measures, pivot_config, manual_pivot),
+            lambda: _aggregate(manual_keyed, system_keyed, masks, value_mapping, measures, pivot_config, manual_pivot))
+
+        manual_val = value_mapping.get("manual", "")
+        system_val = value_mapping.get("system", "")
+        fp, merged = self._stage(
+            "merge", (fp, manual_val, system_val, measures),
+            lambda: CompareEngine.merge_aggregates(manual_agg, system_agg, KEY_COL, manual_val, system_val,
+                                                   key_codec, measures))
+
+        formula = diff_formula(pivot_values) if callable(diff_formula) else diff_formula
+        fp, diff = self._stage("diff", (fp, formula), lambda: _calc_diff(merged, formula, pivot_values))
+
+        fp, result = self._stage("label", (fp,), lambda: _label(merged, diff, measures))
+
+        return ReconcileResult(result.copy(deep=False), manual_agg, system_agg, list(pivot_values),
+                               manual_pivot_info)
+
+    def _stage(self, name: str, inputs: Sequence, compute: Callable[[], Any]) -> Tuple[str, Any]:
+        """指纹相同时返回缓存的结果，否则计算并缓存；返回 (指纹, 结果)"""
+        fingerprint = _fingerprint(name, inputs)
+        cached = self._memo.get(name)
+        if cached is not None and cached[0] == fingerprint:
+            return cached
+        value = compute()
+        self._memo[name] = (fingerprint, value)
+        self.recomputed.append(name)
+        return fingerprint, value
+
+    def _table_token(self, side: str, df: pd.DataFrame) -> int:
+        """输入表的编号：与上次传入的是同一个对象时不变（保留引用，对象编号不会被复用）"""
+        if self._tables.get(side) is not df:
+            self._tables[side] = df
+            self._table_tokens[side] = self._next_token
+            self._next_token += 1
+        return self._table_tokens[side]
+
+    def _make_keys(self, manual: pd.DataFrame, system: pd.DataFrame, key_mappings: List[Dict]):
+        key_codec = KeyCodec() if self.use_key_codec else None
+        manual_keyed = CompareEngine.make_key(manual, [k["manual"] for k in key_mappings], key_codec=key_codec)
+        system_keyed = CompareEngine.make_key(system, [k["system"] for k in key_mappings], key_codec=key_codec)
+        if key_codec is not None:
+            # 全部主键先按文本排序一次，筛选、聚合变化后合并时不再解码、排序主键文本
+            key_codec.rank_by_text(manual_keyed[KEY_COL], system_keyed[KEY_COL])
+        return manual_keyed, system_keyed, key_codec
+
+
+def _fingerprint(name: str, inputs: Sequence) -> str:
+    text = json.dumps([name, list(inputs)], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _filter_mask(df: pd.DataFrame, filters: List[Dict]) -> Optional[np.ndarray]:
+    """满足筛选条件的行（没有条件时为 None）"""
+    plan = FilterPlan.from_config(filters)
+    return plan.mask(df) if plan else None
+
+
+def _rows(df: pd.DataFrame, mask: Optional[np.ndarray], columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """按掩码取行；指定 columns 时只取其中表里有的列"""
+    if columns is not None:
+        df = df[[c for c in dict.fromkeys(columns) if c and c in df.columns]]
+    if mask is None or mask.all():
+        return df
+    return df[mask]
+
+
+def _aggregate(manual: pd.DataFrame, system: pd.DataFrame, masks: Tuple, value_mapping: Dict,
+               measures: List[Measure], pivot_config, manual_pivot: Dict):
+    manual_mask, system_mask = masks
+    manual_val = value_mapping.get("manual", "")
+    system_val = value_mapping.get("system", "")
+    manual_extra = [m.manual for m in measures]
+    system_extra = [m.system for m in measures]
+    pivot_col = pivot_config.get("system", "") if isinstance(pivot_config, dict) else pivot_config
+
+    manual_pivot_info = None
+    if manual_pivot.get("pivot_column"):
+        # 手工表透视聚合（区分出库/入库）
+        pivot_values = manual_pivot.get("out_values", []) + manual_pivot.get("in_values", [])
+        columns = [KEY_COL, manual_pivot["pivot_column"], manual_val, *manual_extra] \
+            if pivot_values and manual_val in manual.columns else None
+        manual_agg, out_cols, in_cols = CompareEngine.aggregate_manual_with_pivot(
+            _rows(manual, manual_mask, columns), KEY_COL, manual_val, manual_pivot, extra_cols=manual_extra)
+        manual_pivot_info = {"out_cols": out_cols, "in_cols": in_cols}
+    else:
+        manual_cols = _value_cols(manual, manual_val, manual_extra)
+        manual_agg, _ = CompareEngine.aggregate_data(
+            _rows(manual, manual_mask, [KEY_COL, *manual_cols]), KEY_COL, manual_cols)
+
+    system_cols = _value_cols(system, system_val, system_extra)
+    system_agg, pivot_values = CompareEngine.aggregate_data(
+        _rows(system, system_mask, [KEY_COL, *system_cols, pivot_col]), KEY_COL,
+        system_cols, pivot_col=pivot_col or None)
+    return manual_agg, system_agg, pivot_values, manual_pivot_info
+
+
+def _value_cols(df: pd.DataFrame, value_col: str, extra_cols: List[str]) -> List[str]:
+    """聚合的数值列：主指标在前（透视时只有第一列参与透视），附加指标只取表里有的列"""
+    if not value_col:
+        return []
+    return [value_col, *(c for c in extra_cols if c in df.columns)]
+
+
+def _calc_diff(merged: pd.DataFrame, formula: Optional[str], pivot_values: List[str]) -> pd.Series:
+    compiled = None
+    if formula and formula.strip():
+        compiled = compile_formula(formula, ["手工数量", "系统总计"] + list(pivot_values))
+    return CompareEngine._calc_diff(merged, compiled)
+
+
+def _label(merged: pd.DataFrame, diff: pd.Series, measures: List[Measure]) -> pd.DataFrame:
+    result = merged.copy(deep=False)
+    result["差值"] = diff
+    result["比对状态"] = CompareEngine._label_status(result["手工数量"], result["系统总计"], result["差值"])
+    return label_measures(result, measures, CompareEngine._label_status)
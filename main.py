@@ -13,7 +13,7 @@ SupplyChain-Reconciler-Plus v1.4.3
   ✓ 配置模板保存/加载
   ✓ 实时匹配预览
   ✓ 导出带颜色背景的Excel结果
-  ✓ 支持 .xls/.xlsx/.xlsm 格式
+  ✓ 支持 .xls/.xlsx/.xlsm/.csv/.tsv/.parquet 格式
  
 技术栈:
   - PyQt6 + qt-material（现代化UI框架）
@@ -92,6 +92,10 @@ def main():
                 }
             """)
         
+        # pandas copy-on-write：对账各步骤共用输入表的列，只有修改的列才复制
+        import pandas as pd
+        pd.set_option("mode.copy_on_write", True)
+        
         # 导入并创建主窗口
         from ui.qt_main_window import QtMainWindow
         
@@ -124,4 +128,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包后的程序中，并行加载的子进程需要此调用才能正常启动
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,715 @@
+"""
+性能基准脚本
+用途：对比数据处理各环节优化前后的耗时和峰值内存
+使用方法：python tests/benchmark.py clean --rows 200000 --cols 40
+          python tests/benchmark.py strings --rows 1000000
+          python tests/benchmark.py stream --rows 300000
+          python tests/benchmark.py profile --rows 1000000
+          python tests/benchmark.py store --rows 1000000
+          python tests/benchmark.py formula --rows 400000
+          python tests/benchmark.py label --rows 400000
+          python tests/benchmark.py keys --rows 1000000
+          python tests/benchmark.py filters --rows 1000000
+          python tests/benchmark.py regex --rows 1000000
+          python tests/benchmark.py normalize --rows 1000000
+          python tests/benchmark.py pivot --rows 1000000
+          python tests/benchmark.py join --rows 1000000
+          python tests/benchmark.py cow --rows 1000000
+          python tests/benchmark.py pipeline --rows 1000000
+          python tests/benchmark.py measures --rows 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_wide_frame(rows: int, cols: int, seed: int = 0) -> pd.DataFrame:
+    """
+    生成模拟ERP导出的宽表（未清理，对象列带空格、'nan'、数字混排）
+
+    列按 文本 / 混合编号 / 数值 循环排列。
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f" 物料{i:04d} " for i in range(500)] + ["nan", "  "], dtype=object)
+    data = {}
+    for c in range(cols):
+        kind = c % 3
+        if kind == 0:
+            values = words[rng.integers(0, len(words), rows)]
+            values[rng.random(rows) < 0.05] = np.nan
+        elif kind == 1:
+            values = rng.integers(100000, 100500, rows).astype(object)
+            text = rng.random(rows) < 0.5
+            values[text] = np.array([f"SO{v}" for v in values[text]], dtype=object)
+        else:
+            values = rng.random(rows) * 1000
+        data[f"列{c}"] = values
+    return pd.DataFrame(data)
+
+
+def measure(func, *args):
+    """运行函数，返回 (结果, 耗时秒, 峰值内存MB)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def report(title: str, rows: list):
+    """打印对比表: rows 为 [(名称, 耗时, 峰值MB), ...]"""
+    print(f"\n{title}")
+    print(f"{'方案':<16}{'耗时(s)':>10}{'峰值内存(MB)':>16}")
+    for name, elapsed, peak in rows:
+        print(f"{name:<16}{elapsed:>10.3f}{peak:>16.1f}")
+
+
+def legacy_clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """优化前的 clean_dataframe（astype(str) + strip + replace）"""
+    df.columns = [str(col).strip() if col is not None else f"Column_{i}"
+                  for i, col in enumerate(df.columns)]
+    df = df.dropna(how="all")
+    for col in df.select_dtypes(include=["object"]).columns:
+        df[col] = df[col].astype(str).str.strip()
+        df[col] = df[col].replace("nan", pd.NA)
+    return df
+
+
+def bench_clean(args):
+    from utils.excel_utils import clean_dataframe
+
+    source = make_wide_frame(args.rows, args.cols)
+    results = []
+    for name, func in (("旧版 astype(str)", legacy_clean_dataframe), ("单次遍历", clean_dataframe)):
+        _, elapsed, peak = measure(func, source.copy())
+        results.append((name, elapsed, peak))
+    report(f"clean_dataframe: {args.rows} 行 x {args.cols} 列", results)
+
+
+def make_system_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    """生成模拟系统表（订单号、物料、仓库、状态、数量），文本列为对象类型"""
+    rng = np.random.default_rng(seed)
+    orders = np.array([f"SO{i:07d}" for i in range(max(rows // 5, 1))], dtype=object)
+    skus = np.array([f"SKU-{i:05d}" for i in range(5000)], dtype=object)
+    warehouses = np.array([f"W{i}" for i in range(10)], dtype=object)
+    statuses = np.array(["已发货", "已关闭", "待审核", "已取消", "在途"], dtype=object)
+    return pd.DataFrame({
+        "订单号": orders[rng.integers(0, len(orders), rows)],
+        "物料": skus[rng.integers(0, len(skus), rows)],
+        "仓库": warehouses[rng.integers(0, len(warehouses), rows)],
+        "状态": statuses[rng.integers(0, len(statuses), rows)],
+        "数量": rng.integers(1, 100, rows),
+    })
+
+
+def run_system_pipeline(df: pd.DataFrame):
+    """系统表对账流程：主键 -> 筛选 -> 透视聚合"""
+    from core.compare_engine import CompareEngine
+
+    keyed = CompareEngine.make_key(df, ["订单号", "物料"])
+    return CompareEngine.aggregate_data(
+        keyed, "__KEY__", ["数量"], pivot_col="状态",
+        filters=[("仓库", "NOT_EQUALS", "W9"), ("物料", "CONTAINS", "SKU-0")],
+    )
+
+
+def arrow_peak_mb() -> float:
+    """Arrow 内存池的历史峰值（tracemalloc 统计不到 Arrow 分配的内存）"""
+    try:
+        import pyarrow as pa
+        return pa.default_memory_pool().max_memory() / 1024 / 1024
+    except ImportError:
+        return 0.0
+
+
+def bench_strings(args):
+    from utils.excel_utils import to_arrow_strings
+
+    source = make_system_table(args.rows)
+    print(f"\n系统表: {args.rows} 行")
+    print(f"{'文本列类型':<16}{'表内存(MB)':>12}{'流程耗时(s)':>14}{'Python峰值(MB)':>18}{'Arrow峰值增量(MB)':>16}")
+    for name in ("object", "string[pyarrow]"):
+        df = source.copy() if name == "object" else to_arrow_strings(source.copy())
+        frame_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+        arrow_before = arrow_peak_mb()
+        _, elapsed, peak = measure(run_system_pipeline, df)
+        arrow_peak = max(arrow_peak_mb() - arrow_before, 0.0)
+        print(f"{name:<16}{frame_mb:>12.1f}{elapsed:>14.3f}{peak:>18.1f}{arrow_peak:>16.1f}")
+        del df
+        gc.collect()
+
+
+def write_system_workbook(path: str, rows: int):
+    """将模拟系统表写入xlsx（openpyxl 只写模式）"""
+    from openpyxl import Workbook
+
+    df = make_system_table(rows)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("明细")
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        ws.append([v.item() if isinstance(v, np.generic) else v for v in row])
+    wb.save(path)
+
+
+def bench_stream(args):
+    import tempfile
+    from core.compare_engine import CompareEngine
+    from utils.excel_utils import iter_excel_chunks, load_excel
+
+    # 按物料汇总：主键基数（5000）远小于行数
+    key_cols = ["物料"]
+    filters = [("仓库", "NOT_EQUALS", "W9"), ("物料", "CONTAINS", "SKU-0")]
+
+    def full_load(path):
+        keyed = CompareEngine.make_key(load_excel(path, "明细", use_cache=False), key_cols)
+        return CompareEngine.aggregate_data(keyed, "__KEY__", ["数量"], pivot_col="状态", filters=filters)
+
+    def streamed(path):
+        return CompareEngine.aggregate_stream(
+            iter_excel_chunks(path, "明细", chunk_rows=args.chunk_rows),
+            key_cols, ["数量"], pivot_col="状态", filters=filters,
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "system.xlsx")
+        write_system_workbook(path, args.rows)
+        results = []
+        outputs = []
+        for name, func in (("整表加载", full_load), ("分块聚合", streamed)):
+            output, elapsed, peak = measure(func, path)
+            outputs.append(output[0].reset_index(drop=True))
+            results.append((name, elapsed, peak))
+        pd.testing.assert_frame_equal(outputs[0], outputs[1])
+        report(f"系统表透视聚合: {args.rows} 行, 每块 {args.chunk_rows} 行", results)
+
+
+def legacy_unique_values(df: pd.DataFrame) -> dict:
+    """优化前的唯一值统计（每列 dropna().unique()，超过100个丢弃）"""
+    unique_values = {}
+    for col in df.columns:
+        unique_vals = df[col].dropna().unique().tolist()
+        if len(unique_vals) <= 100:
+            unique_values[col] = unique_vals
+    return unique_values
+
+
+def bench_profile(args):
+    from utils.column_profile import profile_table, unique_values
+
+    df = make_system_table(args.rows)
+    results = []
+    outputs = []
+    for name, func in (("逐列 unique", legacy_unique_values),
+                       ("列概况", lambda d: unique_values(profile_table(d)))):
+        output, elapsed, peak = measure(func, df)
+        outputs.append({col: sorted(map(str, values)) for col, values in output.items()})
+        results.append((name, elapsed, peak))
+    assert outputs[0] == outputs[1]
+    report(f"筛选/透视唯一值: {args.rows} 行 x {len(df.columns)} 列", results)
+
+
+def receive_stream(payload: bytes) -> pd.DataFrame:
+    """优化前：子进程结果经管道传回（pickle 的 Arrow IPC 流）后重建"""
+    import pickle
+    import pyarrow as pa
+    from utils import sheet_cache
+
+    buffer = pickle.loads(payload)
+    return sheet_cache.arrow_to_dataframe(pa.ipc.open_stream(buffer).read_all())
+
+
+def bench_store(args):
+    import pickle
+    import tempfile
+    import pyarrow as pa
+    from utils import sheet_cache
+    from utils.table_store import TableStore
+
+    df = make_system_table(args.rows)
+    for i in range(args.numeric_cols):
+        df[f"金额{i}"] = np.random.default_rng(i).random(args.rows) * 1000
+
+    sink = pa.BufferOutputStream()
+    table = sheet_cache.dataframe_to_arrow(df)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    payload = pickle.dumps(sink.getvalue(), protocol=pickle.HIGHEST_PROTOCOL)
+    del table, sink
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TableStore(os.path.join(tmp, "session"))
+        ref = store.put(df)
+        results = []
+        for name, func, arg in (("管道 IPC 流", receive_stream, payload),
+                                ("内存映射存储", store.open, ref)):
+            arrow_before = arrow_peak_mb()
+            received, elapsed, peak = measure(func, arg)
+            pd.testing.assert_frame_equal(received, df)
+            results.append((name, elapsed, peak + max(arrow_peak_mb() - arrow_before, 0.0)))
+            del received
+        store.close()
+    report(f"主进程接收子进程结果: {args.rows} 行 x {len(df.columns)} 列", results)
+
+
+def legacy_calc_diff(df: pd.DataFrame, formula: str, pivot_values: list) -> pd.Series:
+    """优化前的差值计算（逐行替换变量后 eval）"""
+    import re
+
+    def eval_formula(row):
+        try:
+            expr = formula
+            variables = {
+                "手工数量": row.get("手工数量", 0) or 0,
+                "系统总计": row.get("系统总计", 0) or 0,
+            }
+            for pv in pivot_values:
+                variables[pv] = row.get(pv, 0) or 0
+            for var_name in sorted(variables.keys(), key=len, reverse=True):
+                expr = expr.replace(var_name, str(float(variables[var_name])))
+            if re.match(r'^[\d\s+\-*/().]+$', expr):
+                return eval(expr)
+            return row["手工数量"] - row["系统总计"]
+        except Exception:
+            return row["手工数量"] - row["系统总计"]
+
+    return df.apply(eval_formula, axis=1)
+
+
+def bench_formula(args):
+    from core.formula import compile_formula
+
+    rng = np.random.default_rng(0)
+    pivot_values = ["已发货", "已关闭", "待审核"]
+    df = pd.DataFrame({col: rng.integers(0, 100, args.rows).astype(float)
+                       for col in ["手工数量", "系统总计"] + pivot_values})
+    formula = "手工数量 - (系统总计 - 已关闭)"
+    variables = ["手工数量", "系统总计"] + pivot_values
+    results = []
+    outputs = []
+    for name, func in (("逐行 eval", lambda d: legacy_calc_diff(d, formula, pivot_values)),
+                       ("编译后按列", lambda d: compile_formula(formula, variables).evaluate(d))):
+        output, elapsed, peak = measure(func, df)
+        outputs.append(output.to_numpy(dtype=float))
+        results.append((name, elapsed, peak))
+    np.testing.assert_allclose(outputs[0], outputs[1])
+    report(f"差值公式 {formula}: {args.rows} 行", results)
+
+
+def bench_label(args):
+    from core.compare_engine import CompareEngine
+    from config import COMPARE_STATUS
+
+    def legacy_label_row(row):
+        """优化前的逐行状态标记"""
+        manual = row.get("手工数量", 0) or 0
+        system = row.get("系统总计", 0) or 0
+        diff = row.get("差值", 0) or 0
+        manual_nan = pd.isna(row.get("手工数量"))
+        system_nan = pd.isna(row.get("系统总计"))
+        if system > 0 and (manual_nan or manual == 0):
+            return COMPARE_STATUS["system_only"]
+        if manual > 0 and (system_nan or system == 0):
+            return COMPARE_STATUS["manual_only"]
+        if manual == 0 and system == 0:
+            return COMPARE_STATUS["match"]
+        if abs(diff) < 0.001:
+            return COMPARE_STATUS["match"]
+        return COMPARE_STATUS["diff"]
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "手工数量": rng.integers(0, 5, args.rows).astype(float),
+        "系统总计": rng.integers(0, 5, args.rows).astype(float),
+    })
+    df["差值"] = df["手工数量"] - df["系统总计"]
+    results = []
+    outputs = []
+    for name, func in (("逐行 apply", lambda d: d.apply(legacy_label_row, axis=1)),
+                       ("按列掩码", lambda d: CompareEngine._label_status(d["手工数量"], d["系统总计"], d["差值"]))):
+        output, elapsed, peak = measure(func, df)
+        outputs.append(output.astype(str).tolist())
+        results.append((name, elapsed, peak))
+    assert outputs[0] == outputs[1]
+    report(f"比对状态标记: {args.rows} 行", results)
+
+
+def run_compare(manual: pd.DataFrame, system: pd.DataFrame, key_codec=None) -> pd.DataFrame:
+    """主键 -> 聚合/透视 -> 合并比对"""
+    from core.compare_engine import CompareEngine
+
+    manual_agg, _ = CompareEngine.aggregate_data(
+        CompareEngine.make_key(manual, ["订单号", "物料"], key_codec=key_codec), "__KEY__", ["数量"]
+    )
+    system_agg, pivot_values = CompareEngine.aggregate_data(
+        CompareEngine.make_key(system, ["订单号", "物料"], key_codec=key_codec), "__KEY__", ["数量"],
+        pivot_col="状态",
+    )
+    return CompareEngine.merge_and_compare(
+        manual_agg, system_agg, "__KEY__", "数量", "数量",
+        pivot_values=pivot_values, key_codec=key_codec,
+    )
+
+
+def bench_keys(args):
+    from core.key_codec import KeyCodec
+
+    manual = make_system_table(args.rows // 4, seed=1)
+    system = make_system_table(args.rows)
+    results = []
+    outputs = []
+    for name, func in (("文本主键", lambda m, s: run_compare(m, s)),
+                       ("整数主键", lambda m, s: run_compare(m, s, KeyCodec()))):
+        output, elapsed, peak = measure(func, manual, system)
+        outputs.append(output)
+        results.append((name, elapsed, peak))
+    pd.testing.assert_frame_equal(outputs[0], outputs[1])
+    report(f"主键+聚合+合并: 手工表 {len(manual)} 行, 系统表 {len(system)} 行", results)
+
+
+def legacy_apply_filters(df: pd.DataFrame, filters) -> pd.DataFrame:
+    """优化前的逐条筛选：每条重新转换文本并切片，多值包含逐值扫描"""
+    for col, op, val in filters:
+        col_data = df[col].astype(str)
+        values = [v.strip() for v in str(val).replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
+        if op == "NOT_EQUALS":
+            df = df[col_data != val]
+        elif op in ("CONTAINS", "NOT_CONTAINS"):
+            mask = col_data.str.contains(values[0], na=False, regex=False)
+            for v in values[1:]:
+                mask = mask | col_data.str.contains(v, na=False, regex=False)
+            df = df[mask if op == "CONTAINS" else ~mask]
+        elif op == "NOT_IN_LIST":
+            df = df[~col_data.isin(values)]
+        elif op == "GREATER":
+            df = df[pd.to_numeric(df[col], errors='coerce') > float(val)]
+    return df
+
+
+def bench_filters(args):
+    from core.filter_plan import FilterPlan
+
+    df = make_system_table(args.rows)
+    filters = [
+        ("仓库", "NOT_IN_LIST", "W8,W9"),
+        ("状态", "NOT_EQUALS", "已取消"),
+        ("物料", "CONTAINS", "SKU-00,SKU-01,SKU-02,SKU-03"),
+        ("物料", "NOT_CONTAINS", "SKU-001,SKU-002"),
+        ("数量", "GREATER", "5"),
+    ]
+    results = []
+    outputs = []
+    for name, func in (("逐条筛选", lambda d: legacy_apply_filters(d, filters)),
+                       ("筛选计划", lambda d: FilterPlan(filters).apply(d))):
+        output, elapsed, peak = measure(func, df)
+        outputs.append(output)
+        results.append((name, elapsed, peak))
+    pd.testing.assert_frame_equal(outputs[0], outputs[1])
+    report(f"筛选: {args.rows} 行, {len(filters)} 个条件", results)
+
+
+def legacy_clean_column(df: pd.DataFrame, clean_rules) -> pd.DataFrame:
+    """优化前的清洗：每个正则重新转换文本、单独替换"""
+    df = df.copy()
+    for rule in clean_rules:
+        column = rule["column"]
+        for regex in rule["regexes"]:
+            values = df[column].astype(str)
+            df[column] = values.str.replace(regex, "", regex=True).str.strip()
+    return df
+
+
+def bench_regex(args):
+    from core.clean_plan import compile_clean_rules
+
+    df = make_system_table(args.rows)
+    df["订单号"] = "订单" + df["订单号"] + "-#"
+    rules = [{"column": "订单号", "mode": "删除匹配",
+              "regexes": [r"[\u4e00-\u9fa5]+", r"[^\w\s\u4e00-\u9fa5]+", r"\-", r"^\s+|\s+$"]}]
+    results = []
+    outputs = []
+    for name, func in (("逐个正则", lambda d: legacy_clean_column(d, rules)),
+                       ("清洗计划", lambda d: compile_clean_rules(rules).apply(d))):
+        output, elapsed, peak = measure(func, df)
+        outputs.append(output)
+        results.append((name, elapsed, peak))
+    pd.testing.assert_frame_equal(outputs[0], outputs[1])
+    report(f"列清洗: {args.rows} 行, {len(rules[0]['regexes'])} 个正则", results)
+
+
+def legacy_make_key(df: pd.DataFrame, key_cols) -> pd.Series:
+    """优化前的文本主键：逐行转文本、去空白、连接"""
+    key = None
+    for col in key_cols:
+        part = df[col].astype(str).str.strip().fillna("")
+        key = part if key is None else key + " | " + part
+    return key
+
+
+def bench_normalize(args):
+    from core.compare_engine import CompareEngine
+
+    df = make_system_table(args.rows)
+    df["物料"] = " " + df["物料"]
+    for key_cols in (["订单号", "物料"], ["仓库", "状态"]):
+        results = []
+        outputs = []
+        for name, func in (("逐行处理", lambda d: legacy_make_key(d, key_cols)),
+                           ("先分解再展开", lambda d: CompareEngine.make_key(d, key_cols)["__KEY__"])):
+            output, elapsed, peak = measure(func, df)
+            outputs.append(output.rename(None))
+            results.append((name, elapsed, peak))
+        pd.testing.assert_series_equal(outputs[0], outputs[1])
+        distinct = [df[col].nunique() for col in key_cols]
+        report(f"文本主键 {key_cols}: {args.rows} 行, 各列不同取值 {distinct}", results)
+
+
+def bench_pivot(args):
+    from core.compare_engine import CompareEngine
+    from core.pivot import pivot_sum
+
+    df = CompareEngine.make_key(make_system_table(args.rows), ["订单号", "物料"])
+    results = []
+    outputs = []
+    for name, func in (("pivot_table", lambda d: d.pivot_table(index="__KEY__", columns="状态", values="数量",
+                                                              aggfunc="sum", fill_value=0).reset_index()),
+                       ("bincount", lambda d: pivot_sum(d, "__KEY__", "状态", "数量"))):
+        output, elapsed, peak = measure(func, df)
+        outputs.append(output)
+        results.append((name, elapsed, peak))
+    pd.testing.assert_frame_equal(outputs[0], outputs[1])
+    report(f"透视求和: {args.rows} 行, {len(outputs[0])} 个主键 x {len(outputs[0].columns) - 1} 个透视值", results)
+
+
+def bench_join(args):
+    from core.join import outer_join
+
+    rng = np.random.default_rng(0)
+    keys = np.array([f"SO{i:08d} | M{i % 997:04d}" for i in rng.permutation(args.rows)], dtype=object)
+    manual = pd.DataFrame({"__KEY__": keys[: args.rows * 3 // 4], "数量": rng.integers(0, 100, args.rows * 3 // 4)})
+    system = pd.DataFrame({"__KEY__": keys[args.rows // 4:]})
+    for status in ("已发货", "已关闭", "在途"):
+        system[status] = rng.integers(0, 100, len(system))
+    system["系统总计"] = system[["已发货", "已关闭", "在途"]].sum(axis=1)
+    left_columns = {"数量": "手工数量"}
+    right_columns = {c: c for c in system.columns if c != "__KEY__"}
+    results = []
+    outputs = []
+    for name, func in (("merge", lambda m, s: m.rename(columns=left_columns).merge(s, on="__KEY__", how="outer")),
+                       ("编号对齐", lambda m, s: outer_join(m, s, "__KEY__", left_columns, right_columns))):
+        output, elapsed, peak = measure(func, manual, system)
+        outputs.append(output)
+        results.append((name, elapsed, peak))
+    pd.testing.assert_frame_equal(outputs[0], outputs[1])
+    report(f"主键外连接: 手工 {len(manual)} 行, 系统 {len(system)} 行", results)
+
+
+def run_reconcile(manual: pd.DataFrame, system: pd.DataFrame, copy: bool) -> pd.DataFrame:
+    """
+    同主窗口 _run_comparison：清洗 -> 主键 -> 聚合/透视 -> 合并比对，中间结果保留到比对结束
+
+    copy=True 时按优化前的做法，在各步骤前复制输入表。
+    """
+    from core.compare_engine import CompareEngine
+    from core.key_codec import KeyCodec
+
+    dup = (lambda d: d.copy()) if copy else (lambda d: d)
+    manual_data = dup(manual)
+    system_data = dup(system)
+    manual_data = CompareEngine.clean_column(dup(manual_data), [{"column": "物料", "regexes": [r"[^\w]+"]}])
+    codec = KeyCodec()
+    manual_with_key = CompareEngine.make_key(dup(manual_data), ["订单号", "物料"], key_codec=codec)
+    system_with_key = CompareEngine.make_key(dup(system_data), ["订单号", "物料"], key_codec=codec)
+    manual_agg, _ = CompareEngine.aggregate_data(
+        dup(manual_with_key), "__KEY__", ["数量"], filters=[("仓库", "NOT_EQUALS", "W9")]
+    )
+    system_agg, pivot_values = CompareEngine.aggregate_data(
+        dup(system_with_key), "__KEY__", ["数量"], pivot_col="状态"
+    )
+    return CompareEngine.merge_and_compare(
+        dup(manual_agg), dup(system_agg), "__KEY__", "数量", "数量",
+        pivot_values=pivot_values, key_codec=codec,
+    )
+
+
+def cow_child(args):
+    """子进程：执行一次对账，输出 耗时 和 进程峰值 RSS(MB)"""
+    import resource
+
+    copy = args.variant == "copy"
+    pd.set_option("mode.copy_on_write", not copy)
+    manual = make_system_table(args.rows // 4, seed=1)
+    system = make_system_table(args.rows)
+    for i in range(args.cols):
+        manual[f"金额{i}"] = np.random.default_rng(i).random(len(manual))
+        system[f"金额{i}"] = np.random.default_rng(i).random(len(system))
+    gc.collect()
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    run_reconcile(manual, system, copy)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{elapsed} {base} {peak}")
+
+
+def bench_cow(args):
+    import subprocess
+    try:
+        import resource  # noqa: F401
+    except ImportError:
+        print("[WARN] 当前平台没有 resource 模块，无法读取进程峰值 RSS")
+        return
+
+    results = []
+    for name, variant in (("逐步复制", "copy"), ("copy-on-write", "cow")):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "cow", "--rows", str(args.rows),
+             "--cols", str(args.cols), "--variant", variant],
+            check=True, capture_output=True, text=True,
+        ).stdout.split()
+        elapsed, base, peak = map(float, output[-3:])
+        results.append((f"{name}", elapsed, peak - base))
+        print(f"{name}: 输入数据后 RSS {base:.1f} MB, 峰值 RSS {peak:.1f} MB")
+    report(f"对账流程峰值 RSS 增量: 系统表 {args.rows} 行, 手工表 {args.rows // 4} 行, 各加 {args.cols} 个数值列",
+           results)
+
+
+def bench_pipeline(args):
+    from core.pipeline import ReconcilePipeline
+
+    manual = make_system_table(args.rows // 4, seed=1)
+    system = make_system_table(args.rows)
+    config = {
+        "clean_rules": [{"column": "物料", "regexes": [r"[^\w]+"]}],
+        "key_mappings": [{"manual": "订单号", "system": "订单号"}, {"manual": "物料", "system": "物料"}],
+        "manual_filters": [{"column": "仓库", "operator": "NOT_EQUALS", "value": "W9"}],
+        "system_filters": [],
+        "value_mapping": {"manual": "数量", "system": "数量"},
+        "pivot_column": {"system": "状态"},
+    }
+    filtered = {**config, "system_filters": [{"column": "仓库", "operator": "NOT_IN_LIST", "value": "W8,W9"}]}
+    pipeline = ReconcilePipeline()
+    results = []
+    for name, cfg, formula in (("首次执行", config, "M - S"),
+                               ("修改差值公式", config, "M - (S - 已关闭)"),
+                               ("修改筛选条件", filtered, "M - (S - 已关闭)"),
+                               ("配置不变", filtered, "M - (S - 已关闭)")):
+        _, elapsed, peak = measure(lambda: pipeline.run(manual, system, cfg, formula))
+        results.append((f"{name}({len(pipeline.recomputed)}阶段)", elapsed, peak))
+    report(f"对账流水线增量重算: 系统表 {args.rows} 行, 手工表 {args.rows // 4} 行", results)
+
+
+def bench_measures(args):
+    from core.pipeline import ReconcilePipeline
+
+    manual = make_system_table(args.rows // 4, seed=1)
+    system = make_system_table(args.rows)
+    for df, seed in ((manual, 3), (system, 4)):
+        df["金额"] = df["数量"] * np.random.default_rng(seed).random(len(df)) * 10
+    config = {
+        "key_mappings": [{"manual": "订单号", "system": "订单号"}, {"manual": "物料", "system": "物料"}],
+        "value_mapping": {"manual": "数量", "system": "数量"},
+        "pivot_column": {"system": "状态"},
+    }
+    amount = {**config, "value_mapping": {"manual": "金额", "system": "金额"}}
+    combined = {**config, "extra_measures": [{"name": "金额", "manual": "金额", "system": "金额"}]}
+
+    def separate():
+        return [ReconcilePipeline().run(manual, system, cfg) for cfg in (config, amount)]
+
+    results = [("逐指标对账", *measure(separate)[1:]),
+               ("一次对账", *measure(lambda: ReconcilePipeline().run(manual, system, combined))[1:])]
+    report(f"数量+金额对账: 系统表 {args.rows} 行, 手工表 {args.rows // 4} 行", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("clean", help="clean_dataframe 耗时与峰值内存")
+    p.add_argument("--rows", type=int, default=200000)
+    p.add_argument("--cols", type=int, default=30)
+    p.set_defaults(func=bench_clean)
+
+    p = sub.add_parser("strings", help="对象字符串与 string[pyarrow] 的对账流程对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_strings)
+
+    p = sub.add_parser("stream", help="整表加载与分块流式聚合的峰值内存对比")
+    p.add_argument("--rows", type=int, default=300000)
+    p.add_argument("--chunk-rows", type=int, default=50000)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("profile", help="逐列统计唯一值与列概况的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_profile)
+
+    p = sub.add_parser("store", help="子进程结果经管道传回与内存映射表存储的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--numeric-cols", type=int, default=10)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser("formula", help="逐行 eval 与编译后按列计算差值公式的对比")
+    p.add_argument("--rows", type=int, default=400000)
+    p.set_defaults(func=bench_formula)
+
+    p = sub.add_parser("label", help="逐行 apply 与按列掩码标记比对状态的对比")
+    p.add_argument("--rows", type=int, default=400000)
+    p.set_defaults(func=bench_label)
+
+    p = sub.add_parser("keys", help="文本复合主键与整数主键的对账流程对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_keys)
+
+    p = sub.add_parser("filters", help="逐条筛选与编译后的筛选计划的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_filters)
+
+    p = sub.add_parser("regex", help="逐个正则清洗与编译后的清洗计划的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_regex)
+
+    p = sub.add_parser("normalize", help="逐行与先分解再展开生成文本主键的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_normalize)
+
+    p = sub.add_parser("pivot", help="pivot_table 与 bincount 透视求和的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_pivot)
+
+    p = sub.add_parser("join", help="merge 外连接与按主键编号对齐的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_join)
+
+    p = sub.add_parser("cow", help="逐步复制与 copy-on-write 对账流程的峰值 RSS 对比（各方案在子进程中执行）")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--cols", type=int, default=10)
+    p.add_argument("--variant", choices=["copy", "cow"], help=argparse.SUPPRESS)
+    p.set_defaults(func=lambda args: cow_child(args) if args.variant else bench_cow(args))
+
+    p = sub.add_parser("pipeline", help="对账流水线首次执行与修改公式、筛选后增量重算的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("measures", help="按指标分别对账与附加指标一次对账的对比")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.set_defaults(func=bench_measures)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
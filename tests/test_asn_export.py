@@ -13,6 +13,7 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from core.compare_engine import CompareEngine
+from core.filter_plan import FilterPlan
 
 # 输入文件
 MANUAL_FILE = Path("222.xlsx")
@@ -42,38 +43,7 @@ def load_asn_template():
 
 def apply_filters(df: pd.DataFrame, filters):
     """按 aggregate_data 的规则应用筛选"""
-    if not filters:
-        return df
-    df = df.copy()
-    for col, op, val in filters:
-        if col not in df.columns:
-            continue
-        col_data = df[col].astype(str)
-        if op == "EQUALS":
-            df = df[col_data == val]
-        elif op == "NOT_EQUALS":
-            df = df[col_data != val]
-        elif op == "CONTAINS":
-            values = [v.strip() for v in str(val).replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-            if values:
-                mask = col_data.str.contains(values[0], na=False, regex=False)
-                for v in values[1:]:
-                    mask |= col_data.str.contains(v, na=False, regex=False)
-                df = df[mask]
-        elif op == "NOT_CONTAINS":
-            values = [v.strip() for v in str(val).replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-            if values:
-                mask = ~col_data.str.contains(values[0], na=False, regex=False)
-                for v in values[1:]:
-                    mask &= ~col_data.str.contains(v, na=False, regex=False)
-                df = df[mask]
-        elif op == "IN_LIST":
-            values = [v.strip() for v in str(val).replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-            df = df[col_data.isin(values)]
-        elif op == "NOT_IN_LIST":
-            values = [v.strip() for v in str(val).replace('；', ';').replace('，', ',').replace(';', ',').split(',') if v.strip()]
-            df = df[~col_data.isin(values)]
-    return df
+    return FilterPlan.of(filters).apply(df)
 
 
 def export_manual(template):
@@ -207,7 +177,7 @@ def export_system(template):
     value_mapping = template.get("value_mapping", {})
     system_key_cols = [m["system"] for m in key_mappings if m.get("system")]
     system_val_col = value_mapping.get("system", "")
-    system_filters = [(f["column"], f["operator"], f["value"]) for f in template.get("system_filters", [])]
+    system_filters = FilterPlan.from_config(template.get("system_filters", []))
     pivot_col_cfg = template.get("pivot_column", {})
     pivot_col = pivot_col_cfg.get("system") if isinstance(pivot_col_cfg, dict) else pivot_col_cfg
     pivot_values = template.get("pivot_values", [])
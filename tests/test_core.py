@@ -2,15 +2,19 @@
 单元测试 - 测试核心功能
 """
 import unittest
+import tempfile
 import pandas as pd
 import sys
 import os
+from pathlib import Path
+from unittest import mock
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core import CompareEngine, ExportEngine
-from utils import load_excel, get_sheet_names
+from utils import load_excel, iter_excel_chunks, get_sheet_names, get_template_columns, get_all_columns
+from utils import excel_utils, sheet_cache
 from config import COMPARE_STATUS
 
 
@@ -41,6 +45,20 @@ class TestCompareEngine(unittest.TestCase):
         self.assertEqual(df["__KEY__"].iloc[0], "A001 | SKU1")
         self.assertEqual(len(df), len(self.manual_df))
     
+    def test_make_key_mixed_values(self):
+        """测试文本主键按不同取值处理后展开，结果与逐行转换一致"""
+        df = pd.DataFrame({
+            "订单号": pd.Series([" SO1", "SO1 ", 3, 3.0, True, 1, None, float("nan"), pd.NA, 3], dtype=object),
+            "物料": ["A", "A", "B", "B", "C", "C", "D", "D", "E", "B"],
+        })
+        key = CompareEngine.make_key(df, ["订单号", "物料", "缺失列"])["__KEY__"]
+        expected = [
+            f"{str(a).strip()} | {b} | " for a, b in zip(df["订单号"], df["物料"])
+        ]
+        self.assertEqual(key.tolist(), expected)
+        self.assertEqual(key.dtype, object)
+        self.assertEqual(CompareEngine.make_key(df.iloc[:0], ["订单号", "物料"])["__KEY__"].tolist(), [])
+
     def test_aggregate_data_simple(self):
         """测试简单聚合"""
         df = CompareEngine.make_key(self.manual_df, ["订单号", "物料"])
@@ -98,6 +116,44 @@ class TestCompareEngine(unittest.TestCase):
         self.assertEqual(a002_row["比对状态"], COMPARE_STATUS["diff"])
         self.assertEqual(a002_row["差值"], -50)
     
+    def test_arrow_string_columns(self):
+        """测试 string[pyarrow] 列与对象列的比对结果一致"""
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("需要pyarrow")
+        
+        def run(manual, system):
+            manual = CompareEngine.clean_column(manual, [{"column": "订单号", "regexes": ["^A0*"]}])
+            manual = CompareEngine.make_key(manual, ["订单号", "物料"])
+            system = CompareEngine.make_key(system, ["订单号", "物料"])
+            manual_agg, _ = CompareEngine.aggregate_data(
+                manual, "__KEY__", ["数量"], filters=[("物料", "NOT_EQUALS", "SKU3")]
+            )
+            system_agg, pivot_values = CompareEngine.aggregate_data(
+                system, "__KEY__", ["数量"], pivot_col="状态",
+                filters=[("物料", "CONTAINS", "SKU")]
+            )
+            result = CompareEngine.merge_and_compare(
+                manual_agg, system_agg, "__KEY__", "数量", "数量", pivot_values=pivot_values
+            )
+            return result.sort_values("__KEY__").reset_index(drop=True), pivot_values
+        
+        # 缺失值约定同 clean_dataframe（pd.NA）
+        self.manual_df.loc[1, "物料"] = pd.NA
+        system_df = self.system_df.assign(订单号=["1", "2", "4"], 物料=["SKU1", pd.NA, "SKU4"],
+                                          状态=["已发货", pd.NA, "已关闭"])
+        expected, expected_pivots = run(self.manual_df, system_df)
+        
+        def to_arrow(df):
+            return df.astype({col: "string[pyarrow]" for col in df.columns if df[col].dtype == object})
+        
+        actual, pivots = run(to_arrow(self.manual_df), to_arrow(system_df))
+        self.assertEqual(pivots, expected_pivots)
+        self.assertIsInstance(actual["__KEY__"].dtype, pd.StringDtype)
+        pd.testing.assert_frame_equal(actual.astype({"__KEY__": object}), expected,
+                                      check_column_type=False)
+    
     def test_diff_formula(self):
         """测试差值公式"""
         # 创建带透视的数据
@@ -125,6 +181,374 @@ class TestCompareEngine(unittest.TestCase):
         # 100 - (80 - 30) = 50
         self.assertEqual(result.iloc[0]["差值"], 50)
 
+    
+    def test_make_key_codec(self):
+        """测试整数主键：文本与文本主键一致，两表相同文本编号相同，合并结果一致"""
+        from core import KeyCodec
+        
+        manual = pd.DataFrame({
+            "订单号": pd.Series([" SO1", "SO1", 3, 3.0, True, 1, None, pd.NA], dtype=object),
+            "物料": [1, 1, 2, 2, 3, 3, 4, 4],
+            "数量": [1, 2, 3, 4, 5, 6, 7, 8],
+        })
+        system = pd.DataFrame({
+            "单号": ["SO1", "3.0", "1", "SO9"],
+            "物料编码": pd.Series(["1", "2", "3", "5"], dtype=object),
+            "状态": ["已发货", "已关闭", "已发货", "已关闭"],
+            "数量": [3, 4, 6, 1],
+        })
+        codec = KeyCodec()
+        manual_key = CompareEngine.make_key(manual, ["订单号", "物料"], key_codec=codec)
+        system_key = CompareEngine.make_key(system, ["单号", "物料编码", "缺失列"], key_codec=codec)
+        self.assertEqual(manual_key["__KEY__"].dtype, "int64")
+        for df, cols in ((manual_key, ["订单号", "物料"]), (system_key, ["单号", "物料编码", "缺失列"])):
+            expected = CompareEngine.make_key(df, cols, "文本主键")["文本主键"]
+            self.assertEqual(codec.decode(df["__KEY__"]).tolist(), expected.tolist())
+        # 3 与 3.0 文本不同，编号不同
+        codes = manual_key["__KEY__"].tolist()
+        self.assertEqual(codes[0], codes[1])
+        self.assertNotEqual(codes[2], codes[3])
+        
+        system_key = CompareEngine.make_key(system, ["单号", "物料编码"], key_codec=codec)
+        self.assertEqual(system_key["__KEY__"].iloc[0], manual_key["__KEY__"].iloc[0])
+        
+        def compare(key_codec):
+            manual_agg, _ = CompareEngine.aggregate_data(
+                CompareEngine.make_key(manual, ["订单号", "物料"], key_codec=key_codec), "__KEY__", ["数量"])
+            system_agg, pivots = CompareEngine.aggregate_data(
+                CompareEngine.make_key(system, ["单号", "物料编码"], key_codec=key_codec), "__KEY__", ["数量"],
+                pivot_col="状态")
+            return CompareEngine.merge_and_compare(manual_agg, system_agg, "__KEY__", "数量", "数量",
+                                                   pivot_values=pivots, key_codec=key_codec)
+        
+        pd.testing.assert_frame_equal(compare(KeyCodec()), compare(None))
+    
+    def test_label_status(self):
+        """测试按列标记比对状态"""
+        df = pd.DataFrame({
+            "手工数量": [0, 5, 5, 0, 5, 5, float("nan"), 3],
+            "系统总计": [3, 0, float("nan"), 0, 5, 4, 2, 4],
+            "差值": [-3, 5, 5, 0, 0.0005, 1, float("nan"), -1],
+        })
+        result = CompareEngine._label_status(df["手工数量"], df["系统总计"], df["差值"])
+        expected = ["system_only", "manual_only", "manual_only", "match", "match", "diff", "system_only", "diff"]
+        self.assertEqual(result.tolist(), [COMPARE_STATUS[name] for name in expected])
+        self.assertEqual(result.cat.codes.dtype, "int8")
+        self.assertEqual(list(result.index), list(df.index))
+    
+    def test_compile_formula(self):
+        """测试差值公式编译：按列计算、简写变量、错误提前报告"""
+        from core import FormulaError, compile_formula
+        
+        df = pd.DataFrame({
+            "手工数量": [100, 5, 7],
+            "系统总计": [80, 0, 7],
+            "已关闭": [30, None, 2],
+            "已关闭-退货": [1, 2, "x"],
+        })
+        variables = ["手工数量", "系统总计", "已关闭", "已关闭-退货"]
+        diff = compile_formula("M - (S - 已关闭)", variables).evaluate(df)
+        self.assertEqual(diff.tolist(), [50, 5, 2])
+        # 长名称优先匹配；无法转换为数字的值按 0 计算
+        diff = compile_formula("手工数量 - 已关闭-退货 * 2", variables).evaluate(df)
+        self.assertEqual(diff.tolist(), [98, 1, 7])
+        # 表中没有的透视列按 0 计算
+        diff = compile_formula("手工数量 - 已取消", variables + ["已取消"]).evaluate(df)
+        self.assertEqual(diff.tolist(), [100, 5, 7])
+        
+        # 不在可用列名中的名称按列名处理：数据中没有的透视值按 0 计算
+        diff = compile_formula("M - (S - 已取消)", variables).evaluate(df)
+        self.assertEqual(diff.tolist(), [20, 5, 0])
+        
+        for formula in ("M -", "M - __import__('os')", "M.real", "M % 2", "M - 'a'", "M - (S"):
+            with self.assertRaises(FormulaError, msg=formula):
+                compile_formula(formula, variables)
+        
+        # 筛选后数据中没有公式用到的透视值时，该透视值按 0 计算（结果同 M - S）
+        manual = pd.DataFrame({"__KEY__": ["A", "B"], "手工数量": [5, 2]})
+        system = pd.DataFrame({"__KEY__": ["A", "B"], "状态": ["已发货", "已发货"], "数量": [3, 2]})
+        system_agg, pivots = CompareEngine.aggregate_data(system, "__KEY__", ["数量"], pivot_col="状态")
+        result = CompareEngine.merge_and_compare(manual, system_agg, "__KEY__", "手工数量", "系统总计",
+                                                 diff_formula="手工数量 - (系统总计 - 已关闭)",
+                                                 pivot_values=pivots)
+        self.assertEqual(result["差值"].tolist(), (result["手工数量"] - result["系统总计"]).tolist())
+        self.assertEqual(result["差值"].tolist(), [2, 0])
+        with self.assertRaises(FormulaError):
+            CompareEngine.merge_and_compare(manual, system_agg, "__KEY__", "手工数量", "系统总计",
+                                            diff_formula="手工数量 - (系统总计")
+
+    def test_pivot_sum(self):
+        """测试透视求和与 pivot_table 结果一致（空值、整数/浮点、字符串类型、稀疏组合）"""
+        from core import pivot
+
+        df = pd.DataFrame({
+            "__KEY__": ["B", "A", "B", None, "C", "D", "A"],
+            "状态": ["已发货", "已关闭", "已发货", "在途", None, "已发货", "已发货"],
+            "数量": [1, 2, 3, 4, 5, 6, 7],
+        })
+        frames = [df, df.assign(数量=df["数量"] * 0.5), df.assign(__KEY__=[3, 1, 3, 2, 2, 4, 1]),
+                  df.astype({"__KEY__": "string[pyarrow]", "状态": "string[pyarrow]"}), df.iloc[:0]]
+        for frame in frames:
+            expected = frame.pivot_table(index="__KEY__", columns="状态", values="数量",
+                                         aggfunc="sum", fill_value=0).reset_index()
+            for dense_limit in (pivot._DENSE_LIMIT, 0):
+                with mock.patch.object(pivot, "_DENSE_LIMIT", dense_limit):
+                    result = pivot.pivot_sum(frame, "__KEY__", "状态", "数量")
+                pd.testing.assert_frame_equal(result, expected)
+                pd.testing.assert_index_equal(result.columns, expected.columns)
+
+    def test_outer_join(self):
+        """测试按主键编号对齐合并与 merge(how="outer") 结果一致（缺失行、整数转浮点、主键重复）"""
+        from core.join import outer_join
+
+        manual = pd.DataFrame({"__KEY__": ["C", "A", "B"], "数量": [1, 2, 3]})
+        system = pd.DataFrame({"__KEY__": ["B", "D", "C"], "数量": [4, 5, 6], "已关闭": [0.5, 1.0, 2.0],
+                               "备注": ["x", "y", "z"], "状态": pd.array([1, None, 2], dtype="Int64")})
+        cases = [(manual, system), (manual, system.iloc[[2, 0]]), (manual.iloc[:0], system),
+                 (pd.concat([manual, manual.iloc[:1]]), system)]
+        for left, right in cases:
+            left_columns = {"数量": "手工数量"}
+            right_columns = {"数量": "系统总计", "已关闭": "已关闭", "备注": "备注", "状态": "状态"}
+            expected = left.rename(columns=left_columns).merge(
+                right.rename(columns=right_columns), on="__KEY__", how="outer")
+            result = outer_join(left, right, "__KEY__", left_columns, right_columns)
+            pd.testing.assert_frame_equal(result, expected)
+
+        result = CompareEngine.merge_and_compare(manual, system, "__KEY__", "数量", "数量")
+        self.assertEqual(result["__KEY__"].tolist(), ["A", "B", "C", "D"])
+        self.assertEqual(result["手工数量"].tolist(), [2, 3, 1, 0])
+        self.assertEqual(result["已关闭"].isna().tolist(), [True, False, False, False])
+        expected = ["manual_only", "diff", "diff", "system_only"]
+        self.assertEqual(result["比对状态"].tolist(), [COMPARE_STATUS[name] for name in expected])
+
+    def test_pipeline_keeps_inputs(self):
+        """测试对账各步骤不修改输入表，开启 copy-on-write 与否结果相同"""
+        import numpy as np
+        from core import KeyCodec
+
+        quantities = np.array([1.0, 2.0, 3.0, 4.0])
+        quantities.flags.writeable = False
+        manual = pd.DataFrame({"单号": [" A ", "B", "A", "C"], "数量": quantities,
+                               "状态": ["发货", "退仓", "发货", "发货"], "备注": list("wxyz")})
+        system = pd.DataFrame({"单号": ["A", "B", "D"], "数量": [4, 2, 1], "状态": ["已发", "已关", "已发"]})
+        manual_before, system_before = manual.copy(), system.copy()
+
+        def run():
+            codec = KeyCodec()
+            cleaned = CompareEngine.clean_column(manual, [{"column": "单号", "regexes": [r"\s+"]}])
+            manual_key = CompareEngine.make_key(cleaned, ["单号"], key_codec=codec)
+            system_key = CompareEngine.make_key(system, ["单号"], key_codec=codec)
+            manual_agg, _, _ = CompareEngine.aggregate_manual_with_pivot(
+                manual_key, "__KEY__", "数量", {"pivot_column": "状态", "out_values": ["发货"], "in_values": ["退仓"]},
+                filters=[("备注", "NOT_EQUALS", "z")])
+            system_agg, pivots = CompareEngine.aggregate_data(system_key, "__KEY__", ["数量"], pivot_col="状态")
+            self.assertNotIn("__KEY__", cleaned.columns)
+            return CompareEngine.merge_and_compare(manual_agg, system_agg, "__KEY__", "手工数量", "数量",
+                                                   pivot_values=pivots, key_codec=codec)
+
+        results = []
+        for copy_on_write in (False, True):
+            with pd.option_context("mode.copy_on_write", copy_on_write):
+                results.append(run())
+            pd.testing.assert_frame_equal(manual, manual_before)
+            pd.testing.assert_frame_equal(system, system_before)
+        pd.testing.assert_frame_equal(results[0], results[1])
+        self.assertEqual(results[0]["__KEY__"].tolist(), ["A", "B", "D"])
+        self.assertEqual(results[0]["手工数量"].tolist(), [4, -2, 0])
+
+    def test_reconcile_pipeline(self):
+        """测试对账流水线：结果与逐步调用一致，配置变化时只重算下游阶段"""
+        from core import CleanRuleError, FormulaError, KeyCodec, ReconcilePipeline
+
+        manual = pd.DataFrame({"单号": ["A ", "B", "A", "C"], "数量": [1, 2, 3, 4], "仓库": ["W1", "W1", "W2", "W1"]})
+        system = pd.DataFrame({"单号": ["A", "B", "D"], "数量": [4, 2, 1], "状态": ["已发", "已关", "已发"]})
+        config = {
+            "clean_rules": [{"column": "单号", "regexes": [r"\s+"]}],
+            "key_mappings": [{"manual": "单号", "system": "单号"}],
+            "manual_filters": [{"column": "仓库", "operator": "EQUALS", "value": "W1"}],
+            "value_mapping": {"manual": "数量", "system": "数量"},
+            "pivot_column": {"system": "状态"},
+        }
+
+        def expected(formula, warehouse="W1"):
+            codec = KeyCodec()
+            cleaned = CompareEngine.clean_column(manual, config["clean_rules"])
+            manual_agg, _ = CompareEngine.aggregate_data(
+                CompareEngine.make_key(cleaned, ["单号"], key_codec=codec), "__KEY__", ["数量"],
+                filters=[("仓库", "EQUALS", warehouse)])
+            system_agg, pivots = CompareEngine.aggregate_data(
+                CompareEngine.make_key(system, ["单号"], key_codec=codec), "__KEY__", ["数量"], pivot_col="状态")
+            return CompareEngine.merge_and_compare(manual_agg, system_agg, "__KEY__", "数量", "数量",
+                                                   diff_formula=formula, pivot_values=pivots, key_codec=codec)
+
+        pipeline = ReconcilePipeline()
+        out = pipeline.run(manual, system, config, "M - S")
+        pd.testing.assert_frame_equal(out.result, expected("M - S"))
+        self.assertEqual(pipeline.recomputed, ["clean", "key", "filter", "aggregate", "merge", "diff", "label"])
+        self.assertEqual(out.pivot_values, ["已关", "已发"])
+
+        out = pipeline.run(manual, system, config, lambda pivots: "M - " + pivots[1])
+        pd.testing.assert_frame_equal(out.result, expected("M - 已发"))
+        self.assertEqual(pipeline.recomputed, ["diff", "label"])
+
+        config["manual_filters"][0]["value"] = "W2"
+        out = pipeline.run(manual, system, config, "M - 已发")
+        pd.testing.assert_frame_equal(out.result, expected("M - 已发", "W2"))
+        self.assertEqual(pipeline.recomputed, ["filter", "aggregate", "merge", "diff", "label"])
+
+        pipeline.run(manual.copy(), system, config, "M - 已发")
+        self.assertEqual(pipeline.recomputed[0], "clean")
+
+        # 出错的阶段不缓存，下游缓存不受影响
+        with self.assertRaises(FormulaError):
+            pipeline.run(manual, system, config, "M - (S")
+        self.assertEqual(pipeline.run(manual, system, config, "M - 已发").result["差值"].tolist(),
+                         expected("M - 已发", "W2")["差值"].tolist())
+        with self.assertRaises(CleanRuleError):
+            pipeline.run(manual, system, {**config, "clean_rules": [{"column": "单号", "regexes": ["("]}]})
+
+    def test_extra_measures(self):
+        """测试附加指标：一次对账的结果与按每个指标单独对账一致，综合状态取最严重的状态"""
+        from core import ExportEngine, Measure, ReconcilePipeline, measures_from_config
+
+        manual = pd.DataFrame({"单号": ["A", "A", "B", "C", "B"], "类型": ["发货", "退仓", "发货", "发货", "其他"],
+                               "数量": [5, 1, 2, 3, 9], "金额": [50.0, 10.0, 20.0, 30.0, 90.0]})
+        system = pd.DataFrame({"单号": ["A", "B", "D", "B"], "状态": ["已发", "已发", "已发", None],
+                               "数": [4, 2, 7, 5], "额": [40.0, 25.0, 70.0, 50.0]})
+        base = {
+            "key_mappings": [{"manual": "单号", "system": "单号"}],
+            "pivot_column": {"system": "状态"},
+            "manual_pivot": {"pivot_column": "类型", "out_values": ["发货"], "in_values": ["退仓"]},
+        }
+        config = {**base, "value_mapping": {"manual": "数量", "system": "数"},
+                  "extra_measures": [{"name": "金额", "manual": "金额", "system": "额"},
+                                     {"name": "重复", "manual": "数量", "system": "额"}]}
+        self.assertEqual(measures_from_config(config), [Measure("金额", "金额", "额")])
+
+        for manual_pivot in (True, False):
+            cfg = config if manual_pivot else {k: v for k, v in config.items() if k != "manual_pivot"}
+            single = {k: v for k, v in cfg.items() if k != "extra_measures"}
+            result = ReconcilePipeline().run(manual, system, cfg).result
+            quantity = ReconcilePipeline().run(manual, system, single).result
+            amount = ReconcilePipeline().run(
+                manual, system, {**single, "value_mapping": {"manual": "金额", "system": "额"}}).result
+
+            pd.testing.assert_frame_equal(result[quantity.columns], quantity)
+            self.assertEqual(result["手工金额"].tolist(), amount["手工数量"].tolist())
+            self.assertEqual(result["系统金额"].tolist(), amount["系统总计"].tolist())
+            self.assertEqual(result["金额差值"].tolist(), amount["差值"].tolist())
+            self.assertEqual(result["金额状态"].tolist(), amount["比对状态"].tolist())
+            self.assertEqual(result.attrs["measures"], ["金额"])
+
+        # 出入库透视：A 的数量 5-1=4 与系统一致，金额 50-10=40 一致；B 的金额 20 与系统 25 不同
+        result = ReconcilePipeline().run(manual, system, config).result
+        self.assertEqual(result["比对状态"].tolist()[:2], [COMPARE_STATUS["match"]] * 2)
+        self.assertEqual(result["综合状态"].tolist()[:2], [COMPARE_STATUS["match"], COMPARE_STATUS["diff"]])
+        self.assertEqual(result["综合状态"].tolist()[2:], result["比对状态"].tolist()[2:])
+
+        # 数量系统缺失、金额手工缺失：两边都有数据，综合状态为差异
+        manual_agg = pd.DataFrame({"__KEY__": ["A", "B"], "数量": [5, 5], "金额": [0.0, 50.0]})
+        system_agg = pd.DataFrame({"__KEY__": ["A", "B"], "数量": [0, 0], "额": [100.0, 0.0]})
+        mixed = CompareEngine.merge_and_compare(manual_agg, system_agg, "__KEY__", "数量", "数量",
+                                                measures=[Measure("金额", "金额", "额")])
+        self.assertEqual(mixed["比对状态"].tolist(), [COMPARE_STATUS["manual_only"]] * 2)
+        self.assertEqual(mixed["金额状态"].tolist(), [COMPARE_STATUS["system_only"], COMPARE_STATUS["manual_only"]])
+        self.assertEqual(mixed["综合状态"].tolist(), [COMPARE_STATUS["diff"], COMPARE_STATUS["manual_only"]])
+
+        cols = ExportEngine._get_export_columns(result, ["已发"])
+        self.assertEqual(cols[-5:], ["系统金额", "手工金额", "金额差值", "金额状态", "综合状态"])
+
+    def test_clean_plan(self):
+        """测试清洗计划：逐字符删除的正则合并、结果与逐个正则执行一致、无效正则提前报告"""
+        from core import CleanRuleError, compile_clean_rules
+
+        rules = [
+            {"column": "订单号", "regexes": [r"[一-龥]+", r"[a-zA-Z]+$", r"[^\w\s]+", r"\-"]},
+            {"column": "订单号", "mode": "替换为", "regexes": ["^0+"], "replace": "#"},
+            {"column": "物料", "mode": "保留匹配", "regex": r"\d+"},
+            {"column": "不存在", "regexes": ["x"]},
+        ]
+        plan = compile_clean_rules(rules)
+        self.assertIs(compile_clean_rules([dict(rule) for rule in rules]), plan)
+        steps = dict(plan.columns)["订单号"]
+        self.assertEqual([step.regexes for step in steps],
+                         [(r"[一-龥]+",), (r"[a-zA-Z]+$",), (r"[^\w\s]+", r"\-"), ("^0+",)])
+
+        df = pd.DataFrame({
+            "订单号": ["007-A 中文", "12AB中文", " x-1 ", None, 5],
+            "物料": ["SKU12", "无", "A1B2", "3", None],
+        })
+        expected = pd.DataFrame({
+            "订单号": ["#7", "12", "x1", "", "5"],
+            "物料": ["12", "", "1", "3", ""],
+        })
+        pd.testing.assert_frame_equal(CompareEngine.clean_column(df, rules), expected)
+        arrow = df.astype({"订单号": "string[pyarrow]"})
+        result = CompareEngine.clean_column(arrow, plan)
+        self.assertEqual(result["订单号"].dtype, arrow["订单号"].dtype)
+        self.assertEqual(result["订单号"].tolist(), ["#7", "12", "x1", "NA", "5"])
+
+        # 保留匹配的正则自带分组时仍保留整个匹配
+        grouped = pd.DataFrame({"单号": ["到货PO123-1", "PO9", "无", None]})
+        for regex in (r"PO(\d+)", r"P(?P<o>O)(\d+)"):
+            result = CompareEngine.clean_column(grouped, [{"column": "单号", "mode": "保留匹配", "regexes": [regex]}])
+            self.assertEqual(result["单号"].tolist(), ["PO123", "PO9", "", ""], msg=regex)
+
+        # 某一步的结果不是单列时跳过该步（打印错误），其余步骤照常执行
+        from unittest import mock
+        from core import clean_plan
+        apply_step = clean_plan._apply_step
+        with mock.patch.object(clean_plan, "_apply_step", side_effect=lambda values, step: (
+                values.to_frame().assign(x=1) if step.mode == "保留匹配" else apply_step(values, step))):
+            result = CompareEngine.clean_column(grouped, [
+                {"column": "单号", "mode": "保留匹配", "regexes": [r"PO\d+"]},
+                {"column": "单号", "mode": "替换为", "regexes": ["-1$"], "replace": ""},
+            ])
+        self.assertEqual(result["单号"].tolist()[:3], ["到货PO123", "PO9", "无"])
+
+        with self.assertRaises(CleanRuleError):
+            compile_clean_rules([{"column": "订单号", "regexes": ["[a-"]}])
+
+    def test_filter_plan(self):
+        """测试筛选计划：各操作符合并为一个掩码，手工表透视同样生效"""
+        from core import FilterPlan
+
+        df = pd.DataFrame({
+            "单号": ["SO1", "SO2", "SO3", "SO4", "SO5"],
+            "状态": ["发货", "退货", "发货", "退仓", None],
+            "备注": ["a+b", "(x)", "a+b；c", "d", "e"],
+            "数量": [10, "5", 0, 20, 3],
+        })
+        cases = {
+            ("状态", "EQUALS", "发货"): ["SO1", "SO3"],
+            ("状态", "NOT_EQUALS", "发货"): ["SO2", "SO4", "SO5"],
+            ("备注", "CONTAINS", "a+b, (x)"): ["SO1", "SO2", "SO3"],
+            ("备注", "NOT_CONTAINS", "a+b；(x)"): ["SO4", "SO5"],
+            ("状态", "IN_LIST", "发货，退仓"): ["SO1", "SO3", "SO4"],
+            ("状态", "NOT_IN_LIST", "发货;退仓"): ["SO2", "SO5"],
+            ("数量", "GREATER", "4"): ["SO1", "SO2", "SO4"],
+            ("数量", "LESS", 5): ["SO3", "SO5"],
+            ("不存在", "EQUALS", "x"): ["SO1", "SO2", "SO3", "SO4", "SO5"],
+        }
+        for condition, expected in cases.items():
+            self.assertEqual(FilterPlan([condition]).apply(df)["单号"].tolist(), expected, msg=condition)
+            arrow = df.astype({"状态": "string[pyarrow]", "备注": "string[pyarrow]"})
+            self.assertEqual(FilterPlan([condition]).apply(arrow)["单号"].tolist(), expected, msg=condition)
+
+        plan = FilterPlan.from_config([
+            {"column": "状态", "operator": "NOT_IN_LIST", "value": "退仓"},
+            {"column": "数量", "operator": "GREATER", "value": "1"},
+        ])
+        self.assertEqual(plan.mask(df).tolist(), [True, True, False, False, True])
+        self.assertIs(FilterPlan.of(plan), plan)
+
+        # 手工表透视聚合支持全部操作符
+        keyed = CompareEngine.make_key(df.assign(数量=[10, 5, 1, 20, 3]), ["单号"])
+        pivot_df, _, _ = CompareEngine.aggregate_manual_with_pivot(
+            keyed, "__KEY__", "数量", {"pivot_column": "状态", "out_values": ["发货"], "in_values": ["退货"]},
+            filters=plan
+        )
+        self.assertEqual(pivot_df["__KEY__"].tolist(), ["SO1", "SO2"])
 
 class TestExcelUtils(unittest.TestCase):
     """测试Excel工具"""
@@ -155,6 +579,310 @@ class TestExcelUtils(unittest.TestCase):
         self.assertEqual(len(df), 3)
         self.assertIn("A", df.columns)
         self.assertIn("B", df.columns)
+    
+    @unittest.skipUnless(sheet_cache.is_cache_available(), "需要pyarrow")
+    def test_load_excel_cache(self):
+        """测试Sheet缓存命中"""
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch("utils.sheet_cache.get_cache_dir", return_value=Path(cache_dir)):
+            first = load_excel(self.test_file, "TestSheet")
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            
+            # 命中缓存时不应再解析Excel
+            with mock.patch("utils.excel_utils._call_readers", side_effect=AssertionError("缓存未命中")):
+                second = load_excel(self.test_file, "TestSheet")
+            pd.testing.assert_frame_equal(first, second)
+            
+            # 不同表头行使用独立缓存
+            load_excel(self.test_file, "TestSheet", header_row=1)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            
+            # 按列投影时直接从完整Sheet的缓存中读取所需列
+            with mock.patch("utils.excel_utils._call_readers",
+                            wraps=excel_utils._call_readers) as readers:
+                projected = load_excel(self.test_file, "TestSheet", usecols=["B"])
+            self.assertEqual([c.args[1] for c in readers.call_args_list], ["read_header"])
+            pd.testing.assert_frame_equal(projected, first[["B"]])
+            
+            # 文件未变化时只哈希一次（自动表头 + 按列投影要生成三个缓存键）
+            sheet_cache._hash_memo.clear()
+            with mock.patch("utils.sheet_cache._hash_file", wraps=sheet_cache._hash_file) as hashed:
+                load_excel(self.test_file, "TestSheet", header_row="auto", usecols=["B"])
+                load_excel(self.test_file, "TestSheet", header_row="auto", usecols=["B"])
+                self.assertEqual(hashed.call_count, 1)
+                stat = os.stat(self.test_file)
+                os.utime(self.test_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+                load_excel(self.test_file, "TestSheet", header_row="auto", usecols=["B"])
+                self.assertEqual(hashed.call_count, 2)
+    
+    def test_load_excel_usecols(self):
+        """测试按列投影加载"""
+        full = load_excel(self.test_file, "TestSheet", use_cache=False)
+        df = load_excel(self.test_file, "TestSheet", use_cache=False, usecols=["B", "不存在"])
+        self.assertEqual(list(df.columns), ["B"])
+        self.assertEqual(get_all_columns(df), ["A", "B"])
+        pd.testing.assert_series_equal(df["B"], full["B"])
+        
+        # 没有任何匹配列时加载全部列
+        df = load_excel(self.test_file, "TestSheet", use_cache=False, usecols=["不存在"])
+        self.assertEqual(list(df.columns), ["A", "B"])
+    
+    @unittest.skipUnless(sheet_cache.is_cache_available(), "需要pyarrow")
+    def test_load_excel_usecols_cache(self):
+        """测试按列投影加载：未缓存与已缓存完整Sheet时去除的全空行相同"""
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch("utils.sheet_cache.get_cache_dir", return_value=Path(tmp_dir)):
+            path = os.path.join(tmp_dir, "blank_rows.xlsx")
+            pd.DataFrame({"A": [1, 2, 3, 4], "B": ["x", None, None, "y"]}).to_excel(path, index=False)
+            
+            cold = load_excel(path, "Sheet1", usecols=["B"])
+            self.assertEqual(cold["B"].tolist(), ["x", "y"])
+            
+            sheet_cache.clear_sheet_cache()
+            self.assertEqual(len(load_excel(path, "Sheet1")), 4)
+            with mock.patch("utils.excel_utils._call_readers",
+                            wraps=excel_utils._call_readers) as readers:
+                warm = load_excel(path, "Sheet1", usecols=["B"])
+            self.assertNotIn("read_sheet", [c.args[1] for c in readers.call_args_list])
+            pd.testing.assert_frame_equal(warm, cold)
+    
+    def test_load_tables_parallel(self):
+        """测试并行加载结果与直接加载一致"""
+        from utils.parallel_loader import load_tables_parallel
+        
+        jobs = {
+            "manual": {"filepath": self.test_file, "sheet_name": "TestSheet", "use_cache": False},
+            "system": {"filepath": self.test_file, "sheet_name": "TestSheet", "use_cache": False,
+                       "usecols": ["B"]},
+        }
+        events = []
+        results = load_tables_parallel(jobs, progress=lambda name, status: events.append((name, status)))
+        self.assertEqual(list(results), ["manual", "system"])
+        pd.testing.assert_frame_equal(results["manual"], load_excel(**jobs["manual"]))
+        pd.testing.assert_frame_equal(results["system"], load_excel(**jobs["system"]))
+        self.assertEqual(get_all_columns(results["system"]), ["A", "B"])
+        self.assertEqual(sorted(events), sorted([
+            ("manual", "started"), ("system", "started"),
+            ("manual", "finished"), ("system", "finished"),
+        ]))
+    
+    def test_table_store(self):
+        """测试内存映射表存储：零复制打开、attrs 保留、引用计数删除文件"""
+        import gc
+        import numpy as np
+        from utils.table_store import TableStore
+        
+        df = pd.DataFrame({"数量": np.arange(5, dtype="int64"), "单号": list("abcde")})
+        df.attrs["all_columns"] = ["数量", "单号", "备注"]
+        with tempfile.TemporaryDirectory() as tmp:
+            store = TableStore(Path(tmp) / "session")
+            ref = store.put(df)
+            self.assertEqual(ref.rows, 5)
+            
+            opened = store.open(ref)
+            pd.testing.assert_frame_equal(opened, df)
+            self.assertEqual(get_all_columns(opened), ["数量", "单号", "备注"])
+            # 数值列直接引用映射内存
+            self.assertFalse(opened["数量"].to_numpy().flags.writeable)
+            self.assertEqual(store.refcount(ref), 2)
+            
+            # 仍有打开的表时 discard 不删除文件
+            store.discard(ref)
+            self.assertTrue(os.path.exists(ref.path))
+            del opened
+            gc.collect()
+            self.assertEqual(store.refcount(ref), 0)
+            self.assertFalse(os.path.exists(ref.path))
+            with self.assertRaises(KeyError):
+                store.open(ref)
+            
+            store.close()
+            self.assertFalse(store.directory.exists())
+    
+    def test_aggregate_stream(self):
+        """测试分块聚合与整表 make_key + aggregate_data 一致"""
+        rows = [["订单号", "仓库", "状态", "数量", "编号"]]
+        for i in range(40):
+            rows.append([
+                f"SO{i % 7}" if i % 5 else 1000 + i % 3,
+                f"W{i % 3}",
+                ["已发货", "已关闭", None][i % 3],
+                i % 9 if i % 11 else ("abc" if i > 20 else None),
+                # 整数列在后面的块中才出现空值，整列为浮点（主键文本为 "1.0"）
+                i % 4 if i % 13 or i < 30 else None,
+            ])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stream.xlsx")
+            pd.DataFrame(rows[1:], columns=rows[0]).to_excel(path, index=False, sheet_name="明细")
+            full = load_excel(path, "明细", use_cache=False)
+            
+            chunks = list(iter_excel_chunks(path, "明细", chunk_rows=6))
+            self.assertEqual(len(chunks), 7)
+            self.assertEqual(list(pd.concat(chunks).index), list(full.index))
+            
+            cases = [
+                (["订单号"], ["数量"], None, None),
+                (["订单号", "编号"], ["数量"], "状态", [("仓库", "NOT_EQUALS", "W1")]),
+                (["编号"], ["数量"], None, [("编号", "EQUALS", "1.0"), ("数量", "GREATER", "2")]),
+                (["订单号"], [], None, [("仓库", "IN_LIST", "W0,W2")]),
+            ]
+            for key_cols, value_cols, pivot_col, filters in cases:
+                expected, expected_pivots = CompareEngine.aggregate_data(
+                    CompareEngine.make_key(full, key_cols), "__KEY__", value_cols, pivot_col, filters
+                )
+                actual, pivots = CompareEngine.aggregate_stream(
+                    iter_excel_chunks(path, "明细", chunk_rows=6), key_cols, value_cols, pivot_col, filters
+                )
+                self.assertEqual(pivots, expected_pivots)
+                pd.testing.assert_frame_equal(
+                    actual.reset_index(drop=True), expected.reset_index(drop=True)
+                )
+    
+    def test_load_consolidated(self):
+        """测试多文件按列名对齐合并，并追加来源列"""
+        from utils import load_consolidated
+        from config import SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with pd.ExcelWriter(os.path.join(tmp, "仓库A.xlsx")) as writer:
+                pd.DataFrame({"订单号": ["A1", "A2"], "数量": [1, 2]}).to_excel(
+                    writer, sheet_name="明细", index=False)
+                pd.DataFrame({"合计": [3]}).to_excel(writer, sheet_name="汇总", index=False)
+            pd.DataFrame({"数量": [5], "订单号": ["B1"], "备注": ["加急"]}).to_excel(
+                os.path.join(tmp, "仓库B.xlsx"), sheet_name="明细", index=False)
+            pd.DataFrame({"订单号": ["C1"], "数量": [7]}).to_csv(
+                os.path.join(tmp, "仓库C.csv"), index=False)
+            # 没有匹配Sheet的文件和 Excel 临时文件跳过
+            pd.DataFrame({"订单号": ["D1"]}).to_excel(
+                os.path.join(tmp, "仓库D.xlsx"), sheet_name="其他", index=False)
+            Path(tmp, "~$仓库A.xlsx").write_bytes(b"")
+
+            events = []
+            df = load_consolidated(tmp, "明细", progress=lambda done, total: events.append((done, total)))
+            self.assertEqual(events, [(1, 3), (2, 3), (3, 3)])
+            self.assertEqual(list(df.columns),
+                             ["订单号", "数量", "备注", SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN])
+            self.assertEqual(list(df["订单号"]), ["A1", "A2", "B1", "C1"])
+            self.assertEqual(list(df["数量"]), [1, 2, 5, 7])
+            self.assertEqual(list(df[SOURCE_FILE_COLUMN]), ["仓库A.xlsx"] * 2 + ["仓库B.xlsx", "仓库C.csv"])
+            self.assertEqual(list(df[SOURCE_SHEET_COLUMN]), ["明细"] * 3 + ["仓库C"])
+            self.assertIs(df["备注"].iloc[0], pd.NA)
+
+            # 通配符 + 多个Sheet，按列投影加载
+            df = load_consolidated(os.path.join(tmp, "仓库A*.xlsx"), "*", usecols=["合计"])
+            self.assertEqual(list(df[SOURCE_SHEET_COLUMN]), ["明细", "明细", "汇总"])
+            self.assertEqual(get_all_columns(df),
+                             ["订单号", "数量", "合计", SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN])
+
+            with self.assertRaises(ValueError):
+                load_consolidated(os.path.join(tmp, "*.parquet"))
+
+    def test_column_profile(self):
+        """测试列概况：低基数列的唯一值与缓存，高基数列提前停止"""
+        from utils import column_profile
+        from utils.column_profile import get_profiles, profile_column, unique_values
+
+        n = 20000
+        df = pd.DataFrame({
+            "订单号": [f"SO{i:06d}" for i in range(n)],
+            "状态": pd.Series(["已发货", "已关闭", None, "待审核"] * (n // 4), dtype=object),
+            "混合": [1, "A", 2.5, "B"] * (n // 4),
+        })
+        profiles = get_profiles(df)
+        status = profiles["状态"]
+        self.assertEqual((status.null_count, status.cardinality, status.cardinality_exact),
+                         (n // 4, 3, True))
+        self.assertEqual(status.uniques, ["已关闭", "已发货", "待审核"])
+        self.assertEqual(status.top_values[0][1], n // 4)
+        self.assertEqual(profiles["混合"].uniques, [1, 2.5, "A", "B"])
+
+        orders = profiles["订单号"]
+        self.assertIsNone(orders.uniques)
+        self.assertFalse(orders.cardinality_exact)
+        self.assertEqual(orders.cardinality, n)
+        self.assertEqual(list(unique_values(profiles)), ["状态", "混合"])
+
+        # 同一个表只统计一次，表释放后缓存删除
+        with mock.patch.object(column_profile, "profile_table") as recount:
+            self.assertIs(get_profiles(df), profiles)
+        recount.assert_not_called()
+        key = id(df)
+        del df, profiles
+        self.assertNotIn(key, column_profile._profiles)
+
+        # 开头一段之后才出现的值
+        late = pd.Series([0] * 9000 + list(range(200)))
+        self.assertEqual(profile_column(late).cardinality, 200)
+        self.assertTrue(profile_column(late).cardinality_exact)
+
+    def test_clean_dataframe(self):
+        """测试清理只处理字符串单元格，保留其他类型"""
+        from utils.excel_utils import clean_dataframe
+        
+        df = pd.DataFrame({
+            " 编号 ": [" A01 ", 1001, None, "nan", 2.5, "A01"],
+            "数量": [1, 2, 3, 4, 5, 6],
+            "备注": ["  ", "x", float("nan"), "x ", "nan", None],
+        })
+        df = clean_dataframe(df)
+        self.assertEqual(list(df.columns), ["编号", "数量", "备注"])
+        self.assertEqual(df["编号"].tolist()[:2], ["A01", 1001])
+        self.assertIs(df["编号"].iloc[2], pd.NA)
+        self.assertIs(df["编号"].iloc[3], pd.NA)
+        self.assertEqual(df["编号"].iloc[4], 2.5)
+        self.assertEqual(df["数量"].dtype, "int64")
+        self.assertEqual(df["备注"].tolist()[:2], ["", "x"])
+        self.assertEqual(df["备注"].iloc[3], "x")
+        for i in (2, 4, 5):
+            self.assertIs(df["备注"].iloc[i], pd.NA)
+        # 相同字符串共用一个对象
+        self.assertIs(df["编号"].iloc[0], df["编号"].iloc[5])
+        self.assertIs(df["备注"].iloc[1], df["备注"].iloc[3])
+    
+    @unittest.skipUnless(sheet_cache.is_cache_available(), "需要pyarrow")
+    def test_cache_mixed_columns(self):
+        """测试混合类型列在缓存中原样保存"""
+        from utils.excel_utils import clean_dataframe
+        
+        df = clean_dataframe(pd.DataFrame({
+            "编号": ["A01", 1001, None, True, pd.Timestamp("2025-01-02")],
+            "名称": ["x", "y", None, "x", "z"],
+        }))
+        restored = sheet_cache.arrow_to_dataframe(sheet_cache.dataframe_to_arrow(df))
+        pd.testing.assert_frame_equal(restored, df)
+        self.assertEqual([type(v) for v in restored["编号"]], [type(v) for v in df["编号"]])
+    
+    @unittest.skipUnless(sheet_cache.is_cache_available(), "需要pyarrow")
+    def test_to_arrow_strings(self):
+        """测试纯文本列转为 string[pyarrow]，混合列保持对象类型"""
+        from utils.excel_utils import to_arrow_strings
+        
+        df = to_arrow_strings(pd.DataFrame({
+            "文本": ["a", pd.NA, "b"],
+            "混合": ["a", 1, pd.NA],
+            "数量": [1, 2, 3],
+        }))
+        self.assertEqual(str(df["文本"].dtype), "string")
+        self.assertEqual(df["文本"].dtype.storage, "pyarrow")
+        self.assertEqual(df["混合"].dtype, object)
+        self.assertEqual(df["数量"].dtype, "int64")
+    
+    def test_get_template_columns(self):
+        """测试提取配置引用的列"""
+        config = {
+            "key_mappings": [{"manual": "订单", "system": "单号"}],
+            "value_mapping": {"manual": "数量", "system": "数量"},
+            "pivot_column": {"system": "状态"},
+            "manual_pivot": {"pivot_column": "类型"},
+            "manual_filters": [{"column": "仓库", "operator": "等于", "value": "A"}],
+            "system_filters": [],
+            "clean_rules": [{"column": "订单", "mode": "删除匹配", "regexes": []}],
+        }
+        self.assertEqual(get_template_columns(config), {
+            "manual": ["订单", "数量", "类型", "仓库"],
+            "system": ["单号", "数量", "状态"],
+        })
+        self.assertEqual(get_template_columns({}), {"manual": [], "system": []})
 
 
 class TestIntegration(unittest.TestCase):
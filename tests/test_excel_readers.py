@@ -0,0 +1,374 @@
+"""
+读取后端一致性测试 - 流式xlsx读取器与 pandas + openpyxl 输出对比
+"""
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+from unittest import mock
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.excel_utils import (
+    EXCEL_READERS, ExcelReader, clean_dataframe, detect_header_row, get_reader_chain,
+    get_sheet_names, load_excel,
+)
+from utils import flat_reader, xlsx_reader
+from utils.cancellation import LoadCancelled, cancel_scope
+
+
+# 手写的sheet XML：内联字符串、公式字符串、错误值、无坐标单元格、注音文本
+HANDMADE_SHEET = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetData>
+<row r="1"><c r="A1" t="inlineStr"><is><t>订单号</t></is></c><c r="B1" t="s"><v>0</v></c><c r="C1" t="inlineStr"><is><t xml:space="preserve"> 状态 </t></is></c></row>
+<row r="2"><c r="A2" t="str"><v>A001</v></c><c r="B2"><v>10</v></c><c r="C2" t="e"><v>#N/A</v></c></row>
+<row r="4"><c t="s"><v>1</v></c><c><v>2.5</v></c><c t="b"><v>1</v></c></row>
+<row><c r="A5" t="inlineStr"><is><r><t>A</t></r><r><t>003</t></r><rPh sb="0" eb="1"><t>yomi</t></rPh></is></c><c r="C5"><v>1E3</v></c></row>
+<row r="6"><c r="A6" t="inlineStr"/><c r="B6"/></row>
+</sheetData>
+</worksheet>"""
+
+HANDMADE_STRINGS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="2" uniqueCount="2">
+<si><t>数量</t></si>
+<si><r><t>A0</t></r><r><t>02</t></r><rPh sb="0" eb="1"><t>x</t></rPh></si>
+</sst>"""
+
+HANDMADE_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+ xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="数据" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+HANDMADE_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="/xl/sharedStrings.xml"/>
+</Relationships>"""
+
+HANDMADE_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+HANDMADE_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+</Types>"""
+
+
+def read_with(reader: str, filepath: str, sheet_name: str, header_row: int = 0,
+              skip_rows=None, columns=None) -> pd.DataFrame:
+    """使用指定后端读取Sheet"""
+    return EXCEL_READERS[reader][1](filepath, sheet_name, header_row, skip_rows, columns)
+
+
+class TestFastReaderConformance(unittest.TestCase):
+    """流式读取器输出必须与 openpyxl 后端逐单元格一致"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.generated = os.path.join(cls.tmpdir.name, "generated.xlsx")
+        cls.handmade = os.path.join(cls.tmpdir.name, "handmade.xlsx")
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "明细"
+        ws.append(["报表标题"])
+        ws.append([])
+        ws.append(["订单号", " 料号 ", "数量", "金额", "日期", "时间", "标记", "备注", None, "状态"])
+        rows = [
+            ["A001", "SKU1", 100, 12.5, datetime.datetime(2025, 1, 2), datetime.time(8, 30), True, "  带空格  ", None, "已发货"],
+            ["A002", 123, 200.0, None, datetime.date(2025, 3, 4), None, False, "NA", None, "已关闭"],
+            [None, None, None, None, None, None, None, None, None, None],
+            ["A003", "SKU3", "abc", 1e-3, None, None, None, "nan", None, None],
+            [1001, "SKU4", -5, 3, datetime.datetime(1900, 2, 1), None, None, "", None, "已发货"],
+        ]
+        for row in rows:
+            ws.append(row)
+        ws["D9"] = "=B9*2"
+        ws["K5"] = CellRichText(["富", TextBlock(InlineFont(b=True), "文本")])
+        ws["C12"] = 7
+
+        other = wb.create_sheet("汇总")
+        other.append(["键", "值"])
+        other.append(["x", 1])
+        wb.create_sheet("空表")
+        wb.save(cls.generated)
+
+        with zipfile.ZipFile(cls.handmade, "w") as zf:
+            zf.writestr("[Content_Types].xml", HANDMADE_CONTENT_TYPES)
+            zf.writestr("_rels/.rels", HANDMADE_ROOT_RELS)
+            zf.writestr("xl/workbook.xml", HANDMADE_WORKBOOK)
+            zf.writestr("xl/_rels/workbook.xml.rels", HANDMADE_WORKBOOK_RELS)
+            zf.writestr("xl/worksheets/sheet1.xml", HANDMADE_SHEET)
+            zf.writestr("xl/sharedStrings.xml", HANDMADE_STRINGS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def assert_same(self, filepath, sheet_name, header_row=0, skip_rows=None):
+        expected = read_with("openpyxl", filepath, sheet_name, header_row, skip_rows)
+        actual = read_with("fast", filepath, sheet_name, header_row, skip_rows)
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_sheet_names(self):
+        """测试Sheet名称与openpyxl一致"""
+        for path in (self.generated, self.handmade):
+            self.assertEqual(
+                EXCEL_READERS["fast"][0](path),
+                EXCEL_READERS["openpyxl"][0](path),
+            )
+
+    def test_generated_workbook(self):
+        """测试各种单元格类型、空行、表头偏移"""
+        for header_row in (0, 2, 3):
+            self.assert_same(self.generated, "明细", header_row)
+        self.assert_same(self.generated, "明细", 0, skip_rows=2)
+        self.assert_same(self.generated, "汇总")
+        self.assert_same(self.generated, "空表")
+
+    def test_handmade_workbook(self):
+        """测试内联字符串、富文本、错误值、缺失坐标"""
+        self.assert_same(self.handmade, "数据")
+        self.assert_same(self.handmade, "数据", 1)
+
+    def test_fixture_files(self):
+        """测试仓库自带的测试数据"""
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        for name in sorted(os.listdir(data_dir)):
+            if not name.endswith(".xlsx"):
+                continue
+            path = os.path.join(data_dir, name)
+            for sheet in get_sheet_names(path):
+                self.assert_same(path, sheet)
+
+    def test_column_projection(self):
+        """测试只读取部分列时与openpyxl usecols一致"""
+        for header_row, columns in ((2, [0, 2, 4]), (2, [9]), (0, [1]), (2, [3, 10])):
+            expected = read_with("openpyxl", self.generated, "明细", header_row, columns=columns)
+            actual = read_with("fast", self.generated, "明细", header_row, columns=columns)
+            # 空表头的 Unnamed 序号不同，load_excel 会按完整表头重命名
+            actual.columns = expected.columns
+            # 投影列全空的行被提前裁掉，这里与 clean_dataframe 一样去掉全空行后比较
+            pd.testing.assert_frame_equal(
+                actual.dropna(how="all"), expected.dropna(how="all")
+            )
+
+    def test_read_header(self):
+        """测试只读取表头"""
+        for header_row in (0, 2):
+            full = list(read_with("openpyxl", self.generated, "明细", header_row).columns)
+            expected = EXCEL_READERS["openpyxl"][2](self.generated, "明细", header_row, None)
+            actual = EXCEL_READERS["fast"][2](self.generated, "明细", header_row, None)
+            self.assertEqual(actual, expected)
+            # 表头行之后更宽的数据列不在表头扫描范围内
+            self.assertEqual(full[:len(actual)], actual)
+
+    def test_read_head(self):
+        """测试读取前N行（表头检测）"""
+        for nrows in (1, 4, 20):
+            # pandas 会多读一行来确定列宽，多出的列全为空
+            pd.testing.assert_frame_equal(
+                EXCEL_READERS["fast"].read_head(self.generated, "明细", nrows).dropna(axis=1, how="all"),
+                EXCEL_READERS["openpyxl"].read_head(self.generated, "明细", nrows).dropna(axis=1, how="all"),
+            )
+        self.assertEqual(detect_header_row(self.generated, "明细"), 2)
+
+    def test_workbook_handle_reused(self):
+        """测试同一文件只打开一次，文件修改后重新打开"""
+        xlsx_reader.clear_workbook_cache()
+        with mock.patch.object(xlsx_reader, "XlsxWorkbook", wraps=xlsx_reader.XlsxWorkbook) as opened:
+            get_sheet_names(self.generated)
+            detect_header_row(self.generated, "明细")
+            read_with("fast", self.generated, "明细", 2)
+            read_with("fast", self.generated, "汇总")
+            self.assertEqual(opened.call_count, 1)
+
+            stat = os.stat(self.generated)
+            os.utime(self.generated, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+            get_sheet_names(self.generated)
+            self.assertEqual(opened.call_count, 2)
+
+    def test_max_rows(self):
+        """测试只读取前N行"""
+        def trim(rows):
+            return [[v for v in row if v != ""] for row in rows]
+
+        full = xlsx_reader.read_sheet_rows(self.generated, "明细")
+        head = xlsx_reader.read_sheet_rows(self.generated, "明细", max_rows=4)
+        self.assertEqual(len(head), 4)
+        self.assertEqual(trim(head), trim(full[:4]))
+
+    def test_fallback_to_openpyxl(self):
+        """测试流式读取器失败时自动回退"""
+        def broken(*args):
+            raise xlsx_reader.XlsxFormatError("x")
+
+        with mock.patch.dict(EXCEL_READERS, {"fast": ExcelReader(broken, broken, broken, broken)}):
+            self.assertIn("明细", get_sheet_names(self.generated))
+            df = load_excel(self.generated, "汇总", use_cache=False)
+        self.assertEqual(list(df.columns), ["键", "值"])
+
+    def test_auto_header_row(self):
+        """测试自动表头在加载的同一次解析中检测，结果与指定表头行一致并写入缓存"""
+        from pathlib import Path
+        from utils import excel_utils, sheet_cache
+        from utils.excel_utils import HEADER_AUTO
+
+        for skip_rows, usecols in ((None, None), (None, ["数量", "状态"]), (1, None)):
+            expected = load_excel(self.generated, "明细", 2 - (skip_rows or 0), skip_rows,
+                                  use_cache=False, usecols=usecols)
+            with mock.patch.object(excel_utils, "_call_readers", side_effect=AssertionError("多次解析")):
+                df = load_excel(self.generated, "明细", HEADER_AUTO, skip_rows,
+                                use_cache=False, usecols=usecols)
+            self.assertEqual(df.attrs.pop("header_row"), 2 - (skip_rows or 0))
+            pd.testing.assert_frame_equal(df, expected)
+
+        # 不支持 read_rows 的后端：先读取前几行检测，再按列加载
+        with mock.patch.object(excel_utils, "get_reader_chain", return_value=["openpyxl"]):
+            df = load_excel(self.generated, "明细", HEADER_AUTO, use_cache=False, usecols=["数量"])
+        self.assertEqual((df.attrs["header_row"], list(df.columns)), (2, ["数量"]))
+
+        if not sheet_cache.is_cache_available():
+            return
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch("utils.sheet_cache.get_cache_dir", return_value=Path(cache_dir)):
+            first = load_excel(self.generated, "明细", HEADER_AUTO)
+            with mock.patch.object(excel_utils, "_call_readers", side_effect=AssertionError("缓存未命中")), \
+                    mock.patch.object(xlsx_reader, "read_sheet_rows", side_effect=AssertionError("缓存未命中")):
+                second = load_excel(self.generated, "明细", HEADER_AUTO)
+            pd.testing.assert_frame_equal(first, second)
+            self.assertEqual(second.attrs["header_row"], 2)
+
+    def test_cancellation(self):
+        """测试取消后逐行读取中断，且不回退到其他后端"""
+        path = os.path.join(self.tmpdir.name, "long.xlsx")
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("长表")
+        for i in range(3000):
+            ws.append([f"SO{i}", i])
+        wb.save(path)
+
+        cancel = threading.Event()
+        read = 0
+        with cancel_scope(cancel), self.assertRaises(LoadCancelled):
+            for _ in xlsx_reader.iter_sheet_rows(path, "长表"):
+                read += 1
+                if read == 1500:
+                    cancel.set()
+        self.assertEqual(read, 2047)
+
+        fallback = mock.Mock(side_effect=AssertionError("不应回退"))
+        with cancel_scope(cancel), \
+                mock.patch.dict(EXCEL_READERS, {"openpyxl": ExcelReader(*[fallback] * 4)}), \
+                self.assertRaises(LoadCancelled):
+            load_excel(path, "长表", use_cache=False)
+        fallback.assert_not_called()
+
+        # 离开取消范围后不受影响
+        self.assertEqual(len(load_excel(path, "长表", use_cache=False)), 2999)
+
+
+# 含标题行、空行、重复/空列名、多行文本、缺失值标记、布尔、十六进制等
+MESSY_CSV_LINES = [
+    "报表标题,,,,,,,,,",
+    "",
+    "订单号,数量,金额,日期,时间,标记,备注,数量,,编码",
+    'A001,10,12.5,2025-01-02,08:30,True," 带空格 ",1,,007',
+    "A002,,NA,2025-01-03,09:00:00,false,nan,2,,008",
+    "",
+    'A003,abc,1e3,,,TRUE,"多\n行",3,,',
+    "1001, 12 ,-4,2025/1/4,x,,None,4,,009",
+    "A004,+5,inf,2025-01-05 10:00:00,,False,null,5,,0x1",
+    'A005,7,"1,234",,,,<NA>,6,,12',
+    "",
+]
+
+
+@unittest.skipUnless(flat_reader.has_pyarrow(), "需要pyarrow")
+class TestFlatFileReaders(unittest.TestCase):
+    """CSV/TSV 的 pyarrow 快速路径与 csv 模块清理后一致，Parquet 按列加载"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.files = []
+        text = "\n".join(MESSY_CSV_LINES)
+        for name, encoding in (("utf8.csv", "utf-8"), ("bom.csv", "utf-8-sig"),
+                               ("gbk.csv", "gbk"), ("tab.tsv", "utf-8")):
+            path = os.path.join(cls.tmpdir.name, name)
+            content = text
+            if name.endswith(".tsv"):
+                content = text.replace('"1,234"', "1;234").replace(",", "\t").replace("1;234", "1,234")
+            with open(path, "w", encoding=encoding, newline="") as f:
+                f.write(content)
+            cls.files.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_arrow_matches_csv_module(self):
+        """测试各种编码、表头偏移、列投影下两条路径一致"""
+        for path in self.files:
+            self.assertEqual(get_reader_chain(path), ["arrow_csv", "csv"])
+            self.assertEqual(get_sheet_names(path), [os.path.splitext(os.path.basename(path))[0]])
+            for header_row, skip_rows, columns in ((2, None, None), (0, 2, None), (2, None, [0, 1, 9]), (0, None, None)):
+                expected = clean_dataframe(EXCEL_READERS["csv"].read_sheet(path, "", header_row, skip_rows, columns))
+                actual = clean_dataframe(EXCEL_READERS["arrow_csv"].read_sheet(path, "", header_row, skip_rows, columns))
+                pd.testing.assert_frame_equal(actual, expected)
+
+    def test_load_csv(self):
+        """测试通过 load_excel 加载CSV"""
+        path = self.files[2]
+        sheet = get_sheet_names(path)[0]
+        self.assertEqual(detect_header_row(path, sheet), 2)
+        df = load_excel(path, sheet, header_row=2, use_cache=False, usecols=["订单号", "编码"])
+        self.assertEqual(list(df.columns), ["订单号", "编码"])
+        self.assertEqual(df["订单号"].tolist(), ["A001", "A002", "A003", "1001", "A004", "A005"])
+        self.assertEqual(df.attrs["all_columns"][:3], ["订单号", "数量", "金额"])
+        self.assertEqual(df["编码"].iloc[0], "007")
+
+    def test_ragged_rows_fall_back(self):
+        """测试行宽超过表头时回退到 csv 模块"""
+        path = os.path.join(self.tmpdir.name, "ragged.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("a,b\n1,2\n3,4,5\n")
+        df = load_excel(path, "ragged", use_cache=False)
+        self.assertEqual(list(df.columns), ["a", "b", "Unnamed: 2"])
+        self.assertEqual(df["Unnamed: 2"].tolist()[1], 5)
+
+    def test_parquet(self):
+        """测试Parquet按列加载"""
+        path = os.path.join(self.tmpdir.name, "system.parquet")
+        source = pd.DataFrame({"单号": [" A1", "A2", None], "数量": [1, 2, 3]})
+        source.to_parquet(path)
+        self.assertEqual(get_sheet_names(path), ["system"])
+        self.assertEqual(detect_header_row(path, "system"), 0)
+        df = load_excel(path, "system", use_cache=False, usecols=["单号"])
+        self.assertEqual(list(df.columns), ["单号"])
+        self.assertEqual(df.attrs["all_columns"], ["单号", "数量"])
+        # 全空行按已加载的列判断
+        self.assertEqual(df["单号"].tolist(), ["A1", "A2"])
+        self.assertIs(load_excel(path, "system", use_cache=False)["单号"].iloc[2], pd.NA)
+
+
+if __name__ == "__main__":
+    unittest.main()
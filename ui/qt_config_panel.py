@@ -616,6 +616,7 @@ class QtConfigPanel(QScrollArea):
         self.manual_filter_rows: List[FilterRow] = []
         self.system_filter_rows: List[FilterRow] = []
         self.clean_rows: List[ColumnCleanRow] = []  # 列清洗行
+        self._extra_measures: List[Dict] = []  # 附加比对指标（模板中配置，面板不编辑）
         
         self._setup_ui()
         
@@ -1293,6 +1294,8 @@ class QtConfigPanel(QScrollArea):
             "manual": manual_value if manual_value != "(选择列)" else "",
             "system": system_value if system_value != "(选择列)" else ""
         }
+        if self._extra_measures:
+            config["extra_measures"] = [dict(m) for m in self._extra_measures]
         
         # 手工表筛选
         manual_filters = []
@@ -1388,6 +1391,7 @@ class QtConfigPanel(QScrollArea):
             idx = self.system_value_combo.findText(value_mapping["system"])
             if idx >= 0:
                 self.system_value_combo.setCurrentIndex(idx)
+        self._extra_measures = [dict(m) for m in config.get("extra_measures", []) or []]
                 
         # 透视列
         pivot_config = config.get("pivot_column", {})
@@ -4,7 +4,8 @@ PyQt6 主窗口 - 供应链对账系统
 """
 import os
 import sys
-from typing import Optional
+import threading
+from typing import Callable, Dict, List, Optional
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QStackedWidget,
     QPushButton, QLabel, QComboBox, QFrame, QFileDialog, QMessageBox,
@@ -14,11 +15,20 @@ from PyQt6.QtCore import Qt, QMimeData, pyqtSignal
 from PyQt6.QtGui import QDragEnterEvent, QDropEvent, QFont, QIcon, QWheelEvent
 import pandas as pd
 
-from config.settings import APP_NAME, APP_VERSION
-from utils.excel_utils import get_sheet_names, load_excel
+from config.settings import APP_NAME, APP_VERSION, FILE_FILTER, HEADER_ROW, SUPPORTED_EXCEL_FORMATS
+from utils.excel_utils import get_sheet_names, load_excel, get_template_columns, get_all_columns
+from utils.cancellation import cancel_scope
+from utils.column_profile import get_profiles, unique_values
+from utils.multi_loader import expand_sources, load_consolidated
 from utils.storage import load_templates, save_template, delete_template
+from utils.table_store import close_session_store
+from core.clean_plan import CleanRuleError, compile_clean_rules
 from core.compare_engine import CompareEngine
 from core.export_engine import ExportEngine
+from core.filter_plan import FilterPlan
+from core.formula import FormulaError
+from core.measures import status_column
+from core.pipeline import ReconcilePipeline
 
 
 class NoScrollComboBox(QComboBox):
@@ -32,11 +42,14 @@ class FileDropCard(QFrame):
     """文件拖拽卡片组件"""
     
     file_dropped = pyqtSignal(str)  # 文件路径信号
+    files_dropped = pyqtSignal(list)  # 多个文件/文件夹信号（合并加载）
     sheet_changed = pyqtSignal(str)  # Sheet变更信号
     
-    def __init__(self, title: str, description: str, compact: bool = False, parent=None):
+    def __init__(self, title: str, description: str, compact: bool = False,
+                 multi_file: bool = False, parent=None):
         super().__init__(parent)
         self.compact = compact
+        self.multi_file = multi_file  # 是否接受多个文件/文件夹
         self.filepath = ""
         self.setAcceptDrops(True)
         self.setObjectName("fileDropCard")
@@ -110,11 +123,14 @@ class FileDropCard(QFrame):
         if sheet_name and self.filepath:
             self.sheet_changed.emit(sheet_name)
         
-    def set_file(self, filepath: str, sheets: list = None):
-        """设置文件路径和可用Sheet"""
+    def set_file(self, filepath: str, sheets: list = None, file_count: int = 1):
+        """设置文件路径和可用Sheet（合并加载多个文件时 filepath 为第一个文件）"""
         self.filepath = filepath
         filename = os.path.basename(filepath)
-        self.file_label.setText(f"✓ {filename}")
+        if file_count > 1:
+            self.file_label.setText(f"✓ {filename} 等 {file_count} 个文件（合并）")
+        else:
+            self.file_label.setText(f"✓ {filename}")
         self.file_label.setStyleSheet("color: #4CAF50; font-weight: bold;")
         
         # 更新Sheet下拉框
@@ -127,6 +143,13 @@ class FileDropCard(QFrame):
         else:
             self.sheet_combo.setVisible(False)
     
+    def set_current_sheet(self, sheet_name: str):
+        """选中指定Sheet（不触发 sheet_changed）"""
+        if self.sheet_combo.isVisible() and sheet_name:
+            self.sheet_combo.blockSignals(True)
+            self.sheet_combo.setCurrentText(sheet_name)
+            self.sheet_combo.blockSignals(False)
+    
     def get_selected_sheet(self) -> str:
         """获取当前选中的Sheet"""
         if self.sheet_combo.isVisible():
@@ -139,10 +162,15 @@ class FileDropCard(QFrame):
         self.file_label.setText("未选择文件")
         self.file_label.setStyleSheet("color: #999; font-style: italic;")
         
+    def _accepts(self, path: str) -> bool:
+        if self.multi_file and os.path.isdir(path):
+            return True
+        return path.lower().endswith(tuple(SUPPORTED_EXCEL_FORMATS))
+        
     def dragEnterEvent(self, event: QDragEnterEvent):
         if event.mimeData().hasUrls():
             urls = event.mimeData().urls()
-            if urls and urls[0].toLocalFile().lower().endswith(('.xlsx', '.xls', '.xlsm')):
+            if urls and self._accepts(urls[0].toLocalFile()):
                 event.acceptProposedAction()
                 min_height = 150 if self.compact else 200
                 padding = 12 if self.compact else 20
@@ -161,10 +189,11 @@ class FileDropCard(QFrame):
         
     def dropEvent(self, event: QDropEvent):
         urls = event.mimeData().urls()
-        if urls:
-            filepath = urls[0].toLocalFile()
-            if filepath.lower().endswith(('.xlsx', '.xls', '.xlsm')):
-                self.file_dropped.emit(filepath)
+        paths = [url.toLocalFile() for url in urls if self._accepts(url.toLocalFile())]
+        if self.multi_file and (len(paths) > 1 or (paths and os.path.isdir(paths[0]))):
+            self.files_dropped.emit(paths)
+        elif paths:
+            self.file_dropped.emit(paths[0])
         self.dragLeaveEvent(event)
 
 
@@ -259,6 +288,24 @@ class StepIndicator(QWidget):
                 label.setStyleSheet("color: #999;")
 
 
+def _run_cancellable(cancel: threading.Event, loader: Callable, *args):
+    """在后台线程中运行加载函数并统计列概况，cancel 被设置后在下一个检查点中断"""
+    with cancel_scope(cancel):
+        df = loader(*args)
+    get_profiles(df)
+    return df
+
+
+def _load_tables_profiled(jobs: dict, **kwargs) -> dict:
+    """并行加载多个表，并在当前（后台）线程中统计列概况"""
+    from utils.parallel_loader import load_tables_parallel
+    
+    tables = load_tables_parallel(jobs, **kwargs)
+    for df in tables.values():
+        get_profiles(df)
+    return tables
+
+
 class QtMainWindow(QMainWindow):
     """主窗口"""
     
@@ -270,8 +317,14 @@ class QtMainWindow(QMainWindow):
         self.system_df: Optional[pd.DataFrame] = None
         self.manual_path: str = ""
         self.system_path: str = ""
+        self.manual_sources: List[str] = []  # 合并加载的手工表文件（单个文件时为空）
+        self.loaded_sheets: Dict[str, str] = {"manual": "", "system": ""}  # 当前数据来自的Sheet
+        self._sheet_loads: Dict[str, threading.Event] = {}  # 进行中的后台Sheet加载（取消标志）
+        self._loader_threads: set = set()  # 运行中的后台加载线程（保持引用直到结束）
         self.result_df: Optional[pd.DataFrame] = None
         self.pivot_values: list = []  # 透视值列表
+        self.template_config: Optional[dict] = None  # 当前模板配置（决定加载哪些列）
+        self.pipeline = ReconcilePipeline()  # 对账流水线（缓存各阶段结果，配置变化时只重算下游）
         
         # 响应式尺寸计算
         self._calculate_responsive_sizes()
@@ -571,15 +624,17 @@ class QtMainWindow(QMainWindow):
         # 手工表卡片
         self.manual_card = FileDropCard(
             "手工表",
-            "拖拽Excel文件到这里，或点击选择\n支持 .xlsx / .xls / .xlsm",
-            compact=self.spacing_scale < 1.0
+            "拖拽Excel/CSV文件到这里，或点击选择\n支持 .xlsx / .xls / .xlsm / .csv / .tsv / .parquet\n"
+            "多个文件或文件夹按列名合并",
+            compact=self.spacing_scale < 1.0,
+            multi_file=True
         )
         layout.addWidget(self.manual_card)
         
         # 系统表卡片
         self.system_card = FileDropCard(
             "系统表",
-            "拖拽Excel文件到这里，或点击选择\n支持 .xlsx / .xls / .xlsm",
+            "拖拽Excel/CSV文件到这里，或点击选择\n支持 .xlsx / .xls / .xlsm / .csv / .tsv / .parquet",
             compact=self.spacing_scale < 1.0
         )
         layout.addWidget(self.system_card)
@@ -773,6 +828,7 @@ class QtMainWindow(QMainWindow):
         self.manual_card.select_btn.clicked.connect(lambda: self._select_file("manual"))
         self.system_card.select_btn.clicked.connect(lambda: self._select_file("system"))
         self.manual_card.file_dropped.connect(lambda p: self._load_file(p, "manual"))
+        self.manual_card.files_dropped.connect(self._load_manual_files)
         self.system_card.file_dropped.connect(lambda p: self._load_file(p, "system"))
         
         # Sheet选择变更
@@ -848,16 +904,105 @@ class QtMainWindow(QMainWindow):
             self.next_btn.setEnabled(False)
             
     def _select_file(self, file_type: str):
-        """选择文件"""
-        filepath, _ = QFileDialog.getOpenFileName(
-            self,
-            f"选择{'手工表' if file_type == 'manual' else '系统表'}",
-            "",
-            "Excel文件 (*.xlsx *.xls *.xlsm)"
-        )
+        """选择文件（手工表可多选，多个文件合并加载）"""
+        if file_type == "manual":
+            filepaths, _ = QFileDialog.getOpenFileNames(self, "选择手工表（可多选）", "", FILE_FILTER)
+            if len(filepaths) > 1:
+                self._load_manual_files(filepaths)
+                return
+            filepath = filepaths[0] if filepaths else ""
+        else:
+            filepath, _ = QFileDialog.getOpenFileName(self, "选择系统表", "", FILE_FILTER)
         if filepath:
             self._load_file(filepath, file_type)
             
+    def _load_manual_files(self, sources: list):
+        """合并加载多个手工表文件（文件列表或文件夹）"""
+        try:
+            files = expand_sources(sources)
+            if len(files) == 1:
+                self._load_file(files[0], "manual")
+                return
+            if not files:
+                raise ValueError("没有找到支持的数据文件")
+            
+            self._cancel_sheet_load("manual")
+            self.manual_sources = files
+            self.manual_df = self._load_table("manual", "")
+            self.manual_path = files[0]
+            self.loaded_sheets["manual"] = ""
+            # 下拉框列出第一个文件的Sheet，选择后所有文件取同名Sheet
+            self.manual_card.set_file(files[0], get_sheet_names(files[0]), file_count=len(files))
+            self._update_step1_status()
+            self._update_column_options()
+        except Exception as e:
+            from ui.qt_dialogs import show_error
+            show_error(self, "导入失败", f"无法合并读取文件:\n{str(e)}")
+            
+    def _table_loader(self, file_type: str, sheet_name: str,
+                      usecols: Optional[list] = None,
+                      use_template: bool = True) -> Callable[..., pd.DataFrame]:
+        """
+        返回加载手工表或系统表一个Sheet的函数 loader(progress)
+        
+        手工表为多个文件时合并加载（sheet_name 为空时取每个文件的第一个Sheet），
+        progress(已完成数, 总数) 在每个文件读取完成时调用；单个文件时不调用。
+        use_template 为 True 且未指定 usecols 时按当前模板的列投影加载。
+        文件路径在调用时确定，之后切换文件不影响已返回的函数。
+        """
+        if usecols is None and use_template:
+            usecols = self._get_usecols(file_type)
+        if file_type == "manual" and self.manual_sources:
+            sources = list(self.manual_sources)
+            return lambda progress=None: load_consolidated(
+                sources, sheet_name or None, header_row=HEADER_ROW, usecols=usecols, progress=progress
+            )
+        filepath = self.manual_path if file_type == "manual" else self.system_path
+        return lambda progress=None: load_excel(filepath, sheet_name, HEADER_ROW, usecols=usecols)
+    
+    def _load_table(self, file_type: str, sheet_name: str,
+                    usecols: Optional[list] = None, use_template: bool = True) -> pd.DataFrame:
+        """加载手工表或系统表的一个Sheet（合并加载多个文件时显示进度对话框）"""
+        loader = self._table_loader(file_type, sheet_name, usecols, use_template)
+        if file_type == "manual" and self.manual_sources:
+            return self._with_progress("合并加载手工表", loader, len(self.manual_sources))
+        return loader()
+    
+    def _with_progress(self, title: str, func, total: int):
+        """在工作线程中运行 func(progress)，显示进度对话框"""
+        from ui.qt_dialogs import ProgressDialog, WorkerThread
+        
+        dialog = ProgressDialog(title, [f"正在读取第 {i + 1}/{total} 个文件..." for i in range(total)], self)
+        dialog.show()
+        QApplication.processEvents()
+        
+        result = None
+        error = None
+        
+        def on_finished(r):
+            nonlocal result
+            result = r
+        
+        def on_error(e):
+            nonlocal error
+            error = e
+        
+        thread = WorkerThread(func)
+        thread.args = (lambda done, count: thread.progress.emit(done, f"已读取 {done}/{count}"),)
+        thread.progress.connect(lambda done, text: dialog.set_step(done, text))
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        thread.start()
+        
+        while not thread.wait(50):
+            QApplication.processEvents()
+        QApplication.processEvents()
+        dialog.close()
+        
+        if error:
+            raise Exception(error)
+        return result
+            
     def _load_file(self, filepath: str, file_type: str, sheet_name: str = None):
         """加载文件"""
         try:
@@ -868,97 +1013,257 @@ class QtMainWindow(QMainWindow):
             if sheet_name is None:
                 sheet_name = sheets[0]
                 
-            df = load_excel(filepath, sheet_name)
+            df = load_excel(filepath, sheet_name, HEADER_ROW, usecols=self._get_usecols(file_type))
             
+            self._cancel_sheet_load(file_type)
             if file_type == "manual":
                 self.manual_df = df
                 self.manual_path = filepath
+                self.manual_sources = []
                 card.set_file(filepath, sheets)
             else:
                 self.system_df = df
                 self.system_path = filepath
                 card.set_file(filepath, sheets)
+            self.loaded_sheets[file_type] = sheet_name
                 
             self._update_step1_status()
             
             # 更新配置面板的列选项
-            if self.manual_df is not None and self.system_df is not None:
-                self.config_panel.set_columns(
-                    list(self.manual_df.columns),
-                    list(self.system_df.columns)
-                )
-                
-                # 设置手工表唯一值（用于筛选）
-                manual_unique_values = {}
-                for col in self.manual_df.columns:
-                    try:
-                        unique_vals = self.manual_df[col].dropna().unique().tolist()
-                        if len(unique_vals) <= 100:  # 限制唯一值数量
-                            manual_unique_values[col] = unique_vals
-                    except:
-                        pass
-                self.config_panel.set_manual_unique_values(manual_unique_values)
-                
-                # 设置系统表唯一值（用于透视列和筛选）
-                unique_values = {}
-                for col in self.system_df.columns:
-                    try:
-                        unique_vals = self.system_df[col].dropna().unique().tolist()
-                        if len(unique_vals) <= 100:  # 限制唯一值数量
-                            unique_values[col] = unique_vals
-                    except:
-                        pass
-                self.config_panel.set_system_unique_values(unique_values)
+            self._update_column_options()
                 
         except Exception as e:
             from ui.qt_dialogs import show_error
             show_error(self, "导入失败", f"无法读取文件:\n{str(e)}")
             
     def _on_sheet_changed(self, file_type: str, sheet_name: str):
-        """Sheet选择变更处理"""
+        """
+        Sheet选择变更处理
+        
+        在后台线程中加载，界面不阻塞；加载完成前当前数据仍可使用。
+        再次切换Sheet时取消尚未完成的加载（见 utils.cancellation）。
+        """
         if not sheet_name:
             return
         filepath = self.manual_path if file_type == "manual" else self.system_path
-        if filepath:
-            try:
-                df = load_excel(filepath, sheet_name)
-                if file_type == "manual":
-                    self.manual_df = df
-                else:
-                    self.system_df = df
-                self._update_step1_status()
-                
-                # 更新配置面板的列选项
-                if self.manual_df is not None and self.system_df is not None:
-                    self.config_panel.set_columns(
-                        list(self.manual_df.columns),
-                        list(self.system_df.columns)
-                    )
-                    
-                    # 设置手工表唯一值（用于筛选）
-                    manual_unique_values = {}
-                    for col in self.manual_df.columns:
-                        try:
-                            unique_vals = self.manual_df[col].dropna().unique().tolist()
-                            if len(unique_vals) <= 100:
-                                manual_unique_values[col] = unique_vals
-                        except:
-                            pass
-                    self.config_panel.set_manual_unique_values(manual_unique_values)
-                    
-                    # 设置系统表唯一值（用于透视列和筛选）
-                    unique_values = {}
-                    for col in self.system_df.columns:
-                        try:
-                            unique_vals = self.system_df[col].dropna().unique().tolist()
-                            if len(unique_vals) <= 100:
-                                unique_values[col] = unique_vals
-                        except:
-                            pass
-                    self.config_panel.set_system_unique_values(unique_values)
-            except Exception as e:
-                from ui.qt_dialogs import show_warning
-                show_warning(self, "加载失败", f"无法加载工作表:\n{str(e)}")
+        if not filepath:
+            return
+        
+        from ui.qt_dialogs import WorkerThread
+        
+        self._cancel_sheet_load(file_type)
+        cancel = threading.Event()
+        self._sheet_loads[file_type] = cancel
+        label = "手工表" if file_type == "manual" else "系统表"
+        self.status_label.setText(f"⏳ 正在加载{label} Sheet「{sheet_name}」...")
+        
+        thread = WorkerThread(_run_cancellable, cancel, self._table_loader(file_type, sheet_name))
+        thread.args += (lambda done, total: thread.progress.emit(done, f"{done}/{total}"),)
+        
+        def on_progress(_, text: str):
+            if self._sheet_loads.get(file_type) is cancel:
+                self.status_label.setText(f"⏳ 正在加载{label} Sheet「{sheet_name}」... 已读取 {text} 个文件")
+        
+        def on_finished(df):
+            self._release_loader(thread)
+            if self._sheet_loads.get(file_type) is not cancel:
+                return  # 已被新的加载取代
+            del self._sheet_loads[file_type]
+            if file_type == "manual":
+                self.manual_df = df
+            else:
+                self.system_df = df
+            self.loaded_sheets[file_type] = sheet_name
+            self._update_step1_status()
+            
+            # 更新配置面板的列选项
+            self._update_column_options()
+        
+        def on_error(message: str):
+            self._release_loader(thread)
+            if self._sheet_loads.get(file_type) is not cancel:
+                return
+            del self._sheet_loads[file_type]
+            # 下拉框恢复为当前数据所在的Sheet
+            card = self.manual_card if file_type == "manual" else self.system_card
+            card.set_current_sheet(self.loaded_sheets[file_type])
+            self._update_step1_status()
+            from ui.qt_dialogs import show_warning
+            show_warning(self, "加载失败", f"无法加载工作表:\n{message}")
+        
+        thread.progress.connect(on_progress)
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        self._loader_threads.add(thread)
+        thread.start()
+    
+    def _cancel_sheet_load(self, file_type: str):
+        """取消进行中的后台Sheet加载（结果不再使用）"""
+        cancel = self._sheet_loads.pop(file_type, None)
+        if cancel is not None:
+            cancel.set()
+    
+    def _release_loader(self, thread):
+        # 信号在 run() 返回前发出，等待线程结束后再释放引用
+        thread.wait()
+        self._loader_threads.discard(thread)
+    
+    def closeEvent(self, event):
+        """关闭窗口前取消并等待后台加载线程"""
+        for file_type in list(self._sheet_loads):
+            self._cancel_sheet_load(file_type)
+        for thread in list(self._loader_threads):
+            thread.wait()
+        self.pipeline.clear()
+        self.result_preview.pipeline.clear()
+        close_session_store()
+        super().closeEvent(event)
+    
+    def _update_column_options(self, reset_columns: bool = True):
+        """更新配置面板的列选项和唯一值"""
+        if self.manual_df is None or self.system_df is None:
+            return
+        
+        # 按列投影加载时下拉框仍显示完整列名
+        if reset_columns:
+            self.config_panel.set_columns(
+                get_all_columns(self.manual_df),
+                get_all_columns(self.system_df)
+            )
+        
+        # 低基数列的唯一值（见 column_profile，每个表只统计一次）
+        # 手工表用于筛选，系统表用于透视列和筛选
+        self.config_panel.set_manual_unique_values(unique_values(get_profiles(self.manual_df)))
+        self.config_panel.set_system_unique_values(unique_values(get_profiles(self.system_df)))
+    
+    def _get_usecols(self, file_type: str) -> Optional[list]:
+        """当前模板引用的列（未选择模板时返回None，加载全部列）"""
+        if not self.template_config:
+            return None
+        return get_template_columns(self.template_config)[file_type]
+    
+    def _get_sheet(self, file_type: str) -> str:
+        """当前数据所在的Sheet（后台加载完成前仍为原Sheet）"""
+        return self.loaded_sheets[file_type]
+    
+    def _ensure_columns(self, config: dict, shrink: bool = False) -> bool:
+        """
+        按配置引用的列重新加载按列投影的数据
+        
+        Args:
+            config: 对账配置
+            shrink: 是否只保留配置引用的列（切换模板时释放不再需要的列）
+        
+        Returns:
+            是否重新加载了数据
+        """
+        jobs = {}
+        needed = get_template_columns(config)
+        for file_type in ("manual", "system"):
+            df = self.manual_df if file_type == "manual" else self.system_df
+            filepath = self.manual_path if file_type == "manual" else self.system_path
+            if df is None or not filepath:
+                continue
+            all_columns = get_all_columns(df)
+            wanted = [col for col in needed[file_type] if col in all_columns]
+            missing = [col for col in wanted if col not in df.columns]
+            if shrink and wanted and set(wanted) != set(df.columns):
+                usecols = wanted
+            elif missing:
+                usecols = list(df.columns) + missing
+            else:
+                continue
+            jobs[file_type] = {
+                "filepath": filepath,
+                "sheet_name": self._get_sheet(file_type),
+                "header_row": HEADER_ROW,
+                "usecols": usecols,
+            }
+        if not jobs:
+            return False
+        
+        tables = {}
+        if "manual" in jobs and self.manual_sources:
+            # 合并加载的手工表由 load_consolidated 并行读取各文件
+            kwargs = jobs.pop("manual")
+            tables["manual"] = self._load_table("manual", kwargs["sheet_name"], kwargs["usecols"])
+        tables.update(self._load_tables(jobs))
+        for file_type, df in tables.items():
+            if file_type == "manual":
+                self.manual_df = df
+            else:
+                self.system_df = df
+        # 完整列名未变，只刷新唯一值，避免重置已选择的列
+        self._update_column_options(reset_columns=False)
+        return True
+    
+    def _load_tables(self, jobs: dict) -> dict:
+        """
+        加载手工表和/或系统表
+        
+        两个表同时加载时在子进程中并行解析（见 parallel_loader），
+        界面显示每个表的读取进度。
+        
+        Args:
+            jobs: {"manual"/"system": load_excel 的关键字参数}
+        
+        Returns:
+            {"manual"/"system": DataFrame}
+        """
+        if len(jobs) <= 1:
+            return {file_type: load_excel(**kwargs) for file_type, kwargs in jobs.items()}
+        
+        from ui.qt_dialogs import ProgressDialog, WorkerThread
+        
+        labels = {"manual": "手工表", "system": "系统表"}
+        names = "、".join(labels[file_type] for file_type in jobs)
+        dialog = ProgressDialog("加载数据", [f"正在读取{names}..."] * len(jobs), self)
+        dialog.show()
+        QApplication.processEvents()
+        
+        result = None
+        error = None
+        file_types = list(jobs)
+        done = []
+        
+        def on_progress(index: int, status: str):
+            if status == "finished":
+                done.append(file_types[index])
+                dialog.set_step(len(done), f"{labels[file_types[index]]}读取完成")
+        
+        def on_finished(r):
+            nonlocal result
+            result = r
+        
+        def on_error(e):
+            nonlocal error
+            error = e
+        
+        thread = WorkerThread(_load_tables_profiled, jobs)
+        # 进度回调在工作线程中执行，通过信号转到界面线程
+        thread.kwargs["progress"] = lambda file_type, status: thread.progress.emit(
+            file_types.index(file_type), status
+        )
+        thread.progress.connect(on_progress)
+        thread.finished.connect(on_finished)
+        thread.error.connect(on_error)
+        thread.start()
+        
+        while not thread.wait(50):
+            QApplication.processEvents()
+        QApplication.processEvents()
+        dialog.close()
+        
+        if error:
+            raise Exception(error)
+        return result
+    
+    def _get_full_df(self, file_type: str) -> Optional[pd.DataFrame]:
+        """获取包含全部列的数据（按列投影加载时重新读取完整Sheet）"""
+        df = self.manual_df if file_type == "manual" else self.system_df
+        if df is None or list(df.columns) == get_all_columns(df):
+            return df
+        return self._load_table(file_type, self._get_sheet(file_type), use_template=False)
             
     def _go_prev(self):
         """上一步"""
@@ -975,6 +1280,7 @@ class QtMainWindow(QMainWindow):
         loading = None
         try:
             config = self.config_panel.get_config()
+            self._ensure_columns(config)
             
             # 验证配置
             from ui.qt_dialogs import show_warning
@@ -984,6 +1290,9 @@ class QtMainWindow(QMainWindow):
             if not config.get("value_mapping", {}).get("manual"):
                 show_warning(self, "配置不完整", "请配置手工表数值列")
                 return
+            
+            # 编译清洗规则（正则无效时在执行前报告；编译结果有缓存，流水线中不再重复编译）
+            compile_clean_rules(config.get("clean_rules", []))
                 
             # 执行对账
             from ui.qt_dialogs import LoadingDialog
@@ -991,124 +1300,24 @@ class QtMainWindow(QMainWindow):
             loading.show()
             QApplication.processEvents()
             
-            # 准备配置参数
-            key_mappings = config.get("key_mappings", [])
-            manual_key_cols = [k["manual"] for k in key_mappings]
-            system_key_cols = [k["system"] for k in key_mappings]
-            
-            value_mapping = config.get("value_mapping", {})
-            manual_val_col = value_mapping.get("manual", "")
-            system_val_col = value_mapping.get("system", "")
-            
             # 透视列配置
             pivot_config = config.get("pivot_column", {})
             pivot_col = pivot_config.get("system", "") if isinstance(pivot_config, dict) else pivot_config
             
-            # 列清洗规则
-            clean_rules = config.get("clean_rules", [])
-            
-            # 手工表透视配置
-            manual_pivot = config.get("manual_pivot", {})
-            
-            # 复制数据进行处理
-            manual_data = self.manual_df.copy()
-            system_data = self.system_df.copy()
-            
-            # 应用列清洗（仅手工表）
-            if clean_rules:
-                manual_data = CompareEngine.clean_column(manual_data, clean_rules)
-            
-            # 生成主键
-            manual_with_key = CompareEngine.make_key(manual_data, manual_key_cols)
-            system_with_key = CompareEngine.make_key(system_data, system_key_cols)
-            
-            # 准备筛选条件
-            manual_filters = []
-            for f in config.get("manual_filters", []):
-                manual_filters.append((f["column"], f["operator"], f["value"]))
-            
-            system_filters = []
-            for f in config.get("system_filters", []):
-                system_filters.append((f["column"], f["operator"], f["value"]))
-            
-            # 聚合数据
-            # 手工表聚合 - 检查是否有手工表透视配置
-            if manual_pivot and manual_pivot.get("pivot_column"):
-                # 使用手工表透视聚合（区分出库/入库）
-                manual_agg, out_cols, in_cols = CompareEngine.aggregate_manual_with_pivot(
-                    manual_with_key, "__KEY__", manual_val_col,
-                    manual_pivot,
-                    filters=manual_filters
-                )
-                # 保存手工表透视信息（用于结果显示）
-                self.manual_pivot_info = {"out_cols": out_cols, "in_cols": in_cols}
-            else:
-                # 普通聚合
-                manual_agg, _ = CompareEngine.aggregate_data(
-                    manual_with_key, "__KEY__", [manual_val_col] if manual_val_col else [],
-                    filters=manual_filters
-                )
-                self.manual_pivot_info = None
-            
-            system_agg, pivot_values = CompareEngine.aggregate_data(
-                system_with_key, "__KEY__", [system_val_col] if system_val_col else [],
-                pivot_col=pivot_col if pivot_col else None,
-                filters=system_filters
-            )
-            
-            # 保存透视值
-            self.pivot_values = pivot_values
-            
-            # 确定数值列名（merge_and_compare会将它们重命名为标准名称）
-            manual_val = manual_val_col if manual_val_col else ""
-            system_val = system_val_col if system_val_col else ""
-            
-            # 获取字母公式并转换为列名公式
+            # 获取字母公式（透视值确定后转换为列名公式）
             letter_formula = config.get("difference_formula", "")
             
-            # 调试输出
-            print(f"[DEBUG] letter_formula: {letter_formula}")
-            print(f"[DEBUG] pivot_col: {pivot_col}")
-            print(f"[DEBUG] pivot_values: {pivot_values}")
-            
-            # 构建字母到列名的映射
-            # 新列顺序: A=__KEY__, [B,C,D...=透视列], 系统总计, 手工数量, 差值, 比对状态
-            letter_to_column = {}
-            
-            # 系统总计和透视列、手工数量
-            if pivot_col and pivot_values:
-                # 有透视列时：B,C,D=透视列，然后系统总计，然后手工数量
-                letter_index = ord('B')  # 从B开始
-                for pv in sorted(pivot_values):
-                    letter_to_column[chr(letter_index)] = pv
-                    letter_index += 1
-                letter_to_column[chr(letter_index)] = "系统总计"
-                letter_index += 1
-                letter_to_column[chr(letter_index)] = "手工数量"
-            else:
-                # 无透视列：B=系统总计, C=手工数量
-                letter_to_column["B"] = "系统总计"
-                letter_to_column["C"] = "手工数量"
-            
-            print(f"[DEBUG] letter_to_column: {letter_to_column}")
-            
-            # 将字母公式转换为列名公式
-            column_formula = letter_formula
-            # 按字母逆序替换（避免B被BB等部分匹配）
-            for letter in sorted(letter_to_column.keys(), key=lambda x: ord(x), reverse=True):
-                column_name = letter_to_column[letter]
-                column_formula = column_formula.replace(letter, column_name)
-            
-            print(f"[DEBUG] column_formula: {column_formula}")
-            
-            # 合并比对
-            self.result_df = CompareEngine.merge_and_compare(
-                manual_agg, system_agg, "__KEY__",
-                manual_val, system_val,
-                diff_formula=column_formula,
-                pivot_values=pivot_values
+            # 分阶段执行对账：只重算输入或配置有变化的阶段（见 core/pipeline.py）
+            outcome = self.pipeline.run(
+                self.manual_df, self.system_df, config,
+                diff_formula=lambda pivot_values: self._column_formula(letter_formula, pivot_col, pivot_values)
             )
             
+            # 保存手工表透视信息（用于结果显示）和透视值
+            self.manual_pivot_info = outcome.manual_pivot_info
+            self.pivot_values = outcome.pivot_values
+            self.result_df = outcome.result
+            
             if loading:
                 loading.close()
                 loading = None
@@ -1122,6 +1331,16 @@ class QtMainWindow(QMainWindow):
             # 进入步骤3
             self._show_step(3)
             
+        except FormulaError as e:
+            if loading:
+                loading.close()
+            from ui.qt_dialogs import show_error
+            show_error(self, "差值公式错误", f"{e}\n\n请检查差值公式中的列字母和运算符。")
+        except CleanRuleError as e:
+            if loading:
+                loading.close()
+            from ui.qt_dialogs import show_error
+            show_error(self, "清洗规则错误", f"{e}\n\n请检查清洗规则中的正则表达式。")
         except Exception as e:
             if loading:
                 loading.close()
@@ -1131,6 +1350,44 @@ class QtMainWindow(QMainWindow):
             from ui.qt_dialogs import show_error
             show_error(self, "对账失败", f"执行对账时出错:\n{str(e)}")
             
+    def _column_formula(self, letter_formula: str, pivot_col: str, pivot_values: List[str]) -> str:
+        """字母公式转换为列名公式（列字母与结果列顺序对应）"""
+        # 调试输出
+        print(f"[DEBUG] letter_formula: {letter_formula}")
+        print(f"[DEBUG] pivot_col: {pivot_col}")
+        print(f"[DEBUG] pivot_values: {pivot_values}")
+        
+        # 构建字母到列名的映射
+        # 新列顺序: A=__KEY__, [B,C,D...=透视列], 系统总计, 手工数量, 差值, 比对状态
+        letter_to_column = {}
+        
+        # 系统总计和透视列、手工数量
+        if pivot_col and pivot_values:
+            # 有透视列时：B,C,D=透视列，然后系统总计，然后手工数量
+            letter_index = ord('B')  # 从B开始
+            for pv in sorted(pivot_values):
+                letter_to_column[chr(letter_index)] = pv
+                letter_index += 1
+            letter_to_column[chr(letter_index)] = "系统总计"
+            letter_index += 1
+            letter_to_column[chr(letter_index)] = "手工数量"
+        else:
+            # 无透视列：B=系统总计, C=手工数量
+            letter_to_column["B"] = "系统总计"
+            letter_to_column["C"] = "手工数量"
+        
+        print(f"[DEBUG] letter_to_column: {letter_to_column}")
+        
+        # 将字母公式转换为列名公式
+        column_formula = letter_formula
+        # 按字母逆序替换（避免B被BB等部分匹配）
+        for letter in sorted(letter_to_column.keys(), key=lambda x: ord(x), reverse=True):
+            column_name = letter_to_column[letter]
+            column_formula = column_formula.replace(letter, column_name)
+        
+        print(f"[DEBUG] column_formula: {column_formula}")
+        return column_formula
+    
     def _update_stats(self):
         """更新统计信息"""
         if self.result_df is None:
@@ -1143,8 +1400,8 @@ class QtMainWindow(QMainWindow):
             print(f"[DEBUG] result_df head:\n{self.result_df.head()}")
             
         total = len(self.result_df)
-        # 使用 str.startswith 来匹配状态（因为状态是 "✓ 一致" 这样的完整字符串）
-        status_col = self.result_df['比对状态'].astype(str)
+        # 使用 str.startswith 来匹配状态（因为状态是 "✓ 一致" 这样的完整字符串；有附加指标时按综合状态）
+        status_col = self.result_df[status_column(self.result_df)].astype(str)
         match = len(self.result_df[status_col.str.startswith('✓')])
         diff = len(self.result_df[status_col.str.startswith('↕')])
         missing = len(self.result_df[status_col.str.startswith('✗')])
@@ -1218,7 +1475,10 @@ class QtMainWindow(QMainWindow):
         template = self.template_combo.itemData(index)
         if template:
             config = template.get("config", {})
+            self.template_config = config
             self.config_panel.set_config(config)
+            # 只保留模板引用的列
+            self._ensure_columns(config, shrink=True)
             
     def _save_template(self):
         """保存模板"""
@@ -1273,6 +1533,7 @@ class QtMainWindow(QMainWindow):
         # 更新预览
         if self.manual_df is not None and self.system_df is not None:
             config = self.config_panel.get_config()
+            self._ensure_columns(config)
             self.result_preview.update_preview(
                 self.manual_df,
                 self.system_df,
@@ -1321,7 +1582,7 @@ class QtMainWindow(QMainWindow):
         # === Sheet1: 原始数据 ===
         ws1 = wb.active
         ws1.title = "1-原始数据"
-        df_original = self.manual_df.copy()
+        df_original = self._get_full_df("manual").copy()
         
         ws1.cell(row=1, column=1, value="【手工表原始数据】").font = Font(bold=True, size=12, color="0000FF")
         ws1.cell(row=2, column=1, value=f"共 {len(df_original)} 行数据")
@@ -1393,7 +1654,7 @@ class QtMainWindow(QMainWindow):
             if manual_key_cols and manual_val_col:
                 from core.compare_engine import CompareEngine
                 manual_with_key = CompareEngine.make_key(df_cleaned, manual_key_cols)
-                manual_filters = [(f["column"], f["operator"], f["value"]) for f in config.get("manual_filters", [])]
+                manual_filters = FilterPlan.from_config(config.get("manual_filters", []))
                 
                 try:
                     pivot_df, out_cols, in_cols = CompareEngine.aggregate_manual_with_pivot(
@@ -1477,7 +1738,7 @@ class QtMainWindow(QMainWindow):
         # === Sheet1: 原始数据 ===
         ws1 = wb.active
         ws1.title = "1-原始数据"
-        df_original = self.system_df.copy()
+        df_original = self._get_full_df("system").copy()
         
         ws1.cell(row=1, column=1, value="【系统表原始数据】").font = Font(bold=True, size=12, color="2E7D32")
         ws1.cell(row=2, column=1, value=f"共 {len(df_original)} 行数据")
@@ -1501,22 +1762,11 @@ class QtMainWindow(QMainWindow):
         ws2.cell(row=1, column=1, value="【筛选规则】").font = Font(bold=True, size=12, color="FF0000")
         
         if system_filters:
-            filter_tuples = [(f["column"], f["operator"], f["value"]) for f in system_filters]
             for i, f in enumerate(system_filters):
                 ws2.cell(row=2+i, column=1, value=f"规则{i+1}: {f['column']} {f['operator']} '{f['value']}'")
             
-            # 应用筛选条件
-            for col, op, val in filter_tuples:
-                if col not in df_filtered.columns:
-                    continue
-                if op == "等于":
-                    df_filtered = df_filtered[df_filtered[col].astype(str) == str(val)]
-                elif op == "不等于":
-                    df_filtered = df_filtered[df_filtered[col].astype(str) != str(val)]
-                elif op == "包含":
-                    df_filtered = df_filtered[df_filtered[col].astype(str).str.contains(str(val), na=False)]
-                elif op == "不包含":
-                    df_filtered = df_filtered[~df_filtered[col].astype(str).str.contains(str(val), na=False)]
+            # 应用筛选条件（与比对时的规则相同）
+            df_filtered = FilterPlan.from_config(system_filters).apply(df_filtered)
             
             ws2.cell(row=2+len(system_filters), column=1, value=f"筛选后剩余 {len(df_filtered)} 行")
             start_row = 4 + len(system_filters)
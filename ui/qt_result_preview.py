@@ -18,6 +18,8 @@ from config.settings import (
     HEADER_BG, MATCH_BG, DIFF_BG, MISSING_BG,
     HEADER_FG, MATCH_FG, DIFF_FG, MISSING_FG
 )
+from core.measures import OVERALL_STATUS, Measure, measure_names, status_column
+from core.pipeline import ReconcilePipeline
 
 
 def hex_to_qcolor(hex_color: str) -> QColor:
@@ -326,6 +328,8 @@ class QtResultPreview(QWidget):
         super().__init__(parent)
         self.compact = compact
         self.column_letters = {}  # 存储列字母映射 {列名: 字母}
+        # 预览用对账流水线（文本主键，样例按主键文本显示；配置变化时只重算下游阶段）
+        self.pipeline = ReconcilePipeline(use_key_codec=False)
         self._setup_ui()
         
     def _excel_col_letter(self, index: int) -> str:
@@ -542,11 +546,6 @@ class QtResultPreview(QWidget):
             if not key_mappings or not value_mapping.get("manual"):
                 self.status_label.setText("请先配置主键和数值列")
                 return
-                
-            manual_keys = [m["manual"] for m in key_mappings]
-            system_keys = [m["system"] for m in key_mappings]
-            manual_value = value_mapping.get("manual", "")
-            system_value = value_mapping.get("system", "")
             
             pivot_config = config.get("pivot_column", {})
             pivot_col = pivot_config.get("system") if isinstance(pivot_config, dict) else pivot_config
@@ -557,56 +556,38 @@ class QtResultPreview(QWidget):
                 unique_count = len(system_df[pivot_col].unique()) if pivot_col in system_df.columns else 0
                 pivot_info = f"{pivot_col} ({unique_count}值)"
             
-            # 实时执行对账生成预览结果
-            from core.compare_engine import CompareEngine
+            # 实时执行对账生成预览结果（流水线缓存各阶段，修改公式、筛选时只重算变化的阶段）
+            from core.clean_plan import CleanRuleError, compile_clean_rules
+            from core.formula import FormulaError
             
-            # 应用清洗规则（手工表）
-            manual_df_cleaned = manual_df.copy()
             clean_rules = config.get("clean_rules", [])
-            if clean_rules:
-                manual_df_cleaned = CompareEngine.clean_column(manual_df_cleaned, clean_rules)
-            
-            # 生成主键（使用清洗后的数据）
-            manual_with_key = CompareEngine.make_key(manual_df_cleaned, manual_keys)
-            system_with_key = CompareEngine.make_key(system_df.copy(), system_keys)
-            
-            # 准备筛选条件
-            manual_filters = [(f["column"], f["operator"], f["value"]) 
-                             for f in config.get("manual_filters", [])]
-            system_filters = [(f["column"], f["operator"], f["value"]) 
-                             for f in config.get("system_filters", [])]
+            preview_config = config
+            try:
+                compile_clean_rules(clean_rules)
+            except CleanRuleError as e:
+                print(f"[WARN] 预览跳过清洗规则: {e}")
+                preview_config = {**config, "clean_rules": []}
             
-            # 聚合数据（包含筛选）
-            manual_agg, _ = CompareEngine.aggregate_data(
-                manual_with_key, "__KEY__", [manual_value] if manual_value else [],
-                filters=manual_filters
-            )
-            
-            system_agg, actual_pivot_values = CompareEngine.aggregate_data(
-                system_with_key, "__KEY__", [system_value] if system_value else [],
-                pivot_col=pivot_col if pivot_col else None,
-                filters=system_filters
-            )
+            # 合并比对（公式无法解析时预览使用默认公式，执行对账时再报告错误）
+            try:
+                outcome = self.pipeline.run(manual_df, system_df, preview_config,
+                                            diff_formula=config.get("difference_formula", "M - S"))
+            except FormulaError as e:
+                print(f"[WARN] 预览使用默认差值公式: {e}")
+                outcome = self.pipeline.run(manual_df, system_df, preview_config)
+            manual_agg, system_agg = outcome.manual_agg, outcome.system_agg
+            result_df = outcome.result
             
             # 获取手工表透视配置
             manual_pivot = config.get("manual_pivot", {})
             
             # 更新样例显示
             if manual_pivot and manual_pivot.get("pivot_column"):
-                # 如果配置了手工表透视，显示透视计算结果
+                # 如果配置了手工表透视，显示透视计算结果（与合并比对使用的手工表聚合相同）
                 in_values = manual_pivot.get("in_values", [])
                 # 找到入库值中的第一个作为筛选列（通常是"退仓"或"退货"）
                 filter_col = in_values[0] if in_values else None
-                
-                try:
-                    # 执行手工表透视计算
-                    pivot_df, out_cols, in_cols = CompareEngine.aggregate_manual_with_pivot(
-                        manual_with_key, "__KEY__", manual_value, manual_pivot, manual_filters
-                    )
-                    self.manual_sample.set_pivot_preview(pivot_df, manual_pivot, filter_col, True, clean_rules)
-                except Exception as e:
-                    # 如果透视失败，显示KEY预览
-                    self.manual_sample.set_key_preview(manual_agg, "__KEY__", len(manual_agg), "手工表", clean_rules)
+                self.manual_sample.set_pivot_preview(manual_agg, manual_pivot, filter_col, True, clean_rules)
             else:
                 # 默认显示KEY预览（与系统表样例格式一致）
                 self.manual_sample.set_key_preview(manual_agg, "__KEY__", len(manual_agg), "手工表", clean_rules)
@@ -615,19 +596,7 @@ class QtResultPreview(QWidget):
             self.system_sample.set_key_preview(system_agg, "__KEY__", len(system_agg), "系统表")
             
             # 使用实际透视值
-            pivot_values = actual_pivot_values if actual_pivot_values else pivot_values
-            
-            # 确定数值列名
-            manual_val_name = manual_value if manual_value else ""
-            system_val_name = "系统总计" if pivot_col else (system_value if system_value else "")
-            
-            # 合并比对
-            result_df = CompareEngine.merge_and_compare(
-                manual_agg, system_agg, "__KEY__",
-                manual_val_name, system_val_name,
-                diff_formula=config.get("difference_formula", "M - S"),
-                pivot_values=pivot_values
-            )
+            pivot_values = outcome.pivot_values if outcome.pivot_values else pivot_values
             
             # 构建导出列顺序（与导出一致）
             export_columns = self._get_export_columns(result_df, pivot_values)
@@ -700,7 +669,7 @@ class QtResultPreview(QWidget):
         col_info_parts = []
         for col, letter in sorted(self.column_letters.items(), key=lambda x: x[1]):
             display_name = col if col != "__KEY__" else "KEY"
-            if display_name != "KEY" and display_name != "比对状态":
+            if display_name not in ("KEY", "比对状态", OVERALL_STATUS):
                 col_info_parts.append(f"{letter}={display_name}")
         
         if col_info_parts:
@@ -736,9 +705,10 @@ class QtResultPreview(QWidget):
             headers.append(f"{letter}({display_name})" if letter else display_name)
         self.preview_table.setHorizontalHeaderLabels(headers)
         
-        # 填充数据（带状态颜色）
+        # 填充数据（带状态颜色，有附加指标时按综合状态）
+        status_col = status_column(df)
         for i, (_, row) in enumerate(df.iterrows()):
-            status = row.get("比对状态", "")
+            status = row.get(status_col, "")
             
             # 根据状态选择颜色
             if "✓" in str(status) or "一致" in str(status):
@@ -797,6 +767,7 @@ class QtResultPreview(QWidget):
         4. 手工数量
         5. 差值
         6. 比对状态
+        7. 附加指标（系统X、手工X、X差值、X状态）和综合状态
         """
         cols = []
         
@@ -825,6 +796,12 @@ class QtResultPreview(QWidget):
         if "比对状态" in df.columns:
             cols.append("比对状态")
         
+        # 7. 附加指标和综合状态
+        for name in measure_names(df):
+            cols.extend(c for c in Measure(name, "", "").columns if c in df.columns)
+        if OVERALL_STATUS in df.columns:
+            cols.append(OVERALL_STATUS)
+        
         return cols if cols else list(df.columns)
     
     def update_result_preview(self, result_df: pd.DataFrame, pivot_values: List[str], 
@@ -858,16 +835,20 @@ class QtResultPreview(QWidget):
                 manual_pivot = config.get("manual_pivot", {})
                 clean_rules = config.get("clean_rules", [])
                 
+                from core.clean_plan import CleanRuleError
                 from core.compare_engine import CompareEngine
+                from core.filter_plan import FilterPlan
                 
-                # 应用清洗规则
-                manual_df_cleaned = manual_df.copy()
+                # 应用清洗规则（清洗返回新表，输入表不修改）
+                manual_df_cleaned = manual_df
                 if clean_rules:
-                    manual_df_cleaned = CompareEngine.clean_column(manual_df_cleaned, clean_rules)
+                    try:
+                        manual_df_cleaned = CompareEngine.clean_column(manual_df_cleaned, clean_rules)
+                    except CleanRuleError as e:
+                        print(f"[WARN] 预览跳过清洗规则: {e}")
                 
                 manual_with_key = CompareEngine.make_key(manual_df_cleaned, manual_keys)
-                manual_filters = [(f["column"], f["operator"], f["value"]) 
-                                 for f in config.get("manual_filters", [])]
+                manual_filters = FilterPlan.from_config(config.get("manual_filters", []))
                 
                 # 更新手工表样例
                 if manual_pivot and manual_pivot.get("pivot_column"):
@@ -896,9 +877,8 @@ class QtResultPreview(QWidget):
                     self.manual_sample.set_key_preview(manual_agg, "__KEY__", len(manual_agg), "手工表", clean_rules)
                 
                 # 系统表样例：只显示KEY供检查匹配
-                system_with_key = CompareEngine.make_key(system_df.copy(), system_keys)
-                system_filters = [(f["column"], f["operator"], f["value"]) 
-                                 for f in config.get("system_filters", [])]
+                system_with_key = CompareEngine.make_key(system_df, system_keys)
+                system_filters = FilterPlan.from_config(config.get("system_filters", []))
                 pivot_config = config.get("pivot_column", {})
                 pivot_col = pivot_config.get("system") if isinstance(pivot_config, dict) else pivot_config
                 
@@ -954,11 +934,12 @@ class QtResultPreview(QWidget):
         self.preview_table.setHorizontalHeaderLabels(headers)
         
         # 填充数据
-        status_col_idx = list(df.columns).index("比对状态") if "比对状态" in df.columns else -1
+        status_col = status_column(df)
+        status_col_idx = list(df.columns).index(status_col) if status_col in df.columns else -1
         
         for i, (_, row) in enumerate(df.iterrows()):
-            # 获取状态颜色
-            status = row.get("比对状态", "") if status_col_idx >= 0 else ""
+            # 获取状态颜色（有附加指标时按综合状态）
+            status = row.get(status_col, "") if status_col_idx >= 0 else ""
             bg_color, fg_color = self._get_status_colors(status)
             
             for j, col in enumerate(df.columns):
@@ -1043,6 +1024,7 @@ class QtResultTable(QWidget):
         4. 手工数量
         5. 差值
         6. 比对状态
+        7. 附加指标（系统X、手工X、X差值、X状态）和综合状态
         """
         cols = []
         
@@ -1071,6 +1053,12 @@ class QtResultTable(QWidget):
         if "比对状态" in df.columns:
             cols.append("比对状态")
         
+        # 7. 附加指标和综合状态
+        for name in measure_names(df):
+            cols.extend(c for c in Measure(name, "", "").columns if c in df.columns)
+        if OVERALL_STATUS in df.columns:
+            cols.append(OVERALL_STATUS)
+        
         return cols if cols else list(df.columns)
         
     def _setup_ui(self):
@@ -1175,11 +1163,12 @@ class QtResultTable(QWidget):
             self._update_formula_display(config, pivot_values)
         
         # 状态列索引
-        status_col_idx = list(display_df.columns).index('比对状态') if '比对状态' in display_df.columns else -1
+        status_col = status_column(display_df)
+        status_col_idx = list(display_df.columns).index(status_col) if status_col in display_df.columns else -1
         
         for i, (_, row) in enumerate(display_df.iterrows()):
-            # 获取状态
-            status = row.get('比对状态', '') if status_col_idx >= 0 else ''
+            # 获取状态（有附加指标时按综合状态）
+            status = row.get(status_col, '') if status_col_idx >= 0 else ''
             
             # 根据状态设置行颜色
             status_str = str(status) if status else ""
@@ -1259,7 +1248,7 @@ class QtResultTable(QWidget):
         col_info_parts = []
         for col, letter in sorted(self.column_letters.items(), key=lambda x: x[1]):
             display_name = col if col != "__KEY__" else "KEY"
-            if display_name != "KEY" and display_name != "比对状态":
+            if display_name not in ("KEY", "比对状态", OVERALL_STATUS):
                 col_info_parts.append(f"{letter}={display_name}")
         
         if col_info_parts:
@@ -1,12 +1,16 @@
 """
 工具模块
 """
-from .excel_utils import load_excel, get_sheet_names
+from .excel_utils import (
+    load_excel, iter_excel_chunks, get_sheet_names, get_template_columns, get_all_columns
+)
+from .multi_loader import load_consolidated
 from .storage import load_config, save_config, load_templates, save_template, delete_template
 from .excel_detection import auto_detect_active_workbook
 
 __all__ = [
-    "load_excel", "get_sheet_names",
+    "load_excel", "iter_excel_chunks", "get_sheet_names", "get_template_columns", "get_all_columns",
+    "load_consolidated",
     "load_config", "save_config", "load_templates", "save_template", "delete_template",
     "auto_detect_active_workbook"
 ]
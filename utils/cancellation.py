@@ -0,0 +1,34 @@
+"""
+加载取消 - 后台加载被新的请求取代时尽早中断解析
+
+取消标志按线程保存：在 cancel_scope 中运行的加载，读取过程中的检查点
+（check_cancelled）发现标志已设置时抛出 LoadCancelled。
+没有进入 cancel_scope 的线程检查点不做任何事。
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+_local = threading.local()
+
+
+class LoadCancelled(Exception):
+    """加载已被取消"""
+
+
+@contextmanager
+def cancel_scope(event: threading.Event) -> Iterator[threading.Event]:
+    """在当前线程中以 event 作为取消标志"""
+    previous = getattr(_local, "event", None)
+    _local.event = event
+    try:
+        yield event
+    finally:
+        _local.event = previous
+
+
+def check_cancelled():
+    """当前线程的加载已取消时抛出 LoadCancelled"""
+    event = getattr(_local, "event", None)
+    if event is not None and event.is_set():
+        raise LoadCancelled("加载已取消")
@@ -0,0 +1,118 @@
+"""
+列概况模块 - 每个已加载的表只统计一次各列的类型、缺失数、基数和常见值
+
+筛选条件的下拉框、透视列选择都从概况中取唯一值，不再每次加载都对
+每一列执行 dropna().unique()。高基数列（订单号、料号等）只扫描开头
+一段就停止计数，基数为估计值。
+
+概况按 DataFrame 对象缓存，表被释放时缓存随之删除；可在后台线程中
+预先计算（get_profiles），界面线程再次获取时直接命中。
+"""
+import threading
+import weakref
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+LOW_CARDINALITY_LIMIT = 100  # 不同值不超过此数量的列保存全部唯一值
+TOP_N = 10                   # 保存出现次数最多的值的个数
+_PROBE_ROWS = 8192           # 先在开头多少行中计数，已超过上限时不再扫描全列
+
+
+class ColumnProfile(NamedTuple):
+    """单列概况"""
+    dtype: str
+    null_count: int
+    cardinality: int                      # 不同值个数（cardinality_exact 为 False 时为估计值）
+    cardinality_exact: bool
+    top_values: List[Tuple[object, int]]  # [(值, 出现次数), ...]，按次数降序
+    uniques: Optional[List]               # 低基数列的全部唯一值（已排序），高基数列为 None
+
+
+_profiles: Dict[int, Dict[str, ColumnProfile]] = {}
+_profiles_lock = threading.Lock()
+
+
+def profile_column(series: pd.Series, limit: int = LOW_CARDINALITY_LIMIT,
+                   top_n: int = TOP_N) -> ColumnProfile:
+    """
+    统计一列的概况
+
+    不同值超过 limit 时 uniques 为 None；只扫描了开头一段时基数按 Chao1 方法
+    （由只出现一次、两次的值的个数）估计，常见值也只来自已扫描部分。
+    """
+    n = len(series)
+    null_count = int(series.isna().sum())
+    probe = series.iloc[:_PROBE_ROWS]
+    counts = probe.value_counts(dropna=True)
+    exact = len(probe) == n
+    if not exact and len(counts) <= limit:
+        counts = series.value_counts(dropna=True)
+        exact = True
+
+    if exact:
+        cardinality = len(counts)
+    else:
+        once = int((counts == 1).sum())
+        twice = int((counts == 2).sum())
+        estimate = len(counts) + once * (once - 1) // (2 * (twice + 1))
+        cardinality = min(estimate, n - null_count)
+
+    top_values = list(zip(counts.index[:top_n].tolist(), counts.iloc[:top_n].tolist()))
+    uniques = None
+    if exact and cardinality <= limit:
+        uniques = _sorted_values(counts.index.tolist())
+    return ColumnProfile(str(series.dtype), null_count, int(cardinality), exact, top_values, uniques)
+
+
+def _sorted_values(values: list) -> list:
+    try:
+        return sorted(values)
+    except TypeError:
+        # 数字与文本混合的列按文本排序
+        return sorted(values, key=str)
+
+
+def profile_table(df: pd.DataFrame) -> Dict[str, ColumnProfile]:
+    """统计表中每一列的概况（不使用缓存）"""
+    return {col: profile_column(df.iloc[:, i]) for i, col in enumerate(df.columns)}
+
+
+def get_profiles(df: pd.DataFrame) -> Dict[str, ColumnProfile]:
+    """
+    获取表的列概况（同一个 DataFrame 只统计一次）
+
+    DataFrame 被修改列后应调用 clear_profiles 使缓存失效。
+    """
+    key = id(df)
+    with _profiles_lock:
+        profiles = _profiles.get(key)
+    if profiles is not None and list(profiles) == list(df.columns):
+        return profiles
+
+    profiles = profile_table(df)
+    with _profiles_lock:
+        if key not in _profiles:
+            # 表被释放时删除缓存（id 可能被新对象复用）
+            weakref.finalize(df, _drop, key)
+        _profiles[key] = profiles
+    return profiles
+
+
+def _drop(key: int):
+    with _profiles_lock:
+        _profiles.pop(key, None)
+
+
+def clear_profiles(df: Optional[pd.DataFrame] = None):
+    """清除指定表（或全部）的概况缓存"""
+    with _profiles_lock:
+        if df is None:
+            _profiles.clear()
+        else:
+            _profiles.pop(id(df), None)
+
+
+def unique_values(profiles: Dict[str, ColumnProfile]) -> Dict[str, List]:
+    """低基数列的唯一值 {列名: [值, ...]}（供筛选下拉框、透视列选择使用）"""
+    return {col: p.uniques for col, p in profiles.items() if p.uniques is not None}
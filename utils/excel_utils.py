@@ -1,10 +1,275 @@
 """
 Excel 工具模块 - 文件读取和Sheet处理
 """
+import numpy as np
 import pandas as pd
-from typing import List, Optional
+from pandas.api.types import infer_dtype
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 import os
 
+from config.settings import ARROW_STRING_DTYPE, EXCEL_READER, STREAM_CHUNK_ROWS
+from . import flat_reader, sheet_cache, xlsx_reader
+from .cancellation import LoadCancelled, check_cancelled
+
+
+# ============== 读取后端 ==============
+# 每个后端提供一组 ExcelReader 函数，由 EXCEL_READER 配置选择，
+# 失败时按顺序回退到下一个后端。
+# 读取Sheet时 columns 为只读取的列序号（0开始），None 表示全部列。
+
+# header_row 取此值时在加载过程中自动检测表头行（见 detect_header_row）
+HEADER_AUTO = "auto"
+HEADER_SCAN_ROWS = 10  # 自动检测表头时扫描的行数
+
+
+class ExcelReader(NamedTuple):
+    """读取后端"""
+    sheet_names: Callable    # (filepath) -> Sheet名称列表
+    read_sheet: Callable     # (filepath, sheet_name, header_row, skip_rows, columns) -> DataFrame
+    read_header: Callable    # (filepath, sheet_name, header_row, skip_rows) -> 列名列表
+    read_head: Callable      # (filepath, sheet_name, nrows) -> 前N行（无表头）DataFrame
+    # (filepath, sheet_name) -> 全部原始行（格式同 xlsx_reader.read_sheet_rows）；
+    # None 表示不支持，自动检测表头时单独读取前几行
+    read_rows: Optional[Callable] = None
+
+
+def _fast_sheet_names(filepath: str) -> List[str]:
+    return xlsx_reader.list_sheet_names(filepath)
+
+
+def _fast_read_sheet(filepath: str, sheet_name: str, header_row: int,
+                     skip_rows: Optional[int],
+                     columns: Optional[List[int]] = None) -> pd.DataFrame:
+    rows = xlsx_reader.read_sheet_rows(filepath, sheet_name, columns=columns)
+    return rows_to_dataframe(rows, header_row, skip_rows)
+
+
+def _fast_read_header(filepath: str, sheet_name: str, header_row: int,
+                      skip_rows: Optional[int]) -> List[str]:
+    max_rows = (skip_rows or 0) + header_row + 1
+    rows = xlsx_reader.read_sheet_rows(filepath, sheet_name, max_rows=max_rows)
+    return list(rows_to_dataframe(rows, header_row, skip_rows).columns)
+
+
+def _fast_read_head(filepath: str, sheet_name: str, nrows: int) -> pd.DataFrame:
+    rows = xlsx_reader.read_sheet_rows(filepath, sheet_name, max_rows=nrows)
+    return rows_to_dataframe(rows, header_row=None)
+
+
+def _fast_read_rows(filepath: str, sheet_name: str) -> List[list]:
+    return xlsx_reader.read_sheet_rows(filepath, sheet_name)
+
+
+def _openpyxl_sheet_names(filepath: str) -> List[str]:
+    from openpyxl import load_workbook
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    sheets = wb.sheetnames
+    wb.close()
+    return sheets
+
+
+def _pandas_read_kwargs(engine: str, sheet_name: str, header_row: int,
+                        skip_rows: Optional[int]) -> dict:
+    read_kwargs = {"sheet_name": sheet_name, "header": header_row, "engine": engine}
+    if skip_rows:
+        read_kwargs["skiprows"] = skip_rows
+    return read_kwargs
+
+
+def _openpyxl_read_sheet(filepath: str, sheet_name: str, header_row: int,
+                         skip_rows: Optional[int],
+                         columns: Optional[List[int]] = None) -> pd.DataFrame:
+    read_kwargs = _pandas_read_kwargs("openpyxl", sheet_name, header_row, skip_rows)
+    if columns is not None:
+        read_kwargs["usecols"] = columns
+    return pd.read_excel(filepath, **read_kwargs)
+
+
+def _openpyxl_read_header(filepath: str, sheet_name: str, header_row: int,
+                          skip_rows: Optional[int]) -> List[str]:
+    read_kwargs = _pandas_read_kwargs("openpyxl", sheet_name, header_row, skip_rows)
+    return list(pd.read_excel(filepath, nrows=0, **read_kwargs).columns)
+
+
+def _openpyxl_read_head(filepath: str, sheet_name: str, nrows: int) -> pd.DataFrame:
+    return pd.read_excel(filepath, sheet_name=sheet_name, header=None, nrows=nrows,
+                         engine="openpyxl")
+
+
+def _xlrd_sheet_names(filepath: str) -> List[str]:
+    try:
+        import xlrd
+        workbook = xlrd.open_workbook(filepath)
+        return workbook.sheet_names()
+    except ImportError:
+        # 如果没有xlrd，尝试用pandas
+        excel_file = pd.ExcelFile(filepath, engine='xlrd')
+        return excel_file.sheet_names
+
+
+def _xlrd_read_sheet(filepath: str, sheet_name: str, header_row: int,
+                     skip_rows: Optional[int],
+                     columns: Optional[List[int]] = None) -> pd.DataFrame:
+    read_kwargs = _pandas_read_kwargs("xlrd", sheet_name, header_row, skip_rows)
+    if columns is not None:
+        read_kwargs["usecols"] = columns
+    return pd.read_excel(filepath, **read_kwargs)
+
+
+def _xlrd_read_header(filepath: str, sheet_name: str, header_row: int,
+                      skip_rows: Optional[int]) -> List[str]:
+    read_kwargs = _pandas_read_kwargs("xlrd", sheet_name, header_row, skip_rows)
+    return list(pd.read_excel(filepath, nrows=0, **read_kwargs).columns)
+
+
+def _xlrd_read_head(filepath: str, sheet_name: str, nrows: int) -> pd.DataFrame:
+    return pd.read_excel(filepath, sheet_name=sheet_name, header=None, nrows=nrows,
+                         engine="xlrd")
+
+
+def _csv_sheet_names(filepath: str) -> List[str]:
+    return [flat_reader.sheet_name_for(filepath)]
+
+
+def _csv_read_sheet(filepath: str, sheet_name: str, header_row: int,
+                    skip_rows: Optional[int],
+                    columns: Optional[List[int]] = None) -> pd.DataFrame:
+    rows = flat_reader.read_csv_rows(filepath, columns=columns)
+    return rows_to_dataframe(rows, header_row, skip_rows)
+
+
+def _csv_read_header(filepath: str, sheet_name: str, header_row: int,
+                     skip_rows: Optional[int]) -> List[str]:
+    max_rows = (skip_rows or 0) + header_row + 1
+    rows = flat_reader.read_csv_rows(filepath, max_rows=max_rows)
+    return list(rows_to_dataframe(rows, header_row, skip_rows).columns)
+
+
+def _csv_read_head(filepath: str, sheet_name: str, nrows: int) -> pd.DataFrame:
+    rows = flat_reader.read_csv_rows(filepath, max_rows=nrows)
+    return rows_to_dataframe(rows, header_row=None)
+
+
+def _csv_read_rows(filepath: str, sheet_name: str) -> List[list]:
+    return flat_reader.read_csv_rows(filepath)
+
+
+def _arrow_csv_read_sheet(filepath: str, sheet_name: str, header_row: int,
+                          skip_rows: Optional[int],
+                          columns: Optional[List[int]] = None) -> pd.DataFrame:
+    # 表头按 csv 模块 + TextParser 解析，保证列名与回退路径一致
+    names = _csv_read_header(filepath, sheet_name, header_row, skip_rows)
+    if not names:
+        return pd.DataFrame()
+    include = [names[i] for i in columns] if columns is not None else None
+    return flat_reader.read_csv_arrow(filepath, names, (skip_rows or 0) + header_row + 1, include)
+
+
+def _parquet_read_sheet(filepath: str, sheet_name: str, header_row: int,
+                        skip_rows: Optional[int],
+                        columns: Optional[List[int]] = None) -> pd.DataFrame:
+    # Parquet 自带列名和类型，表头行、跳过行数不适用
+    names = None
+    if columns is not None:
+        all_names = flat_reader.parquet_columns(filepath)
+        names = [all_names[i] for i in columns]
+    return flat_reader.read_parquet(filepath, names)
+
+
+def _parquet_read_header(filepath: str, sheet_name: str, header_row: int,
+                         skip_rows: Optional[int]) -> List[str]:
+    return flat_reader.parquet_columns(filepath)
+
+
+def _parquet_read_head(filepath: str, sheet_name: str, nrows: int) -> pd.DataFrame:
+    return pd.DataFrame(flat_reader.read_parquet_head(filepath, nrows))
+
+
+EXCEL_READERS: Dict[str, ExcelReader] = {
+    "fast": ExcelReader(_fast_sheet_names, _fast_read_sheet, _fast_read_header, _fast_read_head,
+                        _fast_read_rows),
+    "openpyxl": ExcelReader(_openpyxl_sheet_names, _openpyxl_read_sheet,
+                            _openpyxl_read_header, _openpyxl_read_head),
+    "xlrd": ExcelReader(_xlrd_sheet_names, _xlrd_read_sheet, _xlrd_read_header, _xlrd_read_head),
+    "arrow_csv": ExcelReader(_csv_sheet_names, _arrow_csv_read_sheet, _csv_read_header, _csv_read_head),
+    "csv": ExcelReader(_csv_sheet_names, _csv_read_sheet, _csv_read_header, _csv_read_head,
+                       _csv_read_rows),
+    "parquet": ExcelReader(_csv_sheet_names, _parquet_read_sheet,
+                           _parquet_read_header, _parquet_read_head),
+}
+
+
+def get_reader_chain(filepath: str) -> List[str]:
+    """
+    按扩展名和 EXCEL_READER 配置确定读取后端顺序
+    
+    Args:
+        filepath: Excel / CSV / TSV / Parquet 文件路径
+    
+    Returns:
+        后端名称列表，前一个失败时使用下一个
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext in flat_reader.CSV_EXTENSIONS:
+        # pyarrow 多线程解析，行宽不一致等情况回退到 csv 模块
+        return ["arrow_csv", "csv"] if flat_reader.has_pyarrow() else ["csv"]
+    if ext in flat_reader.PARQUET_EXTENSIONS:
+        return ["parquet"]
+    if ext == ".xls":
+        # 旧版xls格式只能使用xlrd
+        return ["xlrd"]
+    if EXCEL_READER == "openpyxl":
+        return ["openpyxl"]
+    # auto / fast：流式读取器优先，失败回退openpyxl
+    return ["fast", "openpyxl"]
+
+
+def _call_readers(filepath: str, method: str, *args):
+    """依次尝试读取后端的 method（ExcelReader 字段名）"""
+    chain = get_reader_chain(filepath)
+    for i, name in enumerate(chain):
+        try:
+            return getattr(EXCEL_READERS[name], method)(filepath, *args)
+        except LoadCancelled:
+            raise
+        except Exception as e:
+            if i == len(chain) - 1:
+                raise
+            print(f"[WARN] 读取后端 {name} 失败，回退到 {chain[i + 1]}: {e}")
+
+
+def rows_to_dataframe(rows: List[list], header_row: Optional[int] = 0,
+                      skip_rows: Optional[int] = None) -> pd.DataFrame:
+    """
+    将行数据转换为DataFrame
+    
+    使用与 pd.read_excel 相同的 TextParser，表头、缺失值和类型推断规则一致。
+    
+    Args:
+        rows: 行列表（空单元格为 ""）
+        header_row: 表头行索引（0开始），None 表示没有表头
+        skip_rows: 跳过行数
+    
+    Returns:
+        DataFrame
+    """
+    from pandas.errors import EmptyDataError
+    from pandas.io.parsers import TextParser
+    
+    if not rows:
+        return pd.DataFrame()
+    try:
+        parser = TextParser(
+            rows,
+            header=header_row,
+            skiprows=skip_rows or None,
+            skip_blank_lines=False,
+        )
+        return parser.read()
+    except EmptyDataError:
+        return pd.DataFrame()
+
 
 def get_sheet_names(filepath: str) -> List[str]:
     """
@@ -16,95 +281,379 @@ def get_sheet_names(filepath: str) -> List[str]:
     Returns:
         Sheet名称列表
     """
-    ext = os.path.splitext(filepath)[1].lower()
+    return _call_readers(filepath, "sheet_names")
+
+
+def get_template_columns(config: dict) -> Dict[str, List[str]]:
+    """
+    获取对账配置引用的列
     
-    # 使用openpyxl引擎（支持xlsx）或xlrd引擎（支持xls）
-    if ext == ".xls":
-        # 旧版xls格式使用xlrd
-        try:
-            import xlrd
-            workbook = xlrd.open_workbook(filepath)
-            return workbook.sheet_names()
-        except ImportError:
-            # 如果没有xlrd，尝试用pandas
-            excel_file = pd.ExcelFile(filepath, engine='xlrd')
-            return excel_file.sheet_names
-    else:
-        # xlsx/xlsm格式使用openpyxl
-        from openpyxl import load_workbook
-        wb = load_workbook(filepath, read_only=True, data_only=True)
-        sheets = wb.sheetnames
-        wb.close()
-        return sheets
+    包括主键映射、数值列（含附加指标）、透视列、手工表透视、筛选条件和清洗规则
+    （清洗规则只作用于手工表）。
+    
+    Args:
+        config: 对账配置（QtConfigPanel.get_config() 的格式）
+    
+    Returns:
+        {"manual": [...], "system": [...]}，按首次出现的顺序去重
+    """
+    manual: List[str] = []
+    system: List[str] = []
+    
+    def add(columns: List[str], col) -> None:
+        if col and isinstance(col, str) and col not in columns:
+            columns.append(col)
+    
+    for mapping in config.get("key_mappings", []):
+        add(manual, mapping.get("manual"))
+        add(system, mapping.get("system"))
+    
+    value_mapping = config.get("value_mapping", {})
+    add(manual, value_mapping.get("manual"))
+    add(system, value_mapping.get("system"))
+    for measure in config.get("extra_measures", []) or []:
+        add(manual, measure.get("manual"))
+        add(system, measure.get("system"))
+    
+    pivot_config = config.get("pivot_column", {})
+    add(system, pivot_config.get("system") if isinstance(pivot_config, dict) else pivot_config)
+    add(manual, config.get("manual_pivot", {}).get("pivot_column"))
+    
+    for f in config.get("manual_filters", []):
+        add(manual, f.get("column"))
+    for f in config.get("system_filters", []):
+        add(system, f.get("column"))
+    for rule in config.get("clean_rules", []):
+        add(manual, rule.get("column"))
+    
+    return {"manual": manual, "system": system}
+
+
+def get_all_columns(df: pd.DataFrame) -> List[str]:
+    """
+    获取Sheet的完整列名列表
+    
+    按列投影加载的DataFrame只包含部分列，完整列名保存在 df.attrs["all_columns"]。
+    """
+    return list(df.attrs.get("all_columns") or df.columns)
+
+
+def read_columns(filepath: str, sheet_name: str,
+                 header_row: int = 0,
+                 skip_rows: Optional[int] = None) -> List[str]:
+    """
+    只读取表头，获取Sheet的列名（已按 clean_dataframe 的规则清理）
+    
+    Args:
+        filepath: Excel文件路径
+        sheet_name: Sheet名称
+        header_row: 表头行索引（0开始）
+        skip_rows: 跳过行数
+    
+    Returns:
+        列名列表
+    """
+    columns = _call_readers(filepath, "read_header", sheet_name, header_row, skip_rows)
+    return _clean_column_names(columns)
 
 
 def load_excel(filepath: str, sheet_name: str, 
-               header_row: int = 0,
-               skip_rows: Optional[int] = None) -> pd.DataFrame:
+               header_row: Union[int, str] = 0,
+               skip_rows: Optional[int] = None,
+               use_cache: bool = True,
+               usecols: Optional[List[str]] = None) -> pd.DataFrame:
     """
     加载Excel数据为DataFrame
     
+    也支持 CSV/TSV/Parquet（Sheet名称为文件名，见 flat_reader）。
+    解析并清理后的结果会写入Sheet缓存（见 sheet_cache），
+    再次打开同一文件的同一Sheet时直接读取缓存。
+    
+    指定 usecols 时先读取表头，只解析其中存在的列；Sheet中没有
+    任何一列时按全部列加载。完整列名保存在 df.attrs["all_columns"]
+    （见 get_all_columns）。
+    
+    header_row 为 HEADER_AUTO 时自动检测表头行，结果保存在 df.attrs["header_row"]，
+    并按文件内容写入缓存，再次加载时不再检测。流式xlsx读取器和 csv 模块
+    在读取全部行的同一次解析中检测表头，不再单独读取前几行。
+    
     Args:
         filepath: Excel文件路径
         sheet_name: Sheet名称
-        header_row: 表头行索引（0开始）
+        header_row: 表头行索引（0开始），或 HEADER_AUTO
         skip_rows: 跳过行数
+        use_cache: 是否使用Sheet缓存
+        usecols: 只加载的列名（通常来自 get_template_columns）
     
     Returns:
         DataFrame
     """
-    ext = os.path.splitext(filepath)[1].lower()
+    rows = None
+    auto_header = header_row == HEADER_AUTO
+    if auto_header:
+        header_row, rows = _resolve_header_row(filepath, sheet_name, skip_rows, use_cache)
     
-    read_kwargs = {
-        "sheet_name": sheet_name,
-        "header": header_row,
-    }
+    df = _load_sheet(filepath, sheet_name, header_row, skip_rows, use_cache, usecols, rows)
+    if auto_header:
+        df.attrs["header_row"] = header_row
+    return df
+
+
+def _load_sheet(filepath: str, sheet_name: str, header_row: int,
+                skip_rows: Optional[int], use_cache: bool,
+                usecols: Optional[List[str]], rows: Optional[List[list]]) -> pd.DataFrame:
+    """load_excel 的主体（rows 为已读取的全部原始行时不再调用读取后端）"""
+    all_columns, indices = _select_columns(filepath, sheet_name, header_row, skip_rows, usecols, rows)
+    selected = [all_columns[i] for i in indices] if indices is not None else None
     
-    if skip_rows:
-        read_kwargs["skiprows"] = skip_rows
+    cache_key = None
+    if use_cache and sheet_cache.is_cache_available():
+        full_key = sheet_cache.make_cache_key(
+            filepath, sheet_name, header_row=header_row, skip_rows=skip_rows
+        )
+        # 已缓存完整Sheet时直接按列读取；与只解析所选列时相同，去除所选列全空的行
+        cached = sheet_cache.load_cached_sheet(full_key, columns=selected)
+        if cached is not None and selected is not None:
+            cached = cached.dropna(how="all")
+        cache_key = full_key
+        if cached is None and selected is not None:
+            cache_key = sheet_cache.make_cache_key(
+                filepath, sheet_name, header_row=header_row, skip_rows=skip_rows,
+                usecols=selected
+            )
+            cached = sheet_cache.load_cached_sheet(cache_key)
+        if cached is not None:
+            return _set_all_columns(cached, all_columns)
     
-    # 根据扩展名选择引擎
-    if ext == ".xls":
-        try:
-            read_kwargs["engine"] = "xlrd"
-        except:
-            pass
+    if rows is not None:
+        if indices is not None:
+            rows = [[row[i] for i in indices] for row in rows]
+        df = rows_to_dataframe(rows, header_row, skip_rows)
     else:
-        read_kwargs["engine"] = "openpyxl"
-    
-    df = pd.read_excel(filepath, **read_kwargs)
+        df = _call_readers(filepath, "read_sheet", sheet_name, header_row, skip_rows, indices)
+    check_cancelled()
+    if selected is not None:
+        if len(df.columns) == len(selected):
+            df.columns = selected
+        elif df.empty:
+            df = pd.DataFrame(columns=selected)
     
     # 清理数据
     df = clean_dataframe(df)
+    if ARROW_STRING_DTYPE:
+        df = to_arrow_strings(df)
+    df = _set_all_columns(df, all_columns)
+    
+    if cache_key:
+        sheet_cache.save_cached_sheet(cache_key, df)
     
     return df
 
 
+def iter_excel_chunks(filepath: str, sheet_name: str,
+                      header_row: Union[int, str] = 0,
+                      skip_rows: Optional[int] = None,
+                      usecols: Optional[List[str]] = None,
+                      chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    分块读取Excel数据
+    
+    每块都按 load_excel 的规则清理，索引接续（与整表加载时的行号一致），
+    所有块拼接后与 load_excel 的结果值相同。类型按块单独推断，同一列在
+    不同块中可能是 int64 / float64 / object。xlsx 用流式读取器逐行解析，
+    内存只与块大小有关；其他格式或流式读取失败时整表加载后切块。
+    
+    Args:
+        filepath: Excel文件路径
+        sheet_name: Sheet名称
+        header_row: 表头行索引（0开始），HEADER_AUTO 时先读取前几行检测
+        skip_rows: 跳过行数
+        usecols: 只读取的列名（同 load_excel）
+        chunk_rows: 每块行数，默认 STREAM_CHUNK_ROWS
+    
+    Yields:
+        DataFrame
+    """
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    if header_row == HEADER_AUTO:
+        header_row = detect_header_row(filepath, sheet_name, skip_rows=skip_rows)
+    if get_reader_chain(filepath)[0] == "fast":
+        chunks = _fast_iter_chunks(filepath, sheet_name, header_row, skip_rows, usecols, chunk_rows)
+        try:
+            first = next(chunks, None)
+        except Exception as e:
+            print(f"[WARN] 流式读取失败，改为整表加载: {e}")
+        else:
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+    
+    df = load_excel(filepath, sheet_name, header_row, skip_rows, usecols=usecols)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _fast_iter_chunks(filepath: str, sheet_name: str, header_row: int,
+                      skip_rows: Optional[int], usecols: Optional[List[str]],
+                      chunk_rows: int) -> Iterator[pd.DataFrame]:
+    all_columns, indices = _select_columns(filepath, sheet_name, header_row, skip_rows, usecols)
+    selected = [all_columns[i] for i in indices] if indices is not None else None
+    
+    rows = xlsx_reader.iter_sheet_rows(filepath, sheet_name, columns=indices)
+    head_rows = (skip_rows or 0) + header_row + 1
+    head = list(islice(rows, head_rows))
+    if len(head) < head_rows:
+        return
+    header = head[-1]
+    
+    offset = 0
+    chunk: List[list] = []
+    for values in rows:
+        chunk.append(values)
+        if len(chunk) >= chunk_rows:
+            df = _chunk_to_dataframe(header, chunk, offset, selected, all_columns)
+            offset += len(chunk)
+            chunk = []
+            if not df.empty:
+                yield df
+    if chunk:
+        df = _chunk_to_dataframe(header, chunk, offset, selected, all_columns)
+        if not df.empty:
+            yield df
+
+
+def _chunk_to_dataframe(header: list, rows: List[list], offset: int,
+                        selected: Optional[List[str]],
+                        all_columns: Optional[List[str]]) -> pd.DataFrame:
+    """表头 + 一块数据行 -> 清理后的DataFrame（宽度不足的行补空单元格）"""
+    width = max(len(header), max(len(row) for row in rows))
+    rows = [row + [""] * (width - len(row)) if len(row) < width else row
+            for row in [header] + rows]
+    df = rows_to_dataframe(rows, header_row=0)
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    if selected is not None and len(df.columns) == len(selected):
+        df.columns = selected
+    df = clean_dataframe(df)
+    return _set_all_columns(df, all_columns)
+
+
+def _select_columns(filepath: str, sheet_name: str, header_row: int,
+                    skip_rows: Optional[int], usecols: Optional[List[str]],
+                    rows: Optional[List[list]] = None):
+    """
+    usecols 对应的列序号（rows 为已读取的原始行时从中取表头）
+    
+    Returns:
+        (完整列名 或 None, 列序号列表 或 None)，没有匹配或全部匹配时列序号为 None
+    """
+    if usecols is None:
+        return None, None
+    if rows is not None:
+        head = rows[:(skip_rows or 0) + header_row + 1]
+        all_columns = _clean_column_names(rows_to_dataframe(head, header_row, skip_rows).columns)
+    else:
+        all_columns = read_columns(filepath, sheet_name, header_row, skip_rows)
+    wanted = set(usecols)
+    indices = [i for i, col in enumerate(all_columns) if col in wanted]
+    if not indices or len(indices) == len(all_columns):
+        indices = None
+    return all_columns, indices
+
+
+def _set_all_columns(df: pd.DataFrame, all_columns: Optional[List[str]]) -> pd.DataFrame:
+    df.attrs["all_columns"] = list(all_columns) if all_columns is not None else list(df.columns)
+    return df
+
+
+def _clean_column_names(columns) -> List[str]:
+    return [str(col).strip() if col is not None else f"Column_{i}"
+            for i, col in enumerate(columns)]
+
+
 def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     """
     清理DataFrame
     
     - 去除列名首尾空格
     - 去除全空行
-    - 字符串列去除首尾空格
+    - 字符串单元格去除首尾空格，'nan' 视为缺失；数字/日期等单元格保持原类型
+    - 对象列中的缺失值统一为 pd.NA
+    - 重复的字符串共用同一个对象（整个表共享）
     """
     # 清理列名
-    df.columns = [str(col).strip() if col is not None else f"Column_{i}" 
-                  for i, col in enumerate(df.columns)]
+    df.columns = _clean_column_names(df.columns)
     
     # 去除全空行
     df = df.dropna(how="all")
     
-    # 字符串列去空格
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col] = df[col].astype(str).str.strip()
-        # 将 'nan' 字符串转回 NaN
-        df[col] = df[col].replace("nan", pd.NA)
+    # 字符串单元格去空格（单次遍历，不改变非字符串单元格）
+    memo: Dict[str, object] = {}
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object:
+            df.isetitem(i, _normalize_object_values(df.iloc[:, i].to_numpy(), memo))
+        elif isinstance(dtype, pd.StringDtype):
+            # 字符串类型列（string[pyarrow]、pandas 3 的 str）直接用向量化操作
+            col = df.iloc[:, i].str.strip()
+            df.isetitem(i, col.mask((col == "nan").fillna(False)))
+    
+    return df
+
+
+def to_arrow_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    将纯文本的对象列转为 string[pyarrow] 类型
+    
+    含数字/日期单元格的混合列保持对象类型。未安装 pyarrow 时原样返回。
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return df
     
+    string_dtype = pd.StringDtype("pyarrow")
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object and infer_dtype(df.iloc[:, i], skipna=True) in ("string", "empty"):
+            df.isetitem(i, df.iloc[:, i].astype(string_dtype))
     return df
 
 
-def detect_header_row(filepath: str, sheet_name: str, max_scan: int = 10) -> int:
+def _normalize_string(value: str, memo: Dict[str, object]):
+    """去空格后的字符串（或 pd.NA），按原值缓存，结果相同的字符串共用一个对象"""
+    result = memo.get(value)
+    if result is None:
+        stripped = value.strip()
+        if stripped == "nan":
+            result = pd.NA
+        else:
+            result = memo.setdefault(stripped, stripped)
+        memo[value] = result
+    return result
+
+
+def _normalize_object_values(values: np.ndarray, memo: Dict[str, object]) -> np.ndarray:
+    """规范化对象列的值"""
+    if infer_dtype(values, skipna=True) == "string":
+        # 纯字符串列：按唯一值处理，codes 为 -1 的缺失值取末尾的 pd.NA
+        codes, uniques = pd.factorize(values)
+        cleaned = [_normalize_string(value, memo) for value in uniques]
+        cleaned.append(pd.NA)
+        return np.array(cleaned, dtype=object).take(codes)
+    
+    # 混合类型列：只处理字符串和缺失值
+    result = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        if isinstance(value, str):
+            result[i] = _normalize_string(value, memo)
+        elif value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+            result[i] = pd.NA
+        else:
+            result[i] = value
+    return result
+
+
+def detect_header_row(filepath: str, sheet_name: str, max_scan: int = HEADER_SCAN_ROWS,
+                      skip_rows: Optional[int] = None) -> int:
     """
     自动检测表头行
     
@@ -114,22 +663,61 @@ def detect_header_row(filepath: str, sheet_name: str, max_scan: int = 10) -> int
         filepath: Excel文件路径
         sheet_name: Sheet名称
         max_scan: 最大扫描行数
+        skip_rows: 跳过行数（返回的表头行索引从跳过之后算起，同 load_excel）
     
     Returns:
         表头行索引
     """
-    ext = os.path.splitext(filepath)[1].lower()
+    # 读取前N行（无表头）
+    skip = skip_rows or 0
+    df = _call_readers(filepath, "read_head", sheet_name, skip + max_scan)
+    return _best_header_row(df.iloc[skip:].reset_index(drop=True), max_scan)
+
+
+def _resolve_header_row(filepath: str, sheet_name: str, skip_rows: Optional[int],
+                        use_cache: bool) -> Tuple[int, Optional[List[list]]]:
+    """
+    自动检测表头行
     
-    engine = "xlrd" if ext == ".xls" else "openpyxl"
+    检测结果按文件内容缓存（见 sheet_cache.save_cached_header）。首选读取后端
+    支持 read_rows 时读取全部原始行并在其前几行中检测，原始行交给调用方
+    直接加载；否则只读取前几行检测。
     
-    # 读取前N行（无表头）
-    try:
-        df = pd.read_excel(filepath, sheet_name=sheet_name, 
-                          header=None, nrows=max_scan, engine=engine)
-    except:
-        df = pd.read_excel(filepath, sheet_name=sheet_name, 
-                          header=None, nrows=max_scan)
+    Returns:
+        (表头行索引, 全部原始行 或 None)
+    """
+    auto_key = None
+    if use_cache and sheet_cache.is_cache_available():
+        auto_key = sheet_cache.make_cache_key(
+            filepath, sheet_name, header_row=HEADER_AUTO, skip_rows=skip_rows
+        )
+        header_row = sheet_cache.load_cached_header(auto_key)
+        if header_row is not None:
+            return header_row, None
+    
+    rows = None
+    name = get_reader_chain(filepath)[0]
+    if EXCEL_READERS[name].read_rows is not None:
+        try:
+            rows = EXCEL_READERS[name].read_rows(filepath, sheet_name)
+        except LoadCancelled:
+            raise
+        except Exception as e:
+            print(f"[WARN] 读取后端 {name} 失败，单独检测表头: {e}")
+    if rows is not None:
+        skip = skip_rows or 0
+        head = rows_to_dataframe(rows[skip:skip + HEADER_SCAN_ROWS], header_row=None)
+        header_row = _best_header_row(head, HEADER_SCAN_ROWS)
+    else:
+        header_row = detect_header_row(filepath, sheet_name, skip_rows=skip_rows)
     
+    if auto_key:
+        sheet_cache.save_cached_header(auto_key, header_row)
+    return header_row, rows
+
+
+def _best_header_row(df: pd.DataFrame, max_scan: int) -> int:
+    """前 max_scan 行中非空值最多、且至少一半是文本的行"""
     best_row = 0
     max_non_empty = 0
     
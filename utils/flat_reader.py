@@ -0,0 +1,228 @@
+"""
+CSV / TSV / Parquet 读取模块 - 供 excel_utils 的读取后端使用
+
+CSV/TSV 有两种读取方式：
+- pyarrow.csv 多线程列式解析（快速路径）
+- csv 模块逐行读取，行数据交给 rows_to_dataframe（与xlsx相同的 TextParser 规则）
+两者的类型推断都由 TextParser 完成，经过 clean_dataframe 后结果一致。
+
+文件没有Sheet的概念，以文件名（不含扩展名）作为唯一的Sheet名称。
+编码按 BOM / UTF-8 / GB18030（兼容GBK）的顺序检测。
+"""
+import codecs
+import csv
+import os
+from itertools import islice
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+CSV_EXTENSIONS = (".csv", ".tsv")
+PARQUET_EXTENSIONS = (".parquet",)
+
+# 同 pandas 的默认缺失值标记（read_csv / read_excel 的 na_values）
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None",
+    "n/a", "nan", "null",
+]
+TRUE_VALUES = ["True", "TRUE", "true"]
+FALSE_VALUES = ["False", "FALSE", "false"]
+
+_ENCODING_SAMPLE_BYTES = 1 << 20
+_INFER_SAMPLE_SIZE = 64
+
+
+def has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def sheet_name_for(filepath: str) -> str:
+    """CSV/Parquet 文件的Sheet名称（文件名，不含扩展名）"""
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+
+def detect_encoding(filepath: str) -> str:
+    """
+    检测文本文件编码
+
+    有 BOM 时按 BOM；文件开头 1MB 是合法 UTF-8 时为 utf-8，否则按 GB18030
+    （GBK 的超集，ERP/WMS 导出的中文CSV多为GBK）。
+    """
+    with open(filepath, "rb") as f:
+        sample = f.read(_ENCODING_SAMPLE_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # 样本末尾可能截断在多字节字符中间
+        codecs.getincrementaldecoder("utf-8")().decode(
+            sample, final=len(sample) < _ENCODING_SAMPLE_BYTES
+        )
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+
+def delimiter_for(filepath: str) -> str:
+    return "\t" if filepath.lower().endswith(".tsv") else ","
+
+
+def read_csv_rows(filepath: str, max_rows: Optional[int] = None,
+                  columns: Optional[Sequence[int]] = None) -> List[list]:
+    """
+    用 csv 模块读取行
+
+    格式同 xlsx_reader.read_sheet_rows：空单元格为 ""，去掉末尾的空行，
+    所有行补齐到相同宽度。
+
+    Args:
+        filepath: 文件路径
+        max_rows: 最多读取的行数（None 表示全部）
+        columns: 只保留的列序号（0开始），None 表示全部列
+    """
+    encoding = detect_encoding(filepath)
+    try:
+        rows = _read_rows(filepath, encoding, max_rows)
+    except UnicodeDecodeError:
+        if encoding != "utf-8":
+            raise
+        # 开头是UTF-8、后面出现GBK字符
+        rows = _read_rows(filepath, "gb18030", max_rows)
+
+    if columns is not None:
+        rows = [[row[i] if i < len(row) else "" for i in columns] if row else []
+                for row in rows]
+    while rows and not any(rows[-1]):
+        rows.pop()
+    if rows:
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) if len(row) < width else row for row in rows]
+    return rows
+
+
+def _read_rows(filepath: str, encoding: str, max_rows: Optional[int]) -> List[list]:
+    with open(filepath, "r", encoding=encoding, newline="") as f:
+        return list(islice(csv.reader(f, delimiter=delimiter_for(filepath)), max_rows))
+
+
+def read_csv_arrow(filepath: str, column_names: List[str], skip_rows: int,
+                   columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    用 pyarrow.csv 多线程读取数据行
+
+    pyarrow 只负责解析和标记缺失值，所有列按文本读取；类型由 TextParser 在每列的
+    唯一值上推断（pyarrow 自带的推断会识别日期、十六进制整数等，与 pandas 不同），
+    再按字典编码映射回整列。
+
+    列名由调用方按 TextParser 规则从表头解析后传入（重复列名、空列名的处理与
+    xlsx 一致），skip_rows 为表头及之前的行数。行宽与表头不一致时 pyarrow 报错，
+    由调用方回退到 csv 模块。
+
+    Args:
+        filepath: 文件路径
+        column_names: 列名
+        skip_rows: 跳过的行数（含表头行）
+        columns: 只读取的列名，None 表示全部列
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    encoding = detect_encoding(filepath)
+    if encoding == "utf-8-sig":
+        # pyarrow 自动跳过 UTF-8 BOM，按 utf8 读取不需要转码
+        encoding = "utf8"
+
+    names = columns if columns is not None else column_names
+    table = pa_csv.read_csv(
+        filepath,
+        read_options=pa_csv.ReadOptions(
+            encoding=encoding, skip_rows=skip_rows, column_names=column_names,
+        ),
+        parse_options=pa_csv.ParseOptions(
+            delimiter=delimiter_for(filepath),
+            ignore_empty_lines=False,
+            newlines_in_values=True,
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=names,
+            column_types={name: pa.string() for name in names},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    return pd.DataFrame(
+        {name: _convert_text_column(table.column(name)) for name in table.column_names},
+        index=pd.RangeIndex(table.num_rows),
+    )
+
+
+def _infer_values(values: list, has_null: bool) -> pd.Series:
+    """按 TextParser 的规则推断一组文本的类型（has_null 时末尾追加一个缺失值）"""
+    from pandas.io.parsers import TextParser
+
+    rows = [[v] for v in values]
+    if has_null:
+        rows.append([""])
+    return TextParser(rows, header=None, skip_blank_lines=False).read()[0]
+
+
+def _convert_text_column(column):
+    """文本列 -> 与 TextParser 结果相同类型的数组"""
+    import pyarrow.compute as pc
+
+    encoded = column.dictionary_encode().combine_chunks()
+    uniques = encoded.dictionary.to_pylist()
+    has_null = encoded.null_count > 0
+    if not uniques:
+        # 全空列：pandas 为 float64
+        return np.full(len(column), np.nan)
+
+    # 类型推断只要遇到一个无法转换的值就是文本列，先用少量唯一值快速排除
+    sample = uniques[:_INFER_SAMPLE_SIZE]
+    if len(uniques) > len(sample) and _infer_values(sample, has_null).dtype == object:
+        return column.to_pandas()
+    converted = _infer_values(uniques, has_null)
+    if converted.dtype == object and all(isinstance(v, str) for v in converted.iloc[:len(uniques)]):
+        return column.to_pandas()
+
+    # 缺失值（编码 -1）取推断时末尾追加的缺失值
+    values = converted.to_numpy()
+    if not has_null:
+        return values[encoded.indices.to_numpy()]
+    codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False)
+    return values[codes]
+
+
+def parquet_columns(filepath: str) -> List[str]:
+    """Parquet 文件的列名"""
+    import pyarrow.parquet as pq
+    return list(pq.read_schema(filepath).names)
+
+
+def read_parquet(filepath: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    读取 Parquet 文件
+
+    保存的 pandas 索引作为普通列读出（RangeIndex 不读出），与 parquet_columns 一致。
+    """
+    import pyarrow.parquet as pq
+    return pq.read_table(filepath, columns=columns).to_pandas(ignore_metadata=True)
+
+
+def read_parquet_head(filepath: str, nrows: int) -> List[list]:
+    """Parquet 文件的前N行（第一行为列名）"""
+    import pyarrow.parquet as pq
+
+    rows = [parquet_columns(filepath)]
+    if nrows > 1:
+        batch = next(pq.ParquetFile(filepath).iter_batches(batch_size=nrows - 1), None)
+        if batch is not None:
+            rows.extend(list(record.values()) for record in batch.to_pylist())
+    return rows[:nrows]
@@ -0,0 +1,162 @@
+"""
+多文件合并加载模块 - 把多个仓库/日期的手工表合并为一个DataFrame
+
+输入为文件夹、通配符（如 "D:/日报/*.xlsx"）或文件路径列表，每个文件按Sheet
+选择规则取一个或多个Sheet，所有Sheet在进程池中并行解析（见 parallel_loader），
+按列名对齐后纵向拼接，并追加来源文件、来源Sheet两列，结果可直接交给 CompareEngine。
+"""
+import fnmatch
+import glob
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from config.settings import (
+    ARROW_STRING_DTYPE, SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN, SUPPORTED_EXCEL_FORMATS,
+)
+from .excel_utils import get_all_columns, get_sheet_names, to_arrow_strings
+from .flat_reader import CSV_EXTENSIONS, PARQUET_EXTENSIONS
+from .parallel_loader import load_tables_parallel
+
+# Sheet选择: None = 每个文件的第一个Sheet；字符串或列表 = Sheet名称（支持 * ? 通配符）
+SheetSelector = Union[None, str, Sequence[str]]
+# 进度回调: (已完成数, 总数)
+ProgressCallback = Callable[[int, int], None]
+
+Sources = Union[str, Iterable[str]]
+
+
+def expand_sources(source: Sources) -> List[str]:
+    """
+    展开数据来源为文件列表
+
+    文件夹取其中（不含子文件夹）支持格式的文件，通配符按匹配结果，均按路径排序；
+    跳过 Excel 打开文件时生成的 ~$ 临时文件。直接指定的文件路径原样保留。
+    """
+    items = [source] if isinstance(source, str) else list(source)
+    files = []
+    for item in items:
+        if os.path.isdir(item):
+            candidates = sorted(os.path.join(item, name) for name in os.listdir(item))
+        elif glob.has_magic(item):
+            candidates = sorted(glob.glob(item))
+        else:
+            files.append(item)
+            continue
+        files.extend(
+            path for path in candidates
+            if os.path.isfile(path)
+            and os.path.splitext(path)[1].lower() in SUPPORTED_EXCEL_FORMATS
+            and not os.path.basename(path).startswith("~$")
+        )
+    # 去重（保留首次出现的顺序）
+    return list(dict.fromkeys(files))
+
+
+def match_sheets(filepath: str, selector: SheetSelector = None) -> List[str]:
+    """
+    按选择规则取文件中要加载的Sheet
+
+    CSV/TSV/Parquet 只有一个Sheet，总是加载。
+    """
+    sheet_names = get_sheet_names(filepath)
+    if selector is None or filepath.lower().endswith(CSV_EXTENSIONS + PARQUET_EXTENSIONS):
+        return sheet_names[:1]
+    patterns = [selector] if isinstance(selector, str) else list(selector)
+    return [name for name in sheet_names
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def load_consolidated(source: Sources,
+                      sheet_selector: SheetSelector = None,
+                      header_row: Union[int, str] = 0,
+                      skip_rows: Optional[int] = None,
+                      usecols: Optional[List[str]] = None,
+                      progress: Optional[ProgressCallback] = None) -> pd.DataFrame:
+    """
+    加载并合并多个文件
+
+    列按名称对齐（某些文件缺少的列为缺失值），列顺序为首次出现的顺序，
+    末尾追加来源文件（文件名）和来源Sheet两列。完整列名（所有文件的并集）
+    保存在 df.attrs["all_columns"]。没有匹配Sheet的文件跳过并打印警告。
+
+    Args:
+        source: 文件夹、通配符或文件路径列表
+        sheet_selector: Sheet选择规则（见 SheetSelector）
+        header_row: 表头行索引（0开始），所有文件相同；HEADER_AUTO 时每个Sheet单独检测
+        skip_rows: 跳过行数
+        usecols: 只加载的列名（同 load_excel）
+        progress: 进度回调，每个Sheet加载完成时调用
+
+    Returns:
+        合并后的DataFrame
+    """
+    files = expand_sources(source)
+    if not files:
+        raise ValueError(f"未找到可加载的文件: {source}")
+
+    parts: List[Tuple[str, str]] = []
+    for filepath in files:
+        sheets = match_sheets(filepath, sheet_selector)
+        if not sheets:
+            print(f"[WARN] {os.path.basename(filepath)} 中没有匹配的Sheet: {sheet_selector}")
+        parts.extend((filepath, sheet) for sheet in sheets)
+    if not parts:
+        raise ValueError(f"所有文件中都没有匹配的Sheet: {sheet_selector}")
+
+    jobs: Dict[str, dict] = {}
+    for index, (filepath, sheet) in enumerate(parts):
+        jobs[str(index)] = {
+            "filepath": filepath, "sheet_name": sheet,
+            "header_row": header_row, "skip_rows": skip_rows, "usecols": usecols,
+        }
+
+    done = []
+
+    def on_progress(name: str, status: str):
+        if status == "finished":
+            done.append(name)
+            progress(len(done), len(jobs))
+
+    tables = load_tables_parallel(
+        jobs, on_progress if progress else None, max_workers=os.cpu_count() or 1
+    )
+    frames = [tables[name] for name in jobs]
+    return concat_sources(frames, parts)
+
+
+def concat_sources(frames: List[pd.DataFrame], parts: List[Tuple[str, str]]) -> pd.DataFrame:
+    """
+    按列名对齐拼接多个表，并追加来源列
+
+    Args:
+        frames: 各Sheet的DataFrame
+        parts: 与 frames 对应的 (文件路径, Sheet名称)
+    """
+    all_columns: List[str] = []
+    for df in frames:
+        all_columns.extend(get_all_columns(df))
+    all_columns = list(dict.fromkeys(all_columns))
+
+    result = pd.concat(frames, ignore_index=True, sort=False)
+    # 每个来源名称只有一个字符串对象，按行数重复引用
+    lengths = [len(df) for df in frames]
+    result[SOURCE_FILE_COLUMN] = np.repeat(
+        np.array([os.path.basename(filepath) for filepath, _ in parts], dtype=object), lengths
+    )
+    result[SOURCE_SHEET_COLUMN] = np.repeat(np.array([sheet for _, sheet in parts], dtype=object), lengths)
+
+    # 只在部分文件中存在的文本列，拼接后缺失值为 NaN，统一为 pd.NA（同 clean_dataframe）
+    for i, dtype in enumerate(result.dtypes):
+        if dtype == object:
+            col = result.iloc[:, i]
+            result.isetitem(i, col.where(col.notna(), pd.NA))
+    if ARROW_STRING_DTYPE:
+        result = to_arrow_strings(result)
+
+    result.attrs["all_columns"] = [
+        col for col in all_columns if col not in (SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN)
+    ] + [SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN]
+    return result
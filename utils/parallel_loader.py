@@ -0,0 +1,160 @@
+"""
+并行加载模块 - 在进程池中同时解析多个Excel表
+
+Excel解析是受GIL限制的CPU密集型操作，手工表和系统表在两个子进程中
+同时解析，总耗时约等于较慢的一个。子进程把结果写入会话表存储（见
+table_store），只把文件路径传回主进程，主进程以内存映射方式打开，
+数值列不再复制。表存储不可用时结果序列化为 Arrow IPC 流经管道传回。
+
+未安装 pyarrow 时子进程直接返回 DataFrame（pickle 传输）；进程池不可用时
+在当前进程中依次加载。
+"""
+import atexit
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+import pandas as pd
+
+from config.settings import PARALLEL_LOAD_ENABLED
+from .cancellation import check_cancelled
+from .excel_utils import load_excel
+from . import sheet_cache, table_store
+
+# 进度回调: (任务名, 状态)，状态为 "started" / "finished"
+ProgressCallback = Callable[[str, str], None]
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """复用进程池，避免每次加载都重新启动子进程"""
+    global _executor, _executor_workers
+    if _executor is not None and _executor_workers < workers:
+        shutdown_pool()
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    return _executor
+
+
+def shutdown_pool():
+    """关闭进程池"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _load_in_worker(kwargs: dict, store_path: Optional[str] = None):
+    """子进程：加载一个表，返回 (TableRef、Arrow IPC 缓冲区 或 DataFrame, df.attrs)"""
+    df = load_excel(**kwargs)
+    if not _has_pyarrow():
+        return df, dict(df.attrs)
+    if store_path is not None:
+        return table_store.write_table(df, store_path), dict(df.attrs)
+
+    import pyarrow as pa
+    table = sheet_cache.dataframe_to_arrow(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue(), dict(df.attrs)
+
+
+def _from_worker(payload, attrs: dict) -> pd.DataFrame:
+    """主进程：从子进程结果重建 DataFrame"""
+    if isinstance(payload, table_store.TableRef):
+        # 存储只保留到 DataFrame 释放为止
+        store = table_store.get_session_store()
+        store.adopt(payload)
+        try:
+            df = store.open(payload)
+        finally:
+            store.discard(payload)
+    elif isinstance(payload, pd.DataFrame):
+        df = payload
+    else:
+        import pyarrow as pa
+        df = sheet_cache.arrow_to_dataframe(pa.ipc.open_stream(payload).read_all())
+    df.attrs.update(attrs)
+    return df
+
+
+def _load_serial(jobs: Dict[str, dict],
+                 progress: Optional[ProgressCallback]) -> Dict[str, pd.DataFrame]:
+    results = {}
+    for name, kwargs in jobs.items():
+        check_cancelled()
+        if progress:
+            progress(name, "started")
+        results[name] = load_excel(**kwargs)
+        if progress:
+            progress(name, "finished")
+    return results
+
+
+def load_tables_parallel(jobs: Dict[str, dict],
+                         progress: Optional[ProgressCallback] = None,
+                         max_workers: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+    """
+    并行加载多个表
+
+    Args:
+        jobs: {任务名: load_excel 的关键字参数}，如
+              {"manual": {"filepath": ..., "sheet_name": ..., "usecols": [...]}, "system": {...}}
+        progress: 进度回调，每个任务开始和完成时调用
+        max_workers: 子进程数上限（None 表示每个任务一个子进程）
+
+    Returns:
+        {任务名: DataFrame}
+    """
+    workers = min(len(jobs), max_workers or len(jobs))
+    if workers <= 1 or not PARALLEL_LOAD_ENABLED:
+        return _load_serial(jobs, progress)
+
+    store = table_store.get_session_store()
+    try:
+        executor = _get_executor(workers)
+        futures = {}
+        for name, kwargs in jobs.items():
+            store_path = store.new_path() if store is not None else None
+            futures[executor.submit(_load_in_worker, kwargs, store_path)] = name
+            if progress:
+                progress(name, "started")
+    except Exception as e:
+        # 进程池无法启动（如受限环境），退回当前进程
+        print(f"[WARN] 并行加载不可用，改为依次加载: {e}")
+        shutdown_pool()
+        return _load_serial(jobs, progress)
+
+    results = {}
+    try:
+        for future in as_completed(futures):
+            name = futures[future]
+            check_cancelled()
+            results[name] = _from_worker(*future.result())
+            if progress:
+                progress(name, "finished")
+    except BrokenProcessPool as e:
+        print(f"[WARN] 并行加载进程异常退出，改为依次加载: {e}")
+        shutdown_pool()
+        pending = {name: kwargs for name, kwargs in jobs.items() if name not in results}
+        results.update(_load_serial(pending, progress))
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    return {name: results[name] for name in jobs}
@@ -0,0 +1,400 @@
+"""
+Sheet缓存模块 - 已解析Sheet的列式磁盘缓存
+
+将 load_excel 解析并清理后的 DataFrame 以 Arrow IPC (Feather v2) 格式
+保存到用户数据目录，再次打开同一文件的同一Sheet时直接读取缓存，跳过
+openpyxl 解析。缓存按总大小做 LRU 淘汰。
+
+依赖 pyarrow（可选），未安装时缓存自动禁用。
+"""
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+from config.settings import ARROW_STRING_DTYPE, SHEET_CACHE_ENABLED, SHEET_CACHE_MAX_MB
+from .storage import get_config_dir
+
+# 缓存格式版本，清理逻辑变化时递增以使旧缓存失效
+CACHE_FORMAT_VERSION = 2
+
+# schema 元数据中记录按单元格序列化的混合类型列
+MIXED_COLUMNS_KEY = b"reconciler_mixed_columns"
+
+# 自动检测的表头行（只有 schema 元数据的空表）
+HEADER_ROW_KEY = b"reconciler_header_row"
+
+CACHE_SUFFIX = ".feather"
+
+# 内容哈希的读取块大小
+_HASH_CHUNK = 1024 * 1024
+
+# 已计算的内容哈希 {绝对路径: (字节数, 修改时间(ns), 哈希)}；大小或修改时间变化时重新计算
+_hash_memo: Dict[str, Tuple[int, int, str]] = {}
+_HASH_MEMO_SIZE = 256
+
+
+def get_cache_dir() -> Path:
+    """获取Sheet缓存目录"""
+    cache_dir = get_config_dir() / "sheet_cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def is_cache_available() -> bool:
+    """缓存是否可用（已启用且安装了pyarrow）"""
+    if not SHEET_CACHE_ENABLED:
+        return False
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def file_fingerprint(filepath: str) -> Dict[str, Any]:
+    """
+    计算文件指纹
+
+    内容哈希按 (路径, 大小, 修改时间) 记住，文件未变化时不再读取整个文件
+    （一次加载中生成多个缓存键、再次加载同一文件时只哈希一次）。
+
+    Args:
+        filepath: 文件路径
+
+    Returns:
+        {"path": 绝对路径, "size": 字节数, "mtime": 修改时间(ns), "hash": 内容哈希}
+    """
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    memo = _hash_memo.get(path)
+    if memo is not None and memo[:2] == (stat.st_size, stat.st_mtime_ns):
+        content_hash = memo[2]
+    else:
+        content_hash = _hash_file(path)
+        if len(_hash_memo) >= _HASH_MEMO_SIZE:
+            _hash_memo.clear()
+        _hash_memo[path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+
+    return {
+        "path": path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "hash": content_hash,
+    }
+
+
+def _hash_file(filepath: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(filepath: str, sheet_name: str, **options) -> str:
+    """
+    生成缓存键
+
+    由文件路径、大小、修改时间、内容哈希、Sheet名以及读取参数
+    （header_row、skip_rows 等）共同决定。
+
+    Args:
+        filepath: 文件路径
+        sheet_name: Sheet名称
+        **options: 影响解析结果的读取参数
+
+    Returns:
+        缓存键（十六进制字符串）
+    """
+    payload = {
+        "version": CACHE_FORMAT_VERSION,
+        "file": file_fingerprint(filepath),
+        "sheet": sheet_name,
+        "options": options,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str) -> Path:
+    return get_cache_dir() / f"{key}{CACHE_SUFFIX}"
+
+
+def _restore_missing(df: pd.DataFrame) -> pd.DataFrame:
+    """Arrow 将对象列中的 pd.NA 读回为 None，这里还原为 clean_dataframe 的约定"""
+    for col in df.select_dtypes(include=["object"]).columns:
+        missing = df[col].isna()
+        if missing.any():
+            df[col] = df[col].mask(missing, pd.NA)
+    return df
+
+
+def _encode_mixed(values) -> list:
+    """混合类型对象列逐单元格序列化（相同值只序列化一次），缺失值为 None"""
+    memo: Dict[Any, bytes] = {}
+    encoded = []
+    for value in values:
+        if value is pd.NA or value is None:
+            encoded.append(None)
+            continue
+        try:
+            key = (type(value), value)
+            data = memo.get(key)
+            if data is None:
+                data = memo[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except TypeError:
+            # 不可哈希的值
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        encoded.append(data)
+    return encoded
+
+
+def _decode_mixed(series: pd.Series) -> np.ndarray:
+    codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+    decoded = np.empty(len(uniques) + 1, dtype=object)
+    for i, data in enumerate(uniques):
+        decoded[i] = pickle.loads(data)
+    decoded[-1] = pd.NA
+    return decoded.take(codes)
+
+
+def dataframe_to_arrow(df: pd.DataFrame):
+    """
+    DataFrame 转为 Arrow Table（保留索引）
+
+    clean_dataframe 保留了对象列中数字/日期等单元格的原始类型，这类混合
+    类型的列无法直接转为 Arrow 类型，按单元格序列化为二进制列保存，
+    列名记录在 schema 元数据中，arrow_to_dataframe 时还原。
+    """
+    import pyarrow as pa
+
+    mixed = [
+        i for i, dtype in enumerate(df.dtypes)
+        if dtype == object and infer_dtype(df.iloc[:, i], skipna=True) not in ("string", "empty")
+    ]
+    if mixed:
+        df = df.copy(deep=False)
+        for i in mixed:
+            df.isetitem(i, pd.Series(_encode_mixed(df.iloc[:, i]), index=df.index, dtype=object))
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    if mixed:
+        names = [str(df.columns[i]) for i in mixed]
+        metadata = dict(table.schema.metadata or {})
+        metadata[MIXED_COLUMNS_KEY] = json.dumps(names, ensure_ascii=False).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+    return table
+
+
+def arrow_to_dataframe(table, zero_copy: bool = False) -> pd.DataFrame:
+    """
+    Arrow Table 转回 DataFrame（与 load_excel 的结果约定一致）
+
+    zero_copy 为 True 时各列不合并为二维块，没有缺失值的数值列直接引用
+    Arrow 内存（只读数组），用于内存映射的表。
+    """
+    import pyarrow as pa
+
+    mixed = json.loads((table.schema.metadata or {}).get(MIXED_COLUMNS_KEY, b"[]"))
+    if ARROW_STRING_DTYPE:
+        # 文本列直接使用 Arrow 内存，不创建Python字符串对象
+        string_dtype = pd.StringDtype("pyarrow")
+        df = table.to_pandas(types_mapper={
+            pa.string(): string_dtype, pa.large_string(): string_dtype
+        }.get, split_blocks=zero_copy)
+    else:
+        df = table.to_pandas(split_blocks=zero_copy)
+    for i, name in enumerate(df.columns):
+        if name in mixed:
+            df.isetitem(i, _decode_mixed(df.iloc[:, i]))
+    return _restore_missing(df)
+
+
+def load_cached_sheet(key: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """
+    读取缓存的Sheet
+
+    Args:
+        key: 缓存键
+        columns: 只读取的列（列式格式可直接按列读取），None 表示全部列
+
+    Returns:
+        DataFrame，未命中、读取失败或缓存中缺少所需列时返回None
+    """
+    if not is_cache_available():
+        return None
+
+    path = _cache_path(key)
+    if not path.exists():
+        return None
+
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        read_columns = None
+        if columns is not None:
+            with pa.memory_map(str(path)) as source:
+                schema = pa.ipc.open_file(source).schema
+            if any(col not in schema.names for col in columns):
+                return None
+            # 一并读取索引列，保持与完整读取相同的索引
+            index_columns = [
+                col for col in (schema.pandas_metadata or {}).get("index_columns", [])
+                if isinstance(col, str)
+            ]
+            read_columns = list(columns) + index_columns
+        df = arrow_to_dataframe(feather.read_table(str(path), columns=read_columns))
+        # 更新访问时间（LRU）
+        os.utime(path, None)
+        return df
+    except Exception as e:
+        print(f"[WARN] 读取Sheet缓存失败，已忽略: {e}")
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+
+
+def save_cached_sheet(key: str, df: pd.DataFrame) -> bool:
+    """
+    写入Sheet缓存，并按总大小淘汰旧缓存
+
+    Args:
+        key: 缓存键
+        df: 已清理的DataFrame
+
+    Returns:
+        是否成功
+    """
+    if not is_cache_available():
+        return False
+
+    path = _cache_path(key)
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        import pyarrow.feather as feather
+        feather.write_feather(dataframe_to_arrow(df), str(tmp_path))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[WARN] 写入Sheet缓存失败，已跳过: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        return False
+
+    evict_cache(SHEET_CACHE_MAX_MB * 1024 * 1024)
+    return True
+
+
+def load_cached_header(key: str) -> Optional[int]:
+    """
+    读取缓存的表头检测结果
+
+    Args:
+        key: 缓存键（header_row="auto"）
+
+    Returns:
+        表头行索引，未命中或读取失败时返回None
+    """
+    if not is_cache_available():
+        return None
+
+    path = _cache_path(key)
+    if not path.exists():
+        return None
+
+    try:
+        import pyarrow as pa
+        with pa.memory_map(str(path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        header_row = int(metadata[HEADER_ROW_KEY])
+        os.utime(path, None)
+        return header_row
+    except Exception as e:
+        print(f"[WARN] 读取表头缓存失败，已忽略: {e}")
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+
+
+def save_cached_header(key: str, header_row: int) -> bool:
+    """
+    写入表头检测结果（与Sheet缓存一起按LRU淘汰）
+
+    Args:
+        key: 缓存键（header_row="auto"）
+        header_row: 检测到的表头行索引
+    """
+    if not is_cache_available():
+        return False
+
+    path = _cache_path(key)
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        table = pa.table({}).replace_schema_metadata({HEADER_ROW_KEY: str(header_row).encode()})
+        feather.write_feather(table, str(tmp_path))
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"[WARN] 写入表头缓存失败，已跳过: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def evict_cache(max_bytes: int) -> int:
+    """
+    按LRU淘汰缓存，直到总大小不超过上限
+
+    Args:
+        max_bytes: 缓存总大小上限（字节）
+
+    Returns:
+        删除的文件数
+    """
+    entries = []
+    for path in get_cache_dir().glob(f"*{CACHE_SUFFIX}"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    # 最久未使用的先删除
+    for _, size, path in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+
+    return removed
+
+
+def clear_sheet_cache() -> int:
+    """
+    清空全部Sheet缓存
+
+    Returns:
+        删除的文件数
+    """
+    return evict_cache(0)
@@ -0,0 +1,239 @@
+"""
+表存储模块 - 会话内以内存映射 Arrow IPC 文件共享的表
+
+已加载的表和中间结果写入会话临时目录中的 Arrow IPC 文件（不压缩），
+子进程和界面进程都通过内存映射打开，数值列直接引用映射的内存，
+进程之间不再 pickle 整张表。
+
+每个文件带引用计数：存储本身持有一个引用，每个打开的 DataFrame 持有一个，
+DataFrame 被释放时自动归还。discard 之后最后一个引用归还时删除文件；
+会话结束时（close 或进程退出）删除整个目录。上次异常退出遗留的目录在下次
+创建存储时清理。
+
+依赖 pyarrow（可选），未安装时 is_store_available() 为 False。
+"""
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import pandas as pd
+
+from config.settings import TABLE_STORE_ENABLED
+from . import sheet_cache
+
+STORE_SUFFIX = ".arrow"
+
+# schema 元数据中保存 df.attrs（如 all_columns、header_row）
+ATTRS_KEY = b"reconciler_attrs"
+
+# 超过此时间未修改的其他会话目录视为异常退出遗留
+_STALE_SECONDS = 24 * 3600
+
+
+class TableRef(NamedTuple):
+    """已写入存储的表（可传给子进程）"""
+    path: str
+    rows: int
+
+
+def is_store_available() -> bool:
+    """表存储是否可用（已启用且安装了pyarrow）"""
+    if not TABLE_STORE_ENABLED:
+        return False
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_store_root() -> Path:
+    """所有会话目录的上级目录"""
+    return Path(tempfile.gettempdir()) / "SupplyChain-Reconciler" / "table_store"
+
+
+def write_table(df: pd.DataFrame, path: str) -> TableRef:
+    """
+    把 DataFrame 写为可内存映射的 Arrow IPC 文件（子进程中也可调用）
+
+    Args:
+        df: 要保存的表
+        path: 文件路径
+
+    Returns:
+        TableRef
+    """
+    import pyarrow as pa
+
+    table = sheet_cache.dataframe_to_arrow(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[ATTRS_KEY] = json.dumps(df.attrs, ensure_ascii=False, default=str).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return TableRef(path, len(df))
+
+
+def read_table(ref: TableRef) -> pd.DataFrame:
+    """
+    以内存映射方式打开存储的表
+
+    没有缺失值的数值列直接引用映射的内存，为只读数组，修改前需先 copy()。
+    文件在返回的 DataFrame 使用期间必须保留，通常应通过 TableStore.open 打开。
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(ref.path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = sheet_cache.arrow_to_dataframe(table, zero_copy=True)
+    df.attrs.update(json.loads((table.schema.metadata or {}).get(ATTRS_KEY, b"{}")))
+    return df
+
+
+class TableStore:
+    """
+    会话表存储
+
+    Example:
+        store = get_session_store()
+        ref = store.put(result_df)
+        df = store.open(ref)          # 内存映射，数值列零复制
+        store.discard(ref)            # df 释放后删除文件
+    """
+
+    def __init__(self, directory: Optional[Path] = None):
+        if directory is None:
+            _remove_stale_sessions()
+            directory = get_store_root() / f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._refcounts: Dict[str, int] = {}
+        self._discarded = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def new_path(self) -> str:
+        """分配一个新的文件路径（子进程在其中写入后由 adopt 登记）"""
+        return str(self.directory / f"{uuid.uuid4().hex}{STORE_SUFFIX}")
+
+    def put(self, df: pd.DataFrame) -> TableRef:
+        """写入一张表"""
+        return self.adopt(write_table(df, self.new_path()))
+
+    def adopt(self, ref: TableRef) -> TableRef:
+        """登记子进程写入的文件，存储持有一个引用"""
+        with self._lock:
+            self._refcounts[ref.path] = self._refcounts.get(ref.path, 0) + 1
+        return ref
+
+    def open(self, ref: TableRef) -> pd.DataFrame:
+        """打开表，返回的 DataFrame 持有一个引用，释放时自动归还"""
+        with self._lock:
+            if ref.path not in self._refcounts:
+                raise KeyError(f"表不在存储中: {ref.path}")
+            self._refcounts[ref.path] += 1
+        try:
+            df = read_table(ref)
+        except Exception:
+            self._release(ref.path)
+            raise
+        weakref.finalize(df, self._release, ref.path)
+        return df
+
+    def discard(self, ref: TableRef):
+        """归还存储持有的引用（仍有打开的 DataFrame 时等其释放后再删除文件）"""
+        with self._lock:
+            if ref.path in self._discarded or ref.path not in self._refcounts:
+                return
+            self._discarded.add(ref.path)
+        self._release(ref.path)
+
+    def refcount(self, ref: TableRef) -> int:
+        """当前引用数（0 表示文件已删除）"""
+        with self._lock:
+            return self._refcounts.get(ref.path, 0)
+
+    def _release(self, path: str):
+        with self._lock:
+            count = self._refcounts.get(path, 0) - 1
+            if count > 0:
+                self._refcounts[path] = count
+                return
+            self._refcounts.pop(path, None)
+            self._discarded.discard(path)
+        _remove_file(path)
+
+    def close(self):
+        """结束会话，删除全部文件"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._refcounts.clear()
+            self._discarded.clear()
+        # Windows 上仍被映射的文件无法删除，留待下次启动时清理
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        # 仍被其他视图映射（Windows），会话结束时随目录删除
+        pass
+
+
+def _remove_stale_sessions():
+    root = get_store_root()
+    if not root.exists():
+        return
+    deadline = time.time() - _STALE_SECONDS
+    for entry in root.iterdir():
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < deadline:
+                shutil.rmtree(entry, ignore_errors=True)
+        except OSError:
+            pass
+
+
+_session_store: Optional[TableStore] = None
+_session_lock = threading.Lock()
+
+
+def get_session_store() -> Optional[TableStore]:
+    """当前进程的会话存储（首次调用时创建，进程退出时删除），不可用时返回 None"""
+    global _session_store
+    if not is_store_available():
+        return None
+    with _session_lock:
+        if _session_store is None:
+            try:
+                _session_store = TableStore()
+            except OSError as e:
+                print(f"[WARN] 无法创建表存储目录，已禁用: {e}")
+                return None
+        return _session_store
+
+
+def close_session_store():
+    """结束会话存储"""
+    global _session_store
+    with _session_lock:
+        store, _session_store = _session_store, None
+    if store is not None:
+        store.close()
+
+
+atexit.register(close_session_store)
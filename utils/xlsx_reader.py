@@ -0,0 +1,530 @@
+"""
+XLSX 流式读取模块 - 直接解析 xlsx 压缩包中的 Sheet XML
+
+用 ElementTree.iterparse 流式解析 sheetN.xml 和 sharedStrings.xml，
+逐行取出单元格值，不创建 openpyxl 的单元格对象。单元格取值规则与
+openpyxl 只读模式 + pandas openpyxl 引擎保持一致（数字/日期/布尔/
+错误/空单元格），输出的行数据可直接交给 pandas 的 TextParser。
+"""
+import io
+import os
+import posixpath
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+
+from .cancellation import check_cancelled
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_DOC_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+REL_OFFICE_DOCUMENT = NS_DOC_REL + "/officeDocument"
+REL_SHARED_STRINGS = NS_DOC_REL + "/sharedStrings"
+REL_STYLES = NS_DOC_REL + "/styles"
+
+ATTR_REL_ID = "{%s}id" % NS_DOC_REL
+
+# 逐行读取时每隔多少行检查一次是否已取消（见 cancellation）
+_CANCEL_CHECK_ROWS = 1024
+
+
+class XlsxFormatError(ValueError):
+    """xlsx 结构无法由流式读取器解析（调用方应回退到 openpyxl）"""
+
+
+_DIGITS = "0123456789"
+_column_cache: Dict[str, int] = {}
+
+
+def _column_index(ref: str) -> int:
+    """单元格引用的列号（1开始），如 "AB12" -> 28"""
+    letters = ref.rstrip(_DIGITS)
+    col = _column_cache.get(letters)
+    if col is None:
+        col = 0
+        for ch in letters.upper():
+            col = col * 26 + ord(ch) - 64
+        _column_cache[letters] = col
+    return col
+
+
+def _resolve_target(base_part: str, target: str) -> str:
+    """将关系中的 Target 解析为压缩包内的路径"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+
+def _rels_path(part: str) -> str:
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", name + ".rels")
+
+
+def _text_content(node, ns: str) -> str:
+    """
+    字符串节点（si / is）的纯文本
+
+    规则同 openpyxl Text.content：直接子节点 t 加上富文本 r/t，忽略注音 rPh。
+    """
+    tag_t = ns + "t"
+    tag_r = ns + "r"
+    if len(node) == 1 and node[0].tag == tag_t:
+        # 最常见的情况：只有一个 t
+        return node[0].text or ""
+    plain = ""
+    runs = []
+    for child in node:
+        if child.tag == tag_t:
+            plain = child.text or ""
+        elif child.tag == tag_r:
+            for rt in child:
+                if rt.tag == tag_t and rt.text:
+                    runs.append(rt.text)
+    return plain + "".join(runs)
+
+
+class XlsxWorkbook:
+    """
+    xlsx 工作簿的结构信息
+
+    - 工作簿部件路径、Sheet名称及对应XML路径
+    - sharedStrings 字符串表（首次使用时解码）
+    - 日期/时长格式的样式索引、日期纪元
+    """
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self.archive = archive
+        self.members = set(archive.namelist())
+        self.sheet_paths: Dict[str, str] = {}
+        self.sheet_names: List[str] = []
+        self.date1904 = False
+        self._shared_strings_path: Optional[str] = None
+        self._styles_path: Optional[str] = None
+        self._shared_strings: Optional[List[str]] = None
+        self._date_styles: Optional[Tuple[Set[int], Set[int]]] = None
+        self._read_workbook()
+
+    def _read_relationships(self, part: str) -> Dict[str, Tuple[str, str]]:
+        """读取部件的关系表 {Id: (Type, 解析后的路径)}"""
+        rels: Dict[str, Tuple[str, str]] = {}
+        rels_member = _rels_path(part) if part else "_rels/.rels"
+        if rels_member not in self.members:
+            return rels
+        with self.archive.open(rels_member) as src:
+            for _, el in iterparse(src):
+                if el.tag == NS_PKG_REL + "Relationship" and el.get("TargetMode") != "External":
+                    rels[el.get("Id", "")] = (
+                        el.get("Type", ""),
+                        _resolve_target(part, el.get("Target", "")),
+                    )
+        return rels
+
+    def _read_workbook(self):
+        root_rels = self._read_relationships("")
+        workbook_part = next(
+            (path for rel_type, path in root_rels.values() if rel_type == REL_OFFICE_DOCUMENT),
+            None,
+        )
+        if not workbook_part or workbook_part not in self.members:
+            raise XlsxFormatError("未找到工作簿部件（workbook.xml）")
+
+        rels = self._read_relationships(workbook_part)
+        for rel_type, path in rels.values():
+            if rel_type == REL_SHARED_STRINGS:
+                self._shared_strings_path = path
+            elif rel_type == REL_STYLES:
+                self._styles_path = path
+
+        sheets: List[Tuple[str, str]] = []
+        with self.archive.open(workbook_part) as src:
+            for _, el in iterparse(src):
+                if el.tag == NS_MAIN + "sheet":
+                    sheets.append((el.get("name", ""), el.get(ATTR_REL_ID, "")))
+                elif el.tag == NS_MAIN + "workbookPr":
+                    self.date1904 = el.get("date1904", "").lower() in ("1", "true")
+        if not sheets:
+            raise XlsxFormatError("工作簿中没有Sheet（可能是 Strict OOXML 格式）")
+
+        for name, rel_id in sheets:
+            rel = rels.get(rel_id)
+            if rel is None:
+                raise XlsxFormatError(f"Sheet '{name}' 缺少关系定义")
+            self.sheet_names.append(name)
+            self.sheet_paths[name] = rel[1]
+
+    @property
+    def shared_strings(self) -> List[str]:
+        """共享字符串表"""
+        if self._shared_strings is None:
+            self._shared_strings = self._read_shared_strings()
+        return self._shared_strings
+
+    def _read_shared_strings(self) -> List[str]:
+        strings: List[str] = []
+        path = self._shared_strings_path
+        if not path or path not in self.members:
+            return strings
+        tag_si = NS_MAIN + "si"
+        with self.archive.open(path) as src:
+            for _, el in iterparse(src):
+                if el.tag == tag_si:
+                    strings.append(_text_content(el, NS_MAIN).replace("x005F_", ""))
+                    el.clear()
+        return strings
+
+    @property
+    def date_styles(self) -> Tuple[Set[int], Set[int]]:
+        """(日期格式样式索引集合, 时长格式样式索引集合)"""
+        if self._date_styles is None:
+            self._date_styles = self._read_date_styles()
+        return self._date_styles
+
+    def _read_date_styles(self) -> Tuple[Set[int], Set[int]]:
+        from openpyxl.styles.numbers import (
+            BUILTIN_FORMATS, is_date_format, is_timedelta_format
+        )
+
+        date_styles: Set[int] = set()
+        timedelta_styles: Set[int] = set()
+        path = self._styles_path
+        if not path or path not in self.members:
+            return date_styles, timedelta_styles
+
+        custom: Dict[int, str] = {}
+        xf_formats: List[int] = []
+        with self.archive.open(path) as src:
+            for _, el in iterparse(src):
+                if el.tag == NS_MAIN + "numFmt":
+                    try:
+                        custom[int(el.get("numFmtId", ""))] = el.get("formatCode", "")
+                    except ValueError:
+                        pass
+                elif el.tag == NS_MAIN + "cellXfs":
+                    for xf in el.iterfind(NS_MAIN + "xf"):
+                        try:
+                            xf_formats.append(int(xf.get("numFmtId", 0)))
+                        except ValueError:
+                            xf_formats.append(0)
+
+        for idx, fmt_id in enumerate(xf_formats):
+            fmt = custom[fmt_id] if fmt_id in custom else BUILTIN_FORMATS.get(fmt_id)
+            if is_date_format(fmt):
+                date_styles.add(idx)
+            if is_timedelta_format(fmt):
+                timedelta_styles.add(idx)
+        return date_styles, timedelta_styles
+
+    def read_rows(self, sheet_name: str, max_rows: Optional[int] = None,
+                  columns: Optional[Sequence[int]] = None) -> List[list]:
+        """
+        读取Sheet的全部行
+
+        返回值与 pandas openpyxl 引擎的 get_sheet_data 一致：
+        空单元格为 ""，错误值为 NaN，每行去掉尾部空单元格，
+        去掉末尾的空行，最后把所有行补齐到相同宽度。
+
+        指定 columns 时只转换这些列的单元格，每个非空行按 columns 的顺序
+        输出 len(columns) 个值，其余列的单元格直接跳过。
+
+        Args:
+            sheet_name: Sheet名称
+            max_rows: 最多读取的行数（None 表示全部）
+            columns: 只读取的列序号（0开始），None 表示全部列
+
+        Returns:
+            行列表
+        """
+        rows: List[list] = []
+        last_row_with_data = -1
+        for values in self.iter_rows(sheet_name, columns):
+            if values:
+                last_row_with_data = len(rows)
+            rows.append(values)
+            if max_rows is not None and len(rows) >= max_rows:
+                break
+
+        data = rows[: last_row_with_data + 1]
+        if data:
+            max_width = max(len(row) for row in data)
+            if min(len(row) for row in data) < max_width:
+                data = [row + [""] * (max_width - len(row)) for row in data]
+        return data
+
+    def iter_rows(self, sheet_name: str,
+                  columns: Optional[Sequence[int]] = None) -> Iterator[list]:
+        """
+        逐行读取Sheet
+
+        每行的值同 read_rows，但不去掉末尾空行、不补齐宽度（空行为 []）。
+        已解析的行节点随即释放，内存占用与行数无关。
+        """
+        if sheet_name not in self.sheet_paths:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+        path = self.sheet_paths[sheet_name]
+        if path not in self.members:
+            raise XlsxFormatError(f"Sheet '{sheet_name}' 的XML不存在: {path}")
+
+        converter = _CellConverter(self)
+        positions = None
+        if columns is not None:
+            # 列号（1开始） -> 输出位置
+            positions = {col + 1: pos for pos, col in enumerate(columns)}
+        emitted = 0
+        row_counter = 0
+        tag_row = NS_MAIN + "row"
+        tag_sheet_data = NS_MAIN + "sheetData"
+        sheet_data = None
+
+        with self.archive.open(path) as src:
+            for event, el in iterparse(src, events=("start", "end")):
+                if event == "start":
+                    if el.tag == tag_sheet_data:
+                        sheet_data = el
+                    continue
+                if el.tag != tag_row:
+                    continue
+
+                ref = el.get("r")
+                if ref:
+                    try:
+                        row_counter = int(ref)
+                    except ValueError:
+                        row_counter = int(float(ref))
+                else:
+                    row_counter += 1
+
+                expected = emitted + 1
+                if row_counter < expected:
+                    # 行号重复或倒序，与 openpyxl 一致地丢弃
+                    values = None
+                else:
+                    if positions is None:
+                        values = converter.convert_row(el)
+                    else:
+                        values = converter.convert_row_columns(el, positions)
+                # 已处理的行节点从树中移除
+                if sheet_data is not None:
+                    sheet_data.clear()
+                else:
+                    el.clear()
+                if values is None:
+                    continue
+
+                # 缺失的行补空行
+                for _ in range(expected, row_counter):
+                    emitted += 1
+                    yield []
+                emitted += 1
+                if emitted % _CANCEL_CHECK_ROWS == 0:
+                    check_cancelled()
+                yield values
+
+
+class _CellConverter:
+    """单元格取值，规则同 openpyxl WorkSheetParser.parse_cell + pandas _convert_cell"""
+
+    def __init__(self, workbook: XlsxWorkbook):
+        from openpyxl.utils.datetime import (
+            CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+        )
+
+        self.workbook = workbook
+        self.date_styles, self.timedelta_styles = workbook.date_styles
+        self.epoch = CALENDAR_MAC_1904 if workbook.date1904 else CALENDAR_WINDOWS_1900
+        self.from_excel = from_excel
+        self.from_iso8601 = from_ISO8601
+        self.tag_v = NS_MAIN + "v"
+        self.tag_is = NS_MAIN + "is"
+
+    def convert_row(self, row_el) -> list:
+        """将 row 节点转换为值列表（已去掉尾部空单元格）"""
+        cells = []
+        col_counter = 0
+        for c in row_el:
+            ref = c.get("r")
+            if ref:
+                col_counter = _column_index(ref)
+            else:
+                col_counter += 1
+            cells.append((col_counter, self.convert_cell(c)))
+
+        if not cells:
+            return []
+        width = cells[-1][0]
+        values = [""] * width
+        for column, value in cells:
+            if 1 <= column <= width:
+                values[column - 1] = value
+        while values and isinstance(values[-1], str) and values[-1] == "":
+            values.pop()
+        return values
+
+    def convert_row_columns(self, row_el, positions: Dict[int, int]) -> list:
+        """只转换 positions 中的列，全部为空时返回空列表"""
+        values = [""] * len(positions)
+        has_data = False
+        col_counter = 0
+        for c in row_el:
+            ref = c.get("r")
+            if ref:
+                col_counter = _column_index(ref)
+            else:
+                col_counter += 1
+            pos = positions.get(col_counter)
+            if pos is None:
+                continue
+            value = self.convert_cell(c)
+            values[pos] = value
+            if not (isinstance(value, str) and value == ""):
+                has_data = True
+        return values if has_data else []
+
+    def convert_cell(self, c):
+        data_type = c.get("t", "n")
+        if data_type == "inlineStr":
+            node = c.find(self.tag_is)
+            if node is None:
+                return ""
+            return _text_content(node, NS_MAIN)
+
+        value = c.findtext(self.tag_v) or None
+        if value is None:
+            return ""
+
+        if data_type == "n":
+            if "." in value or "E" in value or "e" in value:
+                number = float(value)
+            else:
+                number = int(value)
+            style = c.get("s")
+            style = int(style) if style else 0
+            if style in self.date_styles:
+                try:
+                    return self.from_excel(
+                        number, self.epoch, timedelta=style in self.timedelta_styles
+                    )
+                except (OverflowError, ValueError):
+                    return np.nan
+            as_int = int(number)
+            return as_int if as_int == number else float(number)
+        if data_type == "s":
+            return self.workbook.shared_strings[int(value)]
+        if data_type == "b":
+            return bool(int(value))
+        if data_type == "e":
+            return np.nan
+        if data_type == "d":
+            return self.from_iso8601(value)
+        # "str"（公式字符串）及其他类型按原文返回
+        return value
+
+
+class WorkbookHandle:
+    """
+    已打开的xlsx工作簿
+
+    文件内容一次性读入内存，压缩包目录、工作簿结构和共享字符串表只解析一次，
+    各Sheet在读取时才解析。通过 get_workbook 获取，由模块级LRU复用。
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = os.path.abspath(filepath)
+        with open(self.filepath, "rb") as f:
+            data = f.read()
+        self.size = len(data)
+        try:
+            self.archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            raise XlsxFormatError(f"不是有效的xlsx文件: {e}") from e
+        try:
+            self.workbook = XlsxWorkbook(self.archive)
+        except Exception:
+            self.archive.close()
+            raise
+        # 共享字符串表和样式在首次读取Sheet时解析一次，加锁避免多线程重复解析
+        self._lock = threading.Lock()
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return list(self.workbook.sheet_names)
+
+    def read_rows(self, sheet_name: str, max_rows: Optional[int] = None,
+                  columns: Optional[Sequence[int]] = None) -> List[list]:
+        """读取Sheet的行（格式同 XlsxWorkbook.read_rows）"""
+        with self._lock:
+            self.workbook.shared_strings
+            self.workbook.date_styles
+        return self.workbook.read_rows(sheet_name, max_rows, columns)
+
+    def iter_rows(self, sheet_name: str,
+                  columns: Optional[Sequence[int]] = None) -> Iterator[list]:
+        """逐行读取Sheet（格式同 XlsxWorkbook.iter_rows）"""
+        with self._lock:
+            self.workbook.shared_strings
+            self.workbook.date_styles
+        return self.workbook.iter_rows(sheet_name, columns)
+
+    def close(self):
+        self.archive.close()
+
+
+_handles: "OrderedDict[Tuple[str, int, int], WorkbookHandle]" = OrderedDict()
+_handles_lock = threading.Lock()
+
+
+def get_workbook(filepath: str) -> WorkbookHandle:
+    """
+    获取工作簿句柄
+
+    按 (绝对路径, 大小, 修改时间) 缓存最近使用的 WORKBOOK_HANDLE_CACHE_SIZE 个
+    工作簿，文件被修改后自动重新打开。淘汰的句柄不主动关闭（可能仍在
+    其他线程中读取），内容在内存中，释放引用即可回收。
+    """
+    from config.settings import WORKBOOK_HANDLE_CACHE_SIZE
+
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _handles_lock:
+        handle = _handles.get(key)
+        if handle is not None:
+            _handles.move_to_end(key)
+            return handle
+
+    handle = WorkbookHandle(path)
+    with _handles_lock:
+        # 同一文件的旧版本不再需要
+        for old_key in [k for k in _handles if k[0] == path]:
+            del _handles[old_key]
+        _handles[key] = handle
+        while len(_handles) > max(WORKBOOK_HANDLE_CACHE_SIZE, 0):
+            _handles.popitem(last=False)
+    return handle
+
+
+def clear_workbook_cache():
+    """清空缓存的工作簿句柄"""
+    with _handles_lock:
+        _handles.clear()
+
+
+def list_sheet_names(filepath: str) -> List[str]:
+    """读取xlsx的Sheet名称列表"""
+    return get_workbook(filepath).sheet_names
+
+
+def read_sheet_rows(filepath: str, sheet_name: str, max_rows: Optional[int] = None,
+                    columns: Optional[Sequence[int]] = None) -> List[list]:
+    """读取xlsx中一个Sheet的全部行（格式同 XlsxWorkbook.read_rows）"""
+    return get_workbook(filepath).read_rows(sheet_name, max_rows, columns)
+
+
+def iter_sheet_rows(filepath: str, sheet_name: str,
+                    columns: Optional[Sequence[int]] = None) -> Iterator[list]:
+    """逐行读取xlsx中的一个Sheet（格式同 XlsxWorkbook.iter_rows）"""
+    return get_workbook(filepath).iter_rows(sheet_name, columns)